@@ -25,6 +25,67 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping": True,
 }
 
+# Download worker pool sizing
+app.config["DOWNLOAD_WORKERS"] = int(os.environ.get("DOWNLOAD_WORKERS", "4"))
+app.config["WORKER_MODE"] = os.environ.get("WORKER_MODE", "thread")  # 'process' runs yt-dlp in worker processes
+app.config["FETCH_CONCURRENCY"] = int(os.environ.get("FETCH_CONCURRENCY", app.config["DOWNLOAD_WORKERS"]))
+app.config["POSTPROCESS_CONCURRENCY"] = int(os.environ.get("POSTPROCESS_CONCURRENCY", "2"))
+app.config["TRANSCODE_WORKERS"] = int(os.environ.get("TRANSCODE_WORKERS", os.cpu_count() or 2))
+app.config["STREAM_TRANSCODE"] = os.environ.get("STREAM_TRANSCODE", "1") == "1"  # pipe audio into FFmpeg while fetching
+app.config["JOB_LEASE_SECONDS"] = int(os.environ.get("JOB_LEASE_SECONDS", "60"))
+app.config["QUEUE_POLL_INTERVAL"] = float(os.environ.get("QUEUE_POLL_INTERVAL", "2"))
+app.config["CONTROL_POLL_INTERVAL"] = float(os.environ.get("CONTROL_POLL_INTERVAL", "2"))
+
+# Pending job order: "fair" (priority, then per-owner turns) or "sjf" (also smallest first)
+app.config["SCHEDULER_POLICY"] = os.environ.get("SCHEDULER_POLICY", "fair")
+app.config["FAIR_SHARE_KEY"] = os.environ.get("FAIR_SHARE_KEY", "session")  # "session" or "ip"
+
+# Batch/playlist submissions
+app.config["MAX_BATCH_SIZE"] = int(os.environ.get("MAX_BATCH_SIZE", "500"))
+app.config["BATCH_CONCURRENCY"] = int(os.environ.get("BATCH_CONCURRENCY", "2"))
+
+# Download history pages
+app.config["PAGE_SIZE"] = int(os.environ.get("PAGE_SIZE", "50"))
+app.config["MAX_PAGE_SIZE"] = int(os.environ.get("MAX_PAGE_SIZE", "200"))
+# Delay before a change shows up in /api/downloads/changes; must exceed the longest
+# write transaction (SQLite waits up to 5 s for the write lock) and the clock skew between processes
+app.config["CHANGES_SETTLE_MS"] = int(os.environ.get("CHANGES_SETTLE_MS", "10000"))
+
+# Progress writes are buffered and flushed in batches
+app.config["PROGRESS_FLUSH_INTERVAL_MS"] = int(os.environ.get("PROGRESS_FLUSH_INTERVAL_MS", "1000"))
+app.config["PROGRESS_MIN_STEP"] = int(os.environ.get("PROGRESS_MIN_STEP", "1"))
+
+# Extracted video metadata cache
+app.config["METADATA_CACHE_TTL"] = int(os.environ.get("METADATA_CACHE_TTL", "86400"))
+app.config["METADATA_CACHE_MAX_ENTRIES"] = int(os.environ.get("METADATA_CACHE_MAX_ENTRIES", "5000"))
+app.config["FORMAT_URL_TTL"] = int(os.environ.get("FORMAT_URL_TTL", "3600"))
+
+# Aggregate download bandwidth cap in bytes/s (0 = unlimited)
+app.config["BANDWIDTH_LIMIT"] = int(os.environ.get("BANDWIDTH_LIMIT", "0"))
+
+# Retries of transient failures and per-platform circuit breaker
+app.config["MAX_ATTEMPTS"] = int(os.environ.get("MAX_ATTEMPTS", "3"))
+app.config["RETRY_BASE_SECONDS"] = float(os.environ.get("RETRY_BASE_SECONDS", "30"))
+app.config["RETRY_MAX_SECONDS"] = float(os.environ.get("RETRY_MAX_SECONDS", "1800"))
+app.config["BREAKER_THRESHOLD"] = int(os.environ.get("BREAKER_THRESHOLD", "5"))
+app.config["BREAKER_COOLDOWN"] = float(os.environ.get("BREAKER_COOLDOWN", "60"))
+
+# Per-platform limits: "platform=requests per second/max concurrent jobs", 0 = unlimited
+app.config["PLATFORM_LIMITS"] = os.environ.get("PLATFORM_LIMITS", "youtube=2/4,instagram=0.5/2")
+app.config["PLATFORM_WAIT_SECONDS"] = float(os.environ.get("PLATFORM_WAIT_SECONDS", "10"))
+
+# Streaming files to clients while they download
+app.config["STREAM_START_TIMEOUT"] = int(os.environ.get("STREAM_START_TIMEOUT", "30"))
+app.config["STREAM_IDLE_TIMEOUT"] = int(os.environ.get("STREAM_IDLE_TIMEOUT", "60"))
+app.config["MAX_FILE_STREAMS"] = int(os.environ.get("MAX_FILE_STREAMS", "8"))  # each holds a server thread
+
+# Live job events pushed to browsers (Server-Sent Events)
+app.config["EVENT_BUFFER_SIZE"] = int(os.environ.get("EVENT_BUFFER_SIZE", "1000"))  # events kept for reconnects
+app.config["EVENT_HEARTBEAT_SECONDS"] = int(os.environ.get("EVENT_HEARTBEAT_SECONDS", "15"))
+app.config["EVENT_STREAM_SECONDS"] = int(os.environ.get("EVENT_STREAM_SECONDS", "300"))  # then the browser reconnects
+app.config["EVENT_POLL_INTERVAL_MS"] = int(os.environ.get("EVENT_POLL_INTERVAL_MS", "500"))  # how often the database is read for changes
+app.config["MAX_EVENT_STREAMS"] = int(os.environ.get("MAX_EVENT_STREAMS", "16"))  # per process; more get 503 and poll the changes API
+
 # Initialize the app with the extension
 db.init_app(app)
 
@@ -40,6 +101,19 @@ with app.app_context():
     
     # Create all tables
     db.create_all()
+    
+    # Bring tables created by older versions up to date
+    from migrations import upgrade_schema, backfill_media_keys, backfill_versions
+    upgrade_schema(db)
+    backfill_media_keys(db)
+    backfill_versions(db)
+    
+    # Start draining the download queue once the schema is in place
+    routes.job_queue.recover_interrupted()
+    routes.progress.start()
+    routes.change_feed.start()
+    routes.worker_pool.start()
+    routes.transcode_pool.start()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
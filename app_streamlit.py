@@ -6,7 +6,7 @@ import threading
 import time
 from datetime import datetime
 from urllib.parse import urlparse
-import sqlite3
+import sqlite_db
 import shutil
 
 # Configuração da página
@@ -51,84 +51,67 @@ FFMPEG_PATH = find_ffmpeg()
 
 # Inicializar banco de dados
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS downloads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            url TEXT NOT NULL,
-            title TEXT,
-            platform TEXT,
-            format_type TEXT DEFAULT 'video',
-            status TEXT DEFAULT 'pending',
-            progress INTEGER DEFAULT 0,
-            filename TEXT,
-            file_size TEXT,
-            error_message TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS downloads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                title TEXT,
+                platform TEXT,
+                format_type TEXT DEFAULT 'video',
+                status TEXT DEFAULT 'pending',
+                progress INTEGER DEFAULT 0,
+                filename TEXT,
+                file_size TEXT,
+                error_message TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    sqlite_db.index_history(DB_PATH, 'downloads')
 
 # Funções do banco
 def add_download(url, platform, format_type):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO downloads (url, platform, format_type)
-        VALUES (?, ?, ?)
-    ''', (url, platform, format_type))
-    download_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute('''
+            INSERT INTO downloads (url, platform, format_type)
+            VALUES (?, ?, ?)
+        ''', (url, platform, format_type))
+        download_id = cursor.lastrowid
     return download_id
 
-def get_downloads():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM downloads ORDER BY created_at DESC')
-    downloads = cursor.fetchall()
-    conn.close()
-    return downloads
+def get_downloads(cursor=None):
+    """Página do histórico (mais recentes primeiro) e o cursor da próxima"""
+    return sqlite_db.page(DB_PATH, 'downloads', cursor=cursor)
 
 def update_download(download_id, **kwargs):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    updates = []
-    params = []
-    
-    for key, value in kwargs.items():
-        if value is not None:
-            updates.append(f"{key} = ?")
-            params.append(value)
-    
-    if updates:
-        params.append(download_id)
-        query = f"UPDATE downloads SET {', '.join(updates)} WHERE id = ?"
-        cursor.execute(query, params)
-        conn.commit()
-    
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        updates = []
+        params = []
+        
+        for key, value in kwargs.items():
+            if value is not None:
+                updates.append(f"{key} = ?")
+                params.append(value)
+        
+        if updates:
+            params.append(download_id)
+            query = f"UPDATE downloads SET {', '.join(updates)} WHERE id = ?"
+            cursor.execute(query, params)
 
 def delete_download(download_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT filename FROM downloads WHERE id = ?", (download_id,))
-    result = cursor.fetchone()
-    
-    if result and result[0]:
-        file_path = os.path.join(DOWNLOADS_DIR, result[0])
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
-    
-    cursor.execute("DELETE FROM downloads WHERE id = ?", (download_id,))
-    conn.commit()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute("SELECT filename FROM downloads WHERE id = ?", (download_id,))
+        result = cursor.fetchone()
+        
+        if result and result[0]:
+            file_path = os.path.join(DOWNLOADS_DIR, result[0])
+            if os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                except:
+                    pass
+        
+        cursor.execute("DELETE FROM downloads WHERE id = ?", (download_id,))
 
 # Validação de URL
 def is_valid_url(url):
@@ -165,11 +148,9 @@ def download_video(download_id, format_type):
     try:
         update_download(download_id, status='downloading')
         
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT url FROM downloads WHERE id = ?", (download_id,))
-        result = cursor.fetchone()
-        conn.close()
+        with sqlite_db.transaction(DB_PATH) as cursor:
+            cursor.execute("SELECT url FROM downloads WHERE id = ?", (download_id,))
+            result = cursor.fetchone()
         
         if not result:
             return
@@ -213,11 +194,9 @@ def download_video(download_id, format_type):
             }
         else:
             # Configuração especial para Instagram
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute("SELECT platform FROM downloads WHERE id = ?", (download_id,))
-            platform_result = cursor.fetchone()
-            conn.close()
+            with sqlite_db.transaction(DB_PATH) as cursor:
+                cursor.execute("SELECT platform FROM downloads WHERE id = ?", (download_id,))
+                platform_result = cursor.fetchone()
             
             platform = platform_result[0] if platform_result else 'unknown'
             
@@ -238,14 +217,13 @@ def download_video(download_id, format_type):
             
             update_download(download_id, title=title)
             
-            ydl.download([url])
+            info = ydl.process_ie_result(info, download=True)
             
-            # Encontrar arquivo baixado
+            # Caminho final informado pelo yt-dlp (após o pós-processamento)
             filename = None
-            for file in os.listdir(DOWNLOADS_DIR):
-                if file.startswith(title[:30]):
-                    filename = file
-                    break
+            for requested in info.get('requested_downloads') or []:
+                if requested.get('filepath'):
+                    filename = os.path.basename(requested['filepath'])
             
             if filename:
                 file_path = os.path.join(DOWNLOADS_DIR, filename)
@@ -289,11 +267,9 @@ with st.sidebar:
             if not platform:
                 st.error("Plataforma não suportada")
             else:
-                conn = sqlite3.connect(DB_PATH)
-                cursor = conn.cursor()
-                cursor.execute("SELECT id FROM downloads WHERE url = ? AND status != 'failed'", (url,))
-                existing = cursor.fetchone()
-                conn.close()
+                with sqlite_db.transaction(DB_PATH) as cursor:
+                    cursor.execute("SELECT id FROM downloads WHERE url = ? AND status != 'failed'", (url,))
+                    existing = cursor.fetchone()
                 
                 if existing:
                     st.warning("URL já foi baixada")
@@ -310,7 +286,10 @@ with st.sidebar:
 # Lista de downloads
 st.header("📋 Downloads")
 
-downloads = get_downloads()
+# Paginação por cursor: a pilha guarda o início de cada página já vista
+if 'history_cursors' not in st.session_state:
+    st.session_state.history_cursors = [None]
+downloads, next_cursor = get_downloads(st.session_state.history_cursors[-1])
 
 if downloads:
     for download in downloads:
@@ -367,10 +346,28 @@ if downloads:
             
             st.divider()
     
+    # Navegação entre páginas do histórico
+    page_number = len(st.session_state.history_cursors)
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if page_number > 1 and st.button("⬅️ Mais recentes"):
+            st.session_state.history_cursors.pop()
+            st.rerun()
+    with col_page:
+        st.markdown(f"Página {page_number} · {sqlite_db.count(DB_PATH, 'downloads')} downloads no total")
+    with col_next:
+        if next_cursor and st.button("Mais antigos ➡️"):
+            st.session_state.history_cursors.append(next_cursor)
+            st.rerun()
+    
     # Auto-refresh
     if any(download[5] in ['downloading', 'pending'] for download in downloads):
         time.sleep(2)
         st.rerun()
+elif len(st.session_state.history_cursors) > 1:
+    # A página ficou vazia (ex.: itens deletados); voltar para a primeira
+    st.session_state.history_cursors = [None]
+    st.rerun()
 else:
     st.info("Nenhum download encontrado")
 
@@ -0,0 +1,74 @@
+# Output policy for audio jobs: which conversion, if any, a fetched file needs
+AUDIO_FORMATS = {
+    'mp3': {
+        'ext': 'mp3',
+        'muxer': 'mp3',
+        'codecs': ('mp3',),
+        'encoder': ['-c:a', 'libmp3lame', '-b:a', '192k'],
+        'format': 'bestaudio/best',
+    },
+    'm4a': {
+        'ext': 'm4a',
+        'muxer': 'ipod',
+        'codecs': ('aac', 'mp4a'),
+        'encoder': ['-c:a', 'aac', '-b:a', '192k'],
+        'format': 'bestaudio[ext=m4a]/bestaudio/best',
+    },
+    'opus': {
+        'ext': 'opus',
+        'muxer': 'opus',
+        'codecs': ('opus',),
+        'encoder': ['-c:a', 'libopus', '-b:a', '160k'],
+        'format': 'bestaudio[acodec=opus]/bestaudio/best',
+    },
+}
+DEFAULT_AUDIO_FORMAT = 'original'
+
+# Container an audio codec is copied into when the source also carries video
+ORIGINAL_CONTAINERS = {
+    'aac': ('m4a', 'ipod'),
+    'mp4a': ('m4a', 'ipod'),
+    'opus': ('opus', 'opus'),
+    'vorbis': ('ogg', 'ogg'),
+    'mp3': ('mp3', 'mp3'),
+}
+
+
+def is_audio_format(name):
+    return name == DEFAULT_AUDIO_FORMAT or name in AUDIO_FORMATS
+
+
+def format_selector(target):
+    """yt-dlp format string that favours a source the target can be copied from"""
+    return AUDIO_FORMATS[target]['format'] if target in AUDIO_FORMATS else 'bestaudio/best'
+
+
+def _codec_family(codec):
+    # 'mp4a.40.2' -> 'mp4a', 'opus' -> 'opus', 'none'/None -> None
+    if not codec or codec == 'none':
+        return None
+    return codec.split('.')[0].lower()
+
+
+def audio_plan(target, acodec, ext, has_video):
+    """Cheapest correct way from a fetched file to the requested audio output.
+
+    Returns a dict with 'action' ('keep', 'copy' or 'encode'), the output
+    'ext' and the FFmpeg 'args' (codec and muxer options). 'keep' needs no
+    FFmpeg at all; 'copy' remuxes the audio stream without re-encoding it.
+    """
+    codec = _codec_family(acodec)
+
+    if target not in AUDIO_FORMATS:
+        # 'original': keep the stream as it was published
+        if not has_video or codec not in ORIGINAL_CONTAINERS:
+            return {'action': 'keep', 'ext': ext, 'args': []}
+        out_ext, muxer = ORIGINAL_CONTAINERS[codec]
+        return {'action': 'copy', 'ext': out_ext, 'args': ['-c:a', 'copy', '-f', muxer]}
+
+    spec = AUDIO_FORMATS[target]
+    if codec in spec['codecs']:
+        if ext == spec['ext'] and not has_video:
+            return {'action': 'keep', 'ext': ext, 'args': []}
+        return {'action': 'copy', 'ext': spec['ext'], 'args': ['-c:a', 'copy', '-f', spec['muxer']]}
+    return {'action': 'encode', 'ext': spec['ext'], 'args': spec['encoder'] + ['-f', spec['muxer']]}
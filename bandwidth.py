@@ -0,0 +1,106 @@
+import threading
+import time
+
+MAX_SLEEP = 5
+
+
+class BandwidthGovernor:
+    """Process-wide download bandwidth budget shared by all active jobs.
+
+    A global token bucket refilled at `limit` bytes/s caps the aggregate
+    throughput, and each job is additionally held to its weighted fair share
+    of that limit. Throttling happens in the yt-dlp progress hook: sleeping
+    there stalls the job's read loop, which back-pressures the connection.
+    A limit of 0 disables shaping but still measures per-job rates.
+    """
+
+    def __init__(self, limit=0, burst_seconds=1.0):
+        self.limit = limit
+        self.burst_seconds = burst_seconds
+        self._tokens = limit * burst_seconds
+        self._last_refill = time.monotonic()
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def register(self, job_id, weight=1.0, resumed_bytes=0):
+        """Add a job; a resumed one counts its partial file as already seen.
+
+        yt-dlp's downloaded_bytes includes the bytes a resumed download
+        already had on disk, which must not be charged to the budget.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._jobs[job_id] = {
+                'weight': weight,
+                'seen': resumed_bytes,
+                'bytes': 0,
+                'tokens': 0,
+                'last': now,
+                'rate': 0,
+                'window_start': now,
+                'window_bytes': 0,
+            }
+
+    def unregister(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _share(self, job):
+        """Weighted fair share of the global limit for one job (bytes/s)"""
+        total_weight = sum(j['weight'] for j in self._jobs.values())
+        return self.limit * job['weight'] / total_weight
+
+    def consume(self, job_id, downloaded_bytes):
+        """Account for a job's progress and sleep long enough to stay within budget"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return
+
+            # downloaded_bytes is cumulative per file and restarts for the next file
+            delta = downloaded_bytes - job['seen'] if downloaded_bytes >= job['seen'] else downloaded_bytes
+            job['seen'] = downloaded_bytes
+            job['bytes'] += delta
+
+            now = time.monotonic()
+            job['window_bytes'] += delta
+            if now - job['window_start'] >= 1:
+                job['rate'] = job['window_bytes'] / (now - job['window_start'])
+                job['window_start'] = now
+                job['window_bytes'] = 0
+
+            if not self.limit:
+                return
+
+            self._tokens = min(self._tokens + (now - self._last_refill) * self.limit, self.limit * self.burst_seconds)
+            self._last_refill = now
+            self._tokens -= delta
+
+            share = self._share(job)
+            job['tokens'] = min(job['tokens'] + (now - job['last']) * share, share * self.burst_seconds)
+            job['last'] = now
+            job['tokens'] -= delta
+
+            wait = max(-self._tokens / self.limit, -job['tokens'] / share, 0)
+
+        if wait:
+            time.sleep(min(wait, MAX_SLEEP))
+
+    def stats(self):
+        """Global cap and the live allocation of every active job"""
+        with self._lock:
+            jobs = {
+                job_id: {
+                    'weight': job['weight'],
+                    'share': round(self._share(job)) if self.limit else None,
+                    'rate': round(job['rate']),
+                    'bytes': job['bytes'],
+                }
+                for job_id, job in self._jobs.items()
+            }
+        return {
+            'limit': self.limit,
+            'active_jobs': len(jobs),
+            'total_rate': sum(job['rate'] for job in jobs.values()),
+            'jobs': jobs,
+        }
@@ -0,0 +1,78 @@
+import yt_dlp
+from sqlalchemy import func
+from app import db
+from models import Download
+from canonical import media_id
+
+
+def expand_playlist(url, limit):
+    """Return ([(title, url), ...], playlist title) without resolving each video.
+
+    Flat extraction only lists the entries, so a 300-item playlist costs a few
+    page requests instead of 300 full extractions. A single-video URL yields
+    itself.
+    """
+    ydl_opts = {
+        'quiet': True,
+        'extract_flat': 'in_playlist',
+        'playlistend': limit,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+
+    if info.get('_type') not in ('playlist', 'multi_video'):
+        return [(info.get('title'), info.get('webpage_url') or url)], info.get('title')
+
+    entries = []
+    for entry in info.get('entries') or []:
+        if not entry:
+            continue
+        entry_url = entry.get('webpage_url') or entry.get('url')
+        if entry_url:
+            entries.append((entry.get('title'), entry_url))
+        if len(entries) >= limit:
+            break
+    return entries, info.get('title')
+
+
+def is_single_video(url):
+    """Whether a URL points at one video (not a playlist, channel or tab)"""
+    platform, video_id = media_id(url)
+    return bool(platform and video_id)
+
+
+def batch_summary(batch):
+    """Aggregate status and progress of a batch from its child downloads"""
+    rows = db.session.execute(
+        db.select(Download.status, func.count(Download.id), func.coalesce(func.sum(Download.progress), 0))
+        .where(Download.batch_id == batch.id)
+        .group_by(Download.status)
+    ).all()
+    counts = {status: count for status, count, _ in rows}
+    total = sum(counts.values())
+    progress_sum = sum(progress for _, _, progress in rows)
+
+    # Audio children still transcoding are in flight too
+    in_flight = counts.get('pending', 0) + counts.get('downloading', 0) + counts.get('processing', 0)
+    if in_flight:
+        started = counts.get('downloading') or counts.get('processing') or counts.get('completed')
+        status = 'downloading' if started else 'pending'
+    elif total and counts.get('completed', 0) == total:
+        status = 'completed'
+    elif counts.get('paused'):
+        status = 'paused'
+    else:
+        status = 'finished_with_errors' if counts.get('failed') else 'finished'
+
+    return {
+        'id': batch.id,
+        'source_url': batch.source_url,
+        'title': batch.title,
+        'format_type': batch.format_type,
+        'max_concurrency': batch.max_concurrency,
+        'created_at': batch.created_at.isoformat() if batch.created_at else None,
+        'status': status,
+        'total': total,
+        'counts': counts,
+        'progress': round(progress_sum / total) if total else 0,
+    }
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: database commits caused by yt-dlp progress callbacks.
+
+Simulates several concurrent downloads firing progress hooks and counts
+commits with the direct (one commit per callback) path versus the
+buffered ProgressAggregator.
+
+    python bench_progress.py [jobs] [callbacks_per_second] [seconds]
+"""
+import sys
+import threading
+import time
+
+from scratch import use_scratch_database
+
+use_scratch_database('bench')
+
+from sqlalchemy import event
+from app import app, db
+from models import Download
+from downloader import VideoDownloader
+from progress import ProgressAggregator
+
+
+def run(downloader, jobs, rate, seconds, label):
+    with app.app_context():
+        ids = []
+        for i in range(jobs):
+            download = Download(url=f'https://youtu.be/bench{i}', platform='youtube', status='downloading')
+            db.session.add(download)
+            db.session.commit()
+            ids.append(download.id)
+
+        commits = [0]
+        listener = lambda conn: commits.__setitem__(0, commits[0] + 1)
+        event.listen(db.engine, 'commit', listener)
+
+    total = rate * seconds
+
+    def job(download_id):
+        for i in range(total):
+            downloader._progress_hook({
+                'status': 'downloading',
+                'downloaded_bytes': i + 1,
+                'total_bytes': total,
+            }, download_id)
+            time.sleep(1 / rate)
+
+    start = time.time()
+    threads = [threading.Thread(target=job, args=(download_id,)) for download_id in ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if downloader.progress:
+        downloader.progress.flush()
+    elapsed = time.time() - start
+
+    with app.app_context():
+        event.remove(db.engine, 'commit', listener)
+
+    callbacks = jobs * total
+    print(f"{label:<12} callbacks={callbacks:<6} commits={commits[0]:<6} "
+          f"commits/s={commits[0] / elapsed:8.1f}  elapsed={elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    rate = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    seconds = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    print(f"{jobs} jobs, {rate} progress callbacks/s each, {seconds}s\n")
+    run(VideoDownloader(), jobs, rate, seconds, 'direct')
+
+    aggregator = ProgressAggregator(app.config['PROGRESS_FLUSH_INTERVAL_MS'], app.config['PROGRESS_MIN_STEP'])
+    aggregator.start()
+    run(VideoDownloader(progress=aggregator), jobs, rate, seconds, 'aggregated')
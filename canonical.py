@@ -0,0 +1,63 @@
+import re
+from urllib.parse import urlparse, parse_qs
+
+YOUTUBE_HOSTS = ('youtube.com', 'youtube-nocookie.com')
+YOUTUBE_SHORT_HOSTS = ('youtu.be',)
+INSTAGRAM_HOSTS = ('instagram.com', 'instagr.am')
+
+YOUTUBE_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+YOUTUBE_PATH = re.compile(r'^/(?:shorts|embed|live|v|e)/([A-Za-z0-9_-]{11})')
+INSTAGRAM_PATH = re.compile(r'^/(?:[\w.]+/)?(?:p|reel|reels|tv)/([A-Za-z0-9_-]+)')
+
+
+def _host_matches(host, domains):
+    return any(host == domain or host.endswith('.' + domain) for domain in domains)
+
+
+def media_id(url):
+    """Return (platform, video id) for a YouTube or Instagram URL.
+
+    The id is None when the URL does not point at a single video (e.g. a
+    channel page); platform is None for unsupported hosts.
+    """
+    try:
+        parsed = urlparse(url.strip())
+    except ValueError:
+        return None, None
+
+    host = (parsed.hostname or '').lower()
+
+    if _host_matches(host, YOUTUBE_SHORT_HOSTS):
+        video_id = parsed.path.strip('/').split('/')[0]
+        return 'youtube', video_id if YOUTUBE_ID.match(video_id) else None
+
+    if _host_matches(host, YOUTUBE_HOSTS):
+        video_id = parse_qs(parsed.query).get('v', [''])[0]
+        if YOUTUBE_ID.match(video_id):
+            return 'youtube', video_id
+        match = YOUTUBE_PATH.match(parsed.path)
+        return 'youtube', match.group(1) if match else None
+
+    if _host_matches(host, INSTAGRAM_HOSTS):
+        match = INSTAGRAM_PATH.match(parsed.path)
+        return 'instagram', match.group(1) if match else None
+
+    return None, None
+
+
+def canonical_url(url):
+    """Single URL form for a video, dropping tracking and timestamp parameters"""
+    platform, video_id = media_id(url)
+    if platform == 'youtube' and video_id:
+        return f'https://www.youtube.com/watch?v={video_id}'
+    if platform == 'instagram' and video_id:
+        return f'https://www.instagram.com/p/{video_id}/'
+    return url.strip()
+
+
+def media_key(url, format_type, quality='best'):
+    """Deduplication key (platform:media id:format:quality), or None if the URL has no media id"""
+    platform, video_id = media_id(url)
+    if not video_id:
+        return None
+    return f'{platform}:{video_id}:{format_type}:{quality}'
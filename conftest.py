@@ -0,0 +1,31 @@
+import sys
+import pytest
+from sqlalchemy import create_engine
+from scratch import use_scratch_database
+
+# Before any test module imports the app
+use_scratch_database('import')
+
+
+@pytest.fixture(scope='module', autouse=True)
+def module_database(request, tmp_path_factory):
+    """An empty database of its own for each test module that uses the app.
+
+    The app binds its engine when it is first imported, so for the length of
+    the module that engine is swapped for one on a fresh file.
+    """
+    if 'app' not in sys.modules:
+        yield None
+        return
+
+    from app import app, db
+    path = tmp_path_factory.mktemp(request.module.__name__) / 'test.db'
+    engine = create_engine(f'sqlite:///{path}')
+    with app.app_context():
+        engines = db.engines
+        previous = engines[None]
+        engines[None] = engine
+        db.create_all()
+    yield engine
+    engines[None] = previous
+    engine.dispose()
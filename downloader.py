@@ -1,16 +1,72 @@
 import os
+import copy
+import glob
+import time
+import threading
 import yt_dlp
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from app import db, app
 from models import Download
+from canonical import canonical_url
+from job_control import JobCancelled, JobPaused
+from scheduler import bandwidth_weight, estimate_size
+from audio_formats import audio_plan
+from retry import classify
+from fetch_worker import WorkerProcess, WorkerError, ydl_options, output_path, fetched_format
 
-class VideoDownloader:
+# Streaming transcode: only plain HTTP(S) sources in containers FFmpeg can read sequentially
+STREAMABLE_PROTOCOLS = ('http', 'https')
+SEEKABLE_CONTAINERS = ('mp4', 'm4a', 'm4v', 'mov', '3gp')
+STREAM_CHUNK_SIZE = 64 * 1024
+
+class StageTimings:
+    """Wall-clock time spent per job stage (extract, download, postprocess)"""
+    
     def __init__(self):
+        self._totals = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+    
+    def record(self, stage, seconds):
+        with self._lock:
+            self._totals[stage] = self._totals.get(stage, 0) + seconds
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+    
+    def stats(self):
+        with self._lock:
+            return {
+                stage: {
+                    'count': self._counts[stage],
+                    'total_seconds': round(total, 3),
+                    'avg_seconds': round(total / self._counts[stage], 3),
+                }
+                for stage, total in self._totals.items()
+            }
+
+class VideoDownloader:
+    def __init__(self, limiter=None, progress=None, metadata=None, bandwidth=None, control=None,
+                 retry=None, breaker=None, platform_limits=None):
         self.downloads_dir = os.path.join(os.getcwd(), 'downloads')
+        self.limiter = limiter
+        self.progress = progress
+        self.metadata = metadata
+        self.bandwidth = bandwidth
+        self.control = control
+        self.retry = retry
+        self.breaker = breaker
+        self.platform_limits = platform_limits
+        self.on_fetched = None  # called when a job is queued for the transcode stage
+        self.transcoder = None  # set to stream audio straight into FFmpeg
+        self.timings = StageTimings()
+        self.resumed_bytes = 0
         
     def download_video(self, download_id, format_type=None):
         """Download video in background thread"""
+        slots = self.limiter.job_slots() if self.limiter else None
+        job = {'timings': {'postprocess': 0}, 'filepath': None, 'part_path': None, 'pp_input': None, 'platform': None}
+        if self.control:
+            self.control.clear(download_id)
         try:
             with app.app_context():
                 # Update status to downloading
@@ -21,91 +77,359 @@ class VideoDownloader:
                 # Use format_type from database if not provided
                 if format_type is None:
                     format_type = download.format_type or 'video'
+                job['platform'] = download.platform
                 
                 download.status = 'downloading'
+                download.sync_followers()
+                
+                # A previous attempt left a partial file: yt-dlp continues it
+                # with a ranged request instead of fetching from zero
+                partial = 0
+                if download.part_path and os.path.exists(download.part_path):
+                    partial = os.path.getsize(download.part_path)
+                    download.resumed_bytes = (download.resumed_bytes or 0) + partial
+                    self.resumed_bytes += partial
+                    logging.info(f"Resuming download {download_id} from {partial} bytes")
                 db.session.commit()
                 
-                # Configure yt-dlp options based on format type
-                if format_type == 'audio':
-                    ydl_opts = {
-                        'outtmpl': os.path.join(self.downloads_dir, '%(title)s.%(ext)s'),
-                        'format': 'bestaudio/best',
-                        'noplaylist': True,
-                        'extractaudio': True,
-                        'audioformat': 'mp3',
-                        'audioquality': '192',
-                        'embed_subs': False,
-                        'writesubtitles': False,
-                        'writeautomaticsub': False,
-                        'postprocessors': [{
-                            'key': 'FFmpegExtractAudio',
-                            'preferredcodec': 'mp3',
-                            'preferredquality': '192',
-                        }],
-                        'progress_hooks': [lambda d: self._progress_hook(d, download_id)],
-                    }
-                else:
-                    ydl_opts = {
-                        'outtmpl': os.path.join(self.downloads_dir, '%(title)s.%(ext)s'),
-                        'format': 'best[ext=mp4][height<=720]/best[ext=mp4]/best[height<=720]/best',  # Prefer MP4 format
-                        'noplaylist': True,
-                        'extractaudio': False,
-                        'audioformat': 'mp3',
-                        'embed_subs': False,
-                        'writesubtitles': False,
-                        'writeautomaticsub': False,
-                        'postprocessors': [],
-                        'progress_hooks': [lambda d: self._progress_hook(d, download_id)],
-                    }
+                if slots:
+                    slots.enter('fetch')
+                if self.bandwidth:
+                    # Higher priority jobs get a larger share of the bandwidth budget
+                    self.bandwidth.register(download_id, bandwidth_weight(download.priority), partial)
                 
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    # Extract info first
-                    info = ydl.extract_info(download.url, download=False)
-                    
-                    # Update download record with video info
-                    download = db.session.get(Download, download_id)
-                    if download:
-                        download.title = info.get('title', 'Unknown Title')
-                        db.session.commit()
+                # Rows queued before output formats existed were MP3 jobs
+                audio_format = download.audio_format or 'mp3'
+                file_path, fetched = self._fetch(download_id, canonical_url(download.url), format_type, audio_format, slots, job)
+                self._fetch_succeeded(job)
+                self._record_timings(download_id, job['timings'])
+                
+                if format_type == 'audio' and fetched:
+                    plan = audio_plan(
+                        audio_format,
+                        fetched['acodec'],
+                        os.path.splitext(file_path or '')[1].lstrip('.'),
+                        fetched['vcodec'] not in (None, 'none'),
+                    )
+                    if plan['action'] != 'keep':
+                        self._hand_off(download_id, file_path, fetched['duration'], fetched['acodec'])
+                        return
+                
+                # Mark as completed
+                download = db.session.get(Download, download_id)
+                if download:
+                    download.status = 'completed'
+                    download.progress = 100
+                    download.completed_at = datetime.utcnow()
                     
-                    # Download the video
-                    ydl.download([download.url])
+                    if file_path and os.path.exists(file_path):
+                        download.filename = os.path.basename(file_path)
+                        download.file_size = self._format_file_size(os.path.getsize(file_path))
                     
-                    # Mark as completed
-                    download = db.session.get(Download, download_id)
-                    if download:
-                        download.status = 'completed'
-                        download.progress = 100
-                        download.completed_at = datetime.utcnow()
-                        
-                        # Try to find the downloaded file
-                        filename = self._find_downloaded_file(info.get('title', 'Unknown Title'))
-                        if filename:
-                            download.filename = filename
-                            file_path = os.path.join(self.downloads_dir, filename)
-                            if os.path.exists(file_path):
-                                file_size = os.path.getsize(file_path)
-                                download.file_size = self._format_file_size(file_size)
-                        
-                        db.session.commit()
+                    download.part_path = None
                     
-                    logging.info(f"Download completed for ID: {download_id}")
+                    # Everyone who submitted the same media shares the file
+                    download.sync_followers()
+                    db.session.commit()
+                
+                logging.info(f"Download completed for ID: {download_id}")
                     
-        except Exception as e:
-            logging.error(f"Download failed for ID {download_id}: {str(e)}")
-            
-            # Mark as failed
+        except JobPaused:
+            # Status was set by whoever paused the job; the partial file stays for resuming
+            logging.info(f"Download paused for ID: {download_id}")
+            if self.breaker and job['platform']:
+                self.breaker.release_probe(job['platform'])
+        
+        except JobCancelled:
+            logging.info(f"Download cancelled for ID: {download_id}")
+            if self.breaker and job['platform']:
+                self.breaker.release_probe(job['platform'])
+            self.discard_partial_files(download_id, job['part_path'], [job['pp_input']])
             with app.app_context():
                 download = db.session.get(Download, download_id)
                 if download:
-                    download.status = 'failed'
-                    download.error_message = str(e)
+                    download.part_path = None
                     db.session.commit()
+        
+        except Exception as e:
+            logging.error(f"Download failed for ID {download_id}: {str(e)}")
+            self._fetch_failed(download_id, job, e)
+        finally:
+            if self.bandwidth:
+                self.bandwidth.unregister(download_id)
+            if self.progress:
+                self.progress.finish(download_id)
+            if self.control:
+                self.control.clear(download_id)
+            if slots:
+                slots.release()
+    
+    def _fetch(self, download_id, url, format_type, audio_format, slots, job):
+        """Run yt-dlp for a job in this thread.
+
+        Returns (file_path, fetched) where fetched describes the downloaded
+        format, or is None when the file was already converted while streaming.
+        """
+        ydl_opts = ydl_options(format_type, audio_format, self.downloads_dir)
+        ydl_opts['progress_hooks'] = [
+            lambda d: self._progress_hook(d, download_id),
+            lambda d: self._track_part_file(d, download_id, job),
+            lambda d: self._check_control(download_id),
+        ]
+        ydl_opts['postprocessor_hooks'] = [
+            lambda d: self._check_control(download_id),
+            lambda d: self._postprocessor_hook(d, slots, job),
+        ]
+        
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            # Resolve the page and format manifests once (or reuse cached info)
+            started = time.monotonic()
+            info, from_cache = self._extract_info(ydl, url, platform=job['platform'])
+            job['timings']['extract'] = time.monotonic() - started
+            self._record_info(download_id, info, format_type)
+            
+            # Download from the already-resolved info instead of re-extracting the URL
+            self._check_control(download_id)
+            started = time.monotonic()
+            try:
+                result = self._download(ydl, info, download_id, format_type, audio_format, job)
+            except (yt_dlp.utils.DownloadError, yt_dlp.networking.exceptions.HTTPError) as e:
+                if not from_cache:
+                    raise
+                # Cached format URLs were rejected; refresh them and retry once
+                logging.warning(f"Cached formats failed for download {download_id}, re-extracting: {str(e)}")
+                info, from_cache = self._extract_info(ydl, url, refresh=True, platform=job['platform'])
+                result = self._download(ydl, info, download_id, format_type, audio_format, job)
+            job['timings']['download'] = time.monotonic() - started - job['timings']['postprocess']
+            return result
+    
+    def _download(self, ydl, info, download_id, format_type, audio_format, job):
+        """Download from resolved info; returns (file_path, fetched) like _fetch"""
+        # Audio that can be read front to back is converted while it downloads
+        if format_type == 'audio' and self.transcoder:
+            file_path = self._stream_audio(ydl, info, download_id, audio_format)
+            if file_path:
+                return file_path, None
+        
+        info = ydl.process_ie_result(info, download=True)
+        # Final path as reported by yt-dlp, no directory scan needed
+        return output_path(ydl, info, job['filepath']), fetched_format(info)
+    
+    def _record_info(self, download_id, info, format_type):
+        """Update the download record with the extracted video info"""
+        download = db.session.get(Download, download_id)
+        if download:
+            download.title = info.get('title', 'Unknown Title')
+            if download.estimated_size is None:
+                download.estimated_size = estimate_size(info, format_type)
+            download.sync_followers()
+            db.session.commit()
+    
+    def _fetch_succeeded(self, job):
+        if self.breaker and job['platform']:
+            self.breaker.record_success(job['platform'])
+    
+    def _fetch_failed(self, download_id, job, error):
+        """Requeue a transient failure with backoff while the job has attempts left, else mark it failed"""
+        kind = getattr(error, 'kind', None) or classify(error)
+        if self.breaker and job['platform']:
+            # Only failures that say something about the host count against it
+            if kind == 'transient':
+                self.breaker.record_failure(job['platform'])
+            else:
+                self.breaker.release_probe(job['platform'])
+        
+        with app.app_context():
+            download = db.session.get(Download, download_id)
+            if not download:
+                return
+            
+            attempts = download.attempts or 0
+            download.error_message = str(error)
+            if kind == 'transient' and self.retry and self.retry.has_budget(attempts, download.max_attempts):
+                # Back to the queue; the partial file is kept so the next attempt resumes it
+                delay = self.retry.delay(max(attempts, 1))
+                download.status = 'pending'
+                download.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                download.worker_id = None
+                download.lease_expires_at = None
+                logging.warning(f"Download {download_id} attempt {attempts} failed, retrying in {delay:.0f}s")
+            else:
+                download.status = 'failed'
+            download.sync_followers()
+            db.session.commit()
+    
+    def _stream_audio(self, ydl, info, download_id, audio_format):
+        """Fetch and convert in one pass, piping the bytes into FFmpeg as they arrive.
+
+        Returns the output path, or None when the selected format needs the
+        two-phase path: fragmented protocols (DASH, HLS), separate streams to
+        merge, MP4-family containers FFmpeg may have to seek in, or a source
+        that needs no conversion at all.
+        """
+        selected = ydl.process_ie_result(copy.deepcopy(info), download=False)
+        if selected.get('requested_formats') or selected.get('protocol') not in STREAMABLE_PROTOCOLS:
+            return None
+        if selected.get('ext') in SEEKABLE_CONTAINERS:
+            return None
+        plan = audio_plan(
+            audio_format,
+            selected.get('acodec'),
+            selected.get('ext'),
+            selected.get('vcodec') not in (None, 'none'),
+        )
+        if plan['action'] == 'keep':
+            return None
+        
+        output_path = f"{os.path.splitext(ydl.prepare_filename(selected))[0]}.{plan['ext']}"
+        fetch = {'total': selected.get('filesize') or selected.get('filesize_approx')}
+        
+        def on_chunk(received):
+            # Same shaping, progress and cancel checks as a regular download
+            status = {'status': 'downloading', 'downloaded_bytes': received}
+            if fetch['total']:
+                status['total_bytes'] = fetch['total']
+            self._progress_hook(status, download_id)
+            self._check_control(download_id)
+        
+        logging.info(f"Streaming download {download_id} into FFmpeg ({plan['action']})")
+        self.transcoder.stream(download_id, self._ranged_chunks(ydl, selected, fetch), output_path, plan, on_chunk)
+        return output_path
+    
+    def _ranged_chunks(self, ydl, selected, fetch):
+        """Bytes of a format, requested the way yt-dlp's HTTP downloader does.
+
+        Formats with an http_chunk_size (YouTube throttles unranged reads) are
+        fetched in Range requests of that size. After a network error or a
+        short read the fetch resumes from the last byte received, up to the
+        'retries' option times in a row. fetch['total'] is filled in from
+        Content-Range when the info did not have the size.
+        """
+        chunk_size = (selected.get('downloader_options') or {}).get('http_chunk_size')
+        retries = ydl.params.get('retries', 10)
+        position = failures = 0
+        while True:
+            headers = dict(selected.get('http_headers') or {})
+            if chunk_size or position:
+                headers['Range'] = f"bytes={position}-{position + chunk_size - 1 if chunk_size else ''}"
+            received = 0
+            try:
+                response = ydl.urlopen(yt_dlp.networking.Request(selected['url'], headers=headers))
+                try:
+                    if 'Range' in headers and response.status != 206:
+                        if position:
+                            raise yt_dlp.utils.DownloadError('Server does not support resuming the download')
+                        chunk_size = None  # the whole file is coming in this response
+                    content_range = response.headers.get('Content-Range') or ''
+                    if content_range.rpartition('/')[2].isdigit():
+                        fetch['total'] = int(content_range.rpartition('/')[2])
+                    elif not fetch['total'] and not position:
+                        fetch['total'] = int(response.headers.get('Content-Length') or 0)
+                    while True:
+                        data = response.read(STREAM_CHUNK_SIZE)
+                        if not data:
+                            break
+                        position += len(data)
+                        received += len(data)
+                        yield data
+                finally:
+                    response.close()
+            except yt_dlp.networking.exceptions.HTTPError as e:
+                if e.status == 416 and position:
+                    return  # asked for the byte past the end
+                if e.status < 500 and e.status != 429:
+                    raise
+                failures = self._stream_retry(failures, retries, e)
+                continue
+            except (yt_dlp.networking.exceptions.TransportError, OSError) as e:
+                failures = self._stream_retry(failures, retries, e)
+                continue
+            
+            if fetch['total']:
+                if position >= fetch['total']:
+                    return
+                if not chunk_size or not received:
+                    # The connection ended early: resume where it stopped
+                    failures = self._stream_retry(failures, retries, 'connection closed early')
+                    continue
+            elif not chunk_size or received < chunk_size:
+                return
+            failures = 0
+    
+    def _stream_retry(self, failures, retries, error):
+        """Count a failed stream request and wait before retrying it; raise when out of retries"""
+        failures += 1
+        if failures > retries:
+            raise yt_dlp.utils.DownloadError(f"Giving up after {retries} retries: {error}")
+        logging.warning(f"Stream request failed ({error}), retry {failures}/{retries}")
+        time.sleep(min(failures, 5))
+        return failures
+    
+    def _hand_off(self, download_id, file_path, duration, acodec):
+        """Queue a fetched audio job for the transcode stage and free the fetch worker"""
+        if self.progress:
+            # Drop buffered fetch progress so it cannot land on the transcode progress
+            self.progress.finish(download_id)
+        download = db.session.get(Download, download_id)
+        if not download:
+            return
+        download.status = 'processing'
+        download.progress = 0
+        download.source_path = file_path
+        download.duration = duration
+        download.source_codec = acodec
+        download.part_path = None
+        download.worker_id = None
+        download.lease_expires_at = None
+        download.sync_followers()
+        db.session.commit()
+        logging.info(f"Download {download_id} fetched, queued for transcoding")
+        if self.on_fetched:
+            self.on_fetched()
+    
+    def _check_control(self, download_id):
+        """Stop the job here if it was cancelled or paused"""
+        if self.control:
+            self.control.check(download_id)
+    
+    def discard_partial_files(self, download_id, part_path, extra_paths=()):
+        """Remove temp files of a cancelled job unless another download resumes from them"""
+        paths = list(extra_paths)
+        with app.app_context():
+            in_use = part_path and Download.query.filter(
+                Download.part_path == part_path, Download.id != download_id
+            ).first()
+        if part_path and not in_use:
+            paths += [part_path, part_path + '.ytdl'] + glob.glob(glob.escape(part_path) + '-Frag*')
+        
+        for path in paths:
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    
+    def _extract_info(self, ydl, url, refresh=False, platform=None):
+        """Return (info, from_cache), going through the metadata cache when configured"""
+        before_request = lambda: self._spend_request_token(platform)
+        if self.metadata:
+            return self.metadata.extract(ydl, url, refresh=refresh, before_request=before_request)
+        before_request()
+        return ydl.extract_info(url, download=False), False
+    
+    def _spend_request_token(self, platform):
+        """Count a real extraction request against its platform's rate; cache hits make none"""
+        if self.platform_limits and platform:
+            self.platform_limits.take(platform)
     
     def _progress_hook(self, d, download_id):
         """Progress hook for yt-dlp"""
         if d['status'] == 'downloading':
             try:
+                # Shape throughput; may sleep to keep the job within its share
+                if self.bandwidth:
+                    self.bandwidth.consume(download_id, d.get('downloaded_bytes', 0))
+                
                 # Calculate progress percentage
                 if 'total_bytes' in d:
                     downloaded = d.get('downloaded_bytes', 0)
@@ -118,6 +442,11 @@ class VideoDownloader:
                 else:
                     progress = 0
                 
+                if self.progress:
+                    # Buffered and written in batches by the aggregator
+                    self.progress.report(download_id, min(progress, 99))
+                    return
+                
                 # Update progress in database
                 with app.app_context():
                     download = db.session.get(Download, download_id)
@@ -128,25 +457,179 @@ class VideoDownloader:
             except Exception as e:
                 logging.error(f"Progress update failed: {str(e)}")
     
-    def _find_downloaded_file(self, title):
-        """Find downloaded file by title"""
+    def _track_part_file(self, d, download_id, job):
+        """Remember the partial file being written so an interrupted job can resume it"""
+        part_path = d.get('tmpfilename')
+        if d['status'] != 'downloading' or not part_path or part_path == job['part_path']:
+            return
+        job['part_path'] = part_path
         try:
-            for file in os.listdir(self.downloads_dir):
-                if file.startswith(title[:50]):  # Match first 50 characters
-                    return file
-        except:
-            pass
-        return None
+            with app.app_context():
+                download = db.session.get(Download, download_id)
+                if download:
+                    download.part_path = part_path
+                    db.session.commit()
+        except Exception as e:
+            logging.error(f"Recording partial file failed: {str(e)}")
     
-    def _format_file_size(self, size_bytes):
-        """Format file size in human readable format"""
-        if size_bytes == 0:
-            return "0 B"
+    def _postprocessor_hook(self, d, slots, job):
+        """Track the output path, move FFmpeg work to its own stage and time it"""
+        if d['status'] == 'finished' and d['info_dict'].get('filepath'):
+            job['filepath'] = d['info_dict']['filepath']
         
-        size_names = ["B", "KB", "MB", "GB"]
-        i = 0
-        while size_bytes >= 1024 and i < len(size_names) - 1:
-            size_bytes /= 1024
-            i += 1
+        if not d.get('postprocessor', '').startswith('FFmpeg'):
+            return
+        if d['status'] == 'started':
+            job['pp_input'] = d['info_dict'].get('filepath')
+            if slots:
+                slots.enter('postprocess')
+            job['_pp_started'] = time.monotonic()
+        elif d['status'] == 'finished' and '_pp_started' in job:
+            job['timings']['postprocess'] += time.monotonic() - job.pop('_pp_started')
+    
+    def _record_timings(self, download_id, timings):
+        """Log per-stage timings of a job and add them to the running totals"""
+        stages = ('extract', 'download', 'postprocess')
+        for stage in stages:
+            self.timings.record(stage, timings[stage])
+        summary = ' '.join(f"{stage}={timings[stage]:.2f}s" for stage in stages)
+        logging.info(f"Download {download_id} timings: {summary}")
+    
+    def _format_file_size(self, size_bytes):
+        return format_file_size(size_bytes)
+
+
+class ProcessDownloader(VideoDownloader):
+    """Runs yt-dlp in worker processes so downloads do not compete with
+    request handling for the GIL.
+
+    Every download worker thread owns one worker process (started on first
+    use, restarted if it dies) and only relays its events: progress, partial
+    file, pause/cancel and bandwidth shaping are applied here, and this
+    process alone writes to the database. Streaming audio into FFmpeg is not
+    available in this mode; audio is always converted by the transcode stage.
+    """
+    
+    def __init__(self, *args, poll_interval=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._processes = set()
+        self._lock = threading.Lock()
+        self.restarts = 0
+    
+    def _process(self):
+        """This thread's worker process"""
+        process = getattr(self._local, 'process', None)
+        if process and process.alive():
+            return process
+        if process:
+            self._discard_process(process)
+        process = WorkerProcess()
+        self._local.process = process
+        with self._lock:
+            self._processes.add(process)
+        return process
+    
+    def _discard_process(self, process):
+        process.close()
+        with self._lock:
+            self._processes.discard(process)
+        if getattr(self._local, 'process', None) is process:
+            self._local.process = None
+    
+    def _fetch(self, download_id, url, format_type, audio_format, slots, job):
+        """Run yt-dlp for a job in this thread's worker process"""
+        info = self.metadata.lookup(url) if self.metadata else None
+        if info is not None:
+            self._record_info(download_id, info, format_type)
         
-        return f"{size_bytes:.1f} {size_names[i]}"
+        started = time.monotonic()
+        result = self._run_in_process(download_id, url, format_type, slots, job, {
+            'url': url,
+            'format_type': format_type,
+            'audio_format': audio_format,
+            'downloads_dir': self.downloads_dir,
+            'info': info,
+            'shaped': bool(self.bandwidth and self.bandwidth.limit),
+        })
+        job['timings']['extract'] = result['extract_seconds']
+        job['timings']['download'] = time.monotonic() - started - result['extract_seconds'] - job['timings']['postprocess']
+        return result['filepath'], result
+    
+    def _run_in_process(self, download_id, url, format_type, slots, job, spec):
+        """Send a job to the worker process and apply its events until it ends"""
+        process = self._process()
+        finished = False
+        try:
+            process.send(('job', spec))
+            stop = None
+            while True:
+                message = process.recv(self.poll_interval)
+                if message is None:
+                    continue
+                kind = message[0]
+                if kind == 'hook':
+                    stop = self._apply_hook(download_id, message[1], message[2], slots, job)
+                    process.send(('stop',) if stop else ('go',))
+                elif kind == 'info':
+                    self._record_info(download_id, message[1], format_type)
+                    if self.metadata:
+                        self.metadata.store(url, message[1])
+                elif kind == 'done':
+                    finished = True
+                    return message[1]
+                elif kind == 'stopped':
+                    finished = True
+                    raise stop
+                elif kind == 'error':
+                    finished = True
+                    raise WorkerError(message[1], message[2])
+        finally:
+            if not finished:
+                # The worker died or is mid-job and out of step with this thread
+                self._discard_process(process)
+                self.restarts += 1
+    
+    def _apply_hook(self, download_id, name, data, slots, job):
+        """Apply a worker hook event; returns JobPaused/JobCancelled if the job must stop"""
+        try:
+            if name == 'progress':
+                self._progress_hook(data, download_id)
+                self._track_part_file(data, download_id, job)
+                self._check_control(download_id)
+            elif name == 'postprocess':
+                self._check_control(download_id)
+                self._postprocessor_hook({
+                    'status': data['status'],
+                    'postprocessor': data['postprocessor'],
+                    'info_dict': {'filepath': data['filepath']},
+                }, slots, job)
+            elif name == 'extract':
+                # The worker is about to make an extraction request
+                self._spend_request_token(job['platform'])
+                self._check_control(download_id)
+            else:
+                self._check_control(download_id)
+        except (JobCancelled, JobPaused) as e:
+            return e
+        return None
+    
+    def stats(self):
+        with self._lock:
+            running = sum(1 for process in self._processes if process.alive())
+        return {'processes': running, 'restarts': self.restarts}
+
+
+def format_file_size(size_bytes):
+    """Format file size in human readable format"""
+    if size_bytes == 0:
+        return "0 B"
+    
+    size_names = ["B", "KB", "MB", "GB"]
+    i = 0
+    while size_bytes >= 1024 and i < len(size_names) - 1:
+        size_bytes /= 1024
+        i += 1
+    
+    return f"{size_bytes:.1f} {size_names[i]}"
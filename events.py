@@ -0,0 +1,234 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from app import db, app
+from models import Download
+from history import settled_version, latest_version
+
+# Fields an event carries, as the download row holds them
+STATUS_FIELDS = ('id', 'source_id', 'owner_key', 'status', 'progress', 'title', 'filename', 'file_size', 'error_message', 'version')
+FINISHED = ('completed', 'failed', 'cancelled')
+
+
+class EventBus:
+    """In-memory stream of job events (progress, status changes) for push clients.
+
+    Events get increasing sequence numbers and the latest buffer_size of them
+    are kept, so a client that reconnects with the id of the last event it
+    saw gets everything it missed. Ids are prefixed with a token of this
+    process: an id from before a restart or from another process, or one
+    that fell out of the buffer, cannot be replayed and the client is told
+    to reload instead.
+    """
+
+    def __init__(self, buffer_size=1000):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._events = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self.published = 0
+
+    def publish(self, kind, data):
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, kind, data))
+            self.published += 1
+            self._cond.notify_all()
+
+    def latest(self):
+        with self._cond:
+            return self._seq
+
+    def parse_id(self, event_id):
+        """Sequence number of an event id from this process, else None"""
+        epoch, _, seq = (event_id or '').partition('-')
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self._seq:
+            return None
+        return int(seq)
+
+    def wait(self, seq, timeout):
+        """Events after seq, waiting up to timeout for one; None if some were dropped"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq, timeout)
+            if self._events and self._events[0][0] > seq + 1:
+                return None
+            return [item for item in self._events if item[0] > seq]
+
+    def publish_status(self, data):
+        """Publish a download snapshot as a status or completion event"""
+        self.publish('completed' if data['status'] == 'completed' else 'status', data)
+
+    def stats(self):
+        with self._cond:
+            return {'published': self.published, 'buffered': len(self._events)}
+
+
+class ChangeFeed:
+    """Publishes the download changes every process writes to this process's bus.
+
+    A background thread polls the version index, the same cursor the
+    changes API uses, so jobs run by any worker process or instance reach
+    the clients connected here. A write can commit with a version below one
+    already read (see settled_version), so the unsettled rows are read again
+    on every poll and only versions not published yet go out.
+    """
+
+    def __init__(self, bus, poll_interval_ms=500, settle_ms=10000):
+        self.bus = bus
+        self.poll_interval = poll_interval_ms / 1000
+        self.settle_ms = settle_ms
+        self._cursor = None
+        self._published = {}
+        self._last = {}
+        self._thread = None
+        self.polls = 0
+
+    def start(self):
+        """Start the background poll thread"""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name='change-feed')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def poll(self):
+        """Publish the changes written since the last poll"""
+        with app.app_context():
+            # Fixed before the read: every write stamped up to it has committed
+            settled = settled_version(self.settle_ms)
+            if self._cursor is None:
+                self._cursor = latest_version(settled)
+            rows = db.session.execute(
+                db.select(*(getattr(Download, field) for field in STATUS_FIELDS))
+                .where(Download.version > self._cursor)
+                .order_by(Download.version, Download.id)
+            ).all()
+        changes = [dict(row._mapping) for row in rows if self._published.get(row.id, 0) < row.version]
+        # Re-pointed followers go first, so a client never sees the old
+        # leader's cancellation under a follower's id
+        changes.sort(key=lambda data: self._last.get(data['id'], (None, None, -1))[2] == data['source_id'])
+        for data in changes:
+            self._published[data['id']] = data['version']
+            self._publish(data)
+
+        self._cursor = max(self._cursor, settled)
+        self._published = {key: version for key, version in self._published.items() if version > self._cursor}
+        self.polls += 1
+
+    def _publish(self, data):
+        status, progress, _ = self._last.get(data['id'], (None, None, None))
+        if data['status'] in FINISHED:
+            self._last.pop(data['id'], None)
+        else:
+            self._last[data['id']] = (data['status'], data['progress'], data['source_id'])
+        if status == data['status'] and progress != data['progress']:
+            self.bus.publish('progress', data)
+        else:
+            self.bus.publish_status(data)
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.poll()
+            except Exception as e:
+                logging.error(f"Change feed poll failed: {str(e)}")
+
+    def stats(self):
+        return {'polls': self.polls, 'tracked_jobs': len(self._last)}
+
+
+class Subscription:
+    """The downloads one client listens to, by id or by owner.
+
+    Followers do not run anything themselves, so the events of their leader
+    are delivered under the follower's id too. Downloads the owner submits
+    after subscribing are picked up from their first status event.
+    """
+
+    def __init__(self, downloads, owner_key=None):
+        self.owner_key = owner_key
+        self._targets = {}
+        self._sources = {}
+        for download in downloads:
+            self.add(download.id, download.source_id)
+
+    def add(self, download_id, source_id=None):
+        self._targets.setdefault(download_id, set()).add(download_id)
+        self._sources[download_id] = None
+        self._repoint(download_id, source_id)
+
+    def _repoint(self, download_id, source_id):
+        previous = self._sources[download_id]
+        if previous == source_id:
+            return
+        if previous:
+            self._targets[previous].discard(download_id)
+            if not self._targets[previous]:
+                del self._targets[previous]
+        if source_id:
+            self._targets.setdefault(source_id, set()).add(download_id)
+        self._sources[download_id] = source_id
+
+    def deliver(self, kind, data):
+        """Event payloads for this client, one per matching download"""
+        if self.owner_key and data.get('owner_key') == self.owner_key and data['id'] not in self._sources:
+            self.add(data['id'], data['source_id'])
+        elif data['id'] in self._sources:
+            if data['source_id'] != self._sources[data['id']]:
+                # A follower moved to another leader or became a leader itself
+                self._repoint(data['id'], data['source_id'])
+            elif data['source_id']:
+                # A follower's own row mirrors its leader, whose events it already got
+                return []
+        payloads = []
+        for target in sorted(self._targets.get(data['id'], ())):
+            payload = dict(data, id=target)
+            payload.pop('owner_key', None)
+            payloads.append(payload)
+        return payloads
+
+
+def sse_stream(bus, subscribe, last_event_id=None, heartbeat=15, max_seconds=300):
+    """Server-Sent Events for the subscription subscribe() returns, after last_event_id.
+
+    The starting point is fixed before subscribe() reads the downloads, so no
+    event between that read and the first one sent can be lost. A comment
+    line goes out when nothing was sent for `heartbeat` seconds so proxies
+    keep the connection open. After max_seconds the stream ends and the
+    browser reconnects with the id of the last event it received.
+    """
+    seq = bus.parse_id(last_event_id)
+    # Missed events cannot be replayed: the client reloads the state
+    reset = seq is None and bool(last_event_id)
+    if seq is None:
+        seq = bus.latest()
+    return _stream(bus, subscribe(), seq, reset, heartbeat, max_seconds)
+
+
+def _stream(bus, subscription, seq, reset, heartbeat, max_seconds):
+    yield "retry: 3000\n\n"
+    if reset:
+        yield f"id: {bus.epoch}-{seq}\nevent: reset\ndata: {{}}\n\n"
+
+    deadline = time.monotonic() + max_seconds
+    last_sent = time.monotonic()
+    while time.monotonic() < deadline:
+        events = bus.wait(seq, heartbeat)
+        if events is None:
+            seq = bus.latest()
+            last_sent = time.monotonic()
+            yield f"id: {bus.epoch}-{seq}\nevent: reset\ndata: {{}}\n\n"
+            continue
+        for event_seq, kind, data in events:
+            for payload in subscription.deliver(kind, data):
+                last_sent = time.monotonic()
+                yield f"id: {bus.epoch}-{event_seq}\nevent: {kind}\ndata: {json.dumps(payload)}\n\n"
+            seq = event_seq
+        if time.monotonic() - last_sent >= heartbeat:
+            # Nothing for this client lately (other jobs' events don't count)
+            last_sent = time.monotonic()
+            yield ": keepalive\n\n"
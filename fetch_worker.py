@@ -0,0 +1,223 @@
+"""Worker process that runs yt-dlp jobs for the web process.
+
+The web process starts one of these per download worker thread and talks to
+it over a socket pair with multiprocessing.connection messages. The worker
+never touches the database: it reports hook events and results, and the
+parent applies them (progress, partial file, pause/cancel, bandwidth shaping)
+before answering each hook with 'go' or 'stop'.
+
+parent -> worker: ('job', spec), ('go',), ('stop',)
+worker -> parent: ('hook', name, data), ('info', info), ('done', result),
+                  ('error', message, kind), ('stopped',)
+hooks: 'progress', 'postprocess', 'extract' (before each extraction request),
+       'control' (before the download starts)
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+from multiprocessing.connection import Connection
+import yt_dlp
+from audio_formats import format_selector
+from retry import classify
+
+# Progress events are throttled in the worker; each one is a round trip to the parent
+PROGRESS_INTERVAL = 0.25
+# With bandwidth shaping the parent also has to see every this many bytes
+SHAPING_STEP = 256 * 1024
+
+
+class WorkerError(Exception):
+    """A job failed inside a worker process; kind is 'transient' or 'permanent'"""
+
+    def __init__(self, message, kind):
+        super().__init__(message)
+        self.kind = kind
+
+
+class Stopped(Exception):
+    """The parent answered a hook with 'stop' (job paused or cancelled)"""
+
+
+def ydl_options(format_type, audio_format, downloads_dir):
+    """yt-dlp options of a fetch; the caller adds its progress and postprocessor hooks.
+
+    File names carry the media id, and audio ones the requested format too:
+    jobs for different outputs of the same video run at the same time and
+    must not share a file. Jobs for the same output are coalesced into one.
+    """
+    if format_type == 'audio':
+        return {
+            'outtmpl': os.path.join(downloads_dir, f'%(title)s [%(id)s-{audio_format}].%(ext)s'),
+            'format': format_selector(audio_format),
+            'noplaylist': True,
+            'extractaudio': True,
+            'audioformat': 'mp3',
+            'audioquality': '192',
+            'embed_subs': False,
+            'writesubtitles': False,
+            'writeautomaticsub': False,
+            # Converted, if needed at all, by the transcode stage off the fetch slot
+            'postprocessors': [],
+            'continuedl': True,
+        }
+    return {
+        'outtmpl': os.path.join(downloads_dir, '%(title)s [%(id)s].%(ext)s'),
+        'format': 'best[ext=mp4][height<=720]/best[ext=mp4]/best[height<=720]/best',  # Prefer MP4 format
+        'noplaylist': True,
+        'extractaudio': False,
+        'audioformat': 'mp3',
+        'embed_subs': False,
+        'writesubtitles': False,
+        'writeautomaticsub': False,
+        'postprocessors': [],
+        'continuedl': True,
+    }
+
+
+def output_path(ydl, info, pp_filepath=None):
+    """Path of the finished file: last post-processor output, else what yt-dlp wrote"""
+    if pp_filepath:
+        return pp_filepath
+    for requested in info.get('requested_downloads') or []:
+        if requested.get('filepath'):
+            return requested['filepath']
+    return ydl.prepare_filename(info)
+
+
+def fetched_format(info):
+    """What the transcode stage needs to know about the downloaded file"""
+    fetched = (info.get('requested_downloads') or [info])[0]
+    return {
+        'acodec': fetched.get('acodec'),
+        'vcodec': fetched.get('vcodec'),
+        'duration': info.get('duration'),
+    }
+
+
+class WorkerProcess:
+    """Parent-side handle of one worker process"""
+
+    def __init__(self):
+        parent_sock, child_sock = socket.socketpair()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), str(child_sock.fileno())],
+            pass_fds=[child_sock.fileno()],
+        )
+        child_sock.close()
+        self.conn = Connection(parent_sock.detach())
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def send(self, message):
+        try:
+            self.conn.send(message)
+        except OSError:
+            self._exited()
+
+    def recv(self, timeout):
+        """Next message, or None if nothing arrived within timeout"""
+        try:
+            if self.conn.poll(timeout):
+                return self.conn.recv()
+        except (EOFError, OSError):
+            pass
+        else:
+            if self.alive():
+                return None
+        self._exited()
+
+    def _exited(self):
+        # A crashed worker says nothing about the job itself: worth retrying
+        raise WorkerError(f"Worker process exited with code {self.process.wait()}", 'transient')
+
+    def close(self):
+        self.conn.close()
+        if self.alive():
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def run_job(conn, spec):
+    """Download one job, asking the parent at every hook whether to go on"""
+    job = {'progress_at': 0, 'progress_bytes': 0, 'pp_filepath': None}
+
+    def ask(name, data):
+        conn.send(('hook', name, data))
+        if conn.recv()[0] == 'stop':
+            raise Stopped()
+
+    def progress_hook(d):
+        if d['status'] != 'downloading':
+            return
+        now = time.monotonic()
+        downloaded = d.get('downloaded_bytes') or 0
+        step = abs(downloaded - job['progress_bytes'])
+        if now - job['progress_at'] < PROGRESS_INTERVAL and not (spec['shaped'] and step >= SHAPING_STEP):
+            return
+        job['progress_at'] = now
+        job['progress_bytes'] = downloaded
+        keys = ('status', 'downloaded_bytes', 'total_bytes', 'total_bytes_estimate', 'tmpfilename')
+        ask('progress', {key: d[key] for key in keys if key in d})
+
+    def postprocessor_hook(d):
+        filepath = d['info_dict'].get('filepath')
+        if d['status'] == 'finished' and filepath:
+            job['pp_filepath'] = filepath
+        ask('postprocess', {'status': d['status'], 'postprocessor': d.get('postprocessor', ''), 'filepath': filepath})
+
+    ydl_opts = ydl_options(spec['format_type'], spec['audio_format'], spec['downloads_dir'])
+    ydl_opts['progress_hooks'] = [progress_hook]
+    ydl_opts['postprocessor_hooks'] = [postprocessor_hook]
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        started = time.monotonic()
+        info = spec['info']
+        if info is None:
+            ask('extract', {})
+            info = ydl.extract_info(spec['url'], download=False)
+            conn.send(('info', ydl.sanitize_info(info)))
+        extract_seconds = time.monotonic() - started
+
+        ask('control', {})
+        try:
+            info = ydl.process_ie_result(info, download=True)
+        except yt_dlp.utils.DownloadError:
+            if spec['info'] is None:
+                raise
+            # Cached format URLs were rejected; refresh them and retry once
+            ask('extract', {})
+            info = ydl.extract_info(spec['url'], download=False)
+            conn.send(('info', ydl.sanitize_info(info)))
+            info = ydl.process_ie_result(info, download=True)
+
+        result = fetched_format(info)
+        result['filepath'] = output_path(ydl, info, job['pp_filepath'])
+        result['extract_seconds'] = extract_seconds
+        return result
+
+
+def serve(conn):
+    """Run jobs until the parent closes the connection"""
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message[0] != 'job':
+            continue
+        try:
+            conn.send(('done', run_job(conn, message[1])))
+        except Stopped:
+            conn.send(('stopped',))
+        except Exception as e:
+            conn.send(('error', str(e), classify(e)))
+
+
+if __name__ == '__main__':
+    serve(Connection(int(sys.argv[1])))
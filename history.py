@@ -0,0 +1,99 @@
+import base64
+import time
+from datetime import datetime
+from sqlalchemy import func, or_
+from app import db
+from models import Download
+
+# Query args that filter the history; comma-separated values match any of them
+FILTERS = {
+    'status': Download.status,
+    'platform': Download.platform,
+    'format': Download.format_type,
+}
+
+
+def encode_cursor(download):
+    """Opaque cursor pointing just after this row in newest-first order"""
+    raw = f'{download.created_at.isoformat()}|{download.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) of a cursor; ValueError if it is malformed"""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    created_at, _, download_id = raw.partition('|')
+    return datetime.fromisoformat(created_at), int(download_id)
+
+
+def filter_conditions(args):
+    """Filter conditions for the status/platform/format query args"""
+    conditions = []
+    for name, column in FILTERS.items():
+        values = [value for value in args.get(name, '').split(',') if value]
+        if values:
+            conditions.append(column.in_(values))
+    return conditions
+
+
+def history_page(conditions, limit, cursor=None):
+    """A newest-first page of downloads after cursor: (rows, next cursor or None).
+
+    Keyset pagination on (created_at, id): each page is an index range scan
+    of `limit` rows however long the history is, unlike OFFSET.
+    """
+    query = Download.query.filter(*conditions)
+    if cursor:
+        created_at, download_id = decode_cursor(cursor)
+        # The range on created_at alone can use the index; id breaks ties
+        query = query.filter(
+            Download.created_at <= created_at,
+            or_(Download.created_at < created_at, Download.id < download_id),
+        )
+    rows = query.order_by(Download.created_at.desc(), Download.id.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(rows[limit - 1])
+    return rows, None
+
+
+def settled_version(lag_ms):
+    """Newest version no write can still commit below.
+
+    Versions are stamped in Python before the write reaches the database, so
+    a slow transaction can commit a version lower than one a client already
+    saw. Once a stamp is older than the longest write transaction (lag_ms),
+    every write stamped before it has committed or failed.
+    """
+    return time.time_ns() // 1000 - lag_ms * 1000
+
+
+def changes_since(version, limit, settled):
+    """Downloads written after a version, oldest change first: (rows, cursor, more).
+
+    One range scan of the version index, so a poll that finds nothing costs
+    next to nothing. Only settled versions are returned, so the cursor never
+    passes a write still in flight. Rows stamped by the same statement share
+    a version and are never split across pages; the cursor is the last
+    version returned. Deleted downloads are not reported.
+    """
+    rows = Download.query.filter(Download.version > version, Download.version <= settled) \
+        .order_by(Download.version, Download.id).limit(limit + 1).all()
+    more = len(rows) > limit
+    if more:
+        last = rows[limit - 1].version
+        rows = [row for row in rows if row.version < last] + \
+            Download.query.filter(Download.version == last).order_by(Download.id).all()
+    return rows, (rows[-1].version if rows else version), more
+
+
+def latest_version(settled):
+    """Version of the most recent settled write, the cursor to start polling from"""
+    latest = db.session.execute(db.select(func.max(Download.version))).scalar() or 0
+    return min(latest, settled)
+
+
+def history_count(conditions):
+    """Number of downloads matching the filters, counted in the database"""
+    return db.session.execute(
+        db.select(func.count(Download.id)).where(*conditions)
+    ).scalar()
@@ -0,0 +1,154 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from app import db, app
+from models import Download
+
+IN_FLIGHT = ('pending', 'downloading', 'processing')
+
+
+class InflightRegistry:
+    """Coalesces submissions for the same media onto a single download job.
+
+    The first submission for a media key becomes the leader job; later ones
+    get their own Download row (so every user keeps a history entry) that
+    follows the leader's progress and shares its resulting file.
+    """
+
+    def __init__(self, downloads_dir, handover_seconds=0):
+        self.downloads_dir = downloads_dir
+        self.handover_seconds = handover_seconds
+        self._lock = threading.Lock()
+
+    def _same_media(self, url, key):
+        if key:
+            return Download.query.filter_by(media_key=key)
+        return Download.query.filter_by(url=url)
+
+    def submit(self, url, key, platform, format_type, **fields):
+        """Create the Download row for a submission.
+
+        Returns (download, outcome) where outcome is 'queued' for a new job,
+        'attached' when following an in-flight job and 'reused' when an
+        existing file was linked. Extra Download columns (priority,
+        owner_key, ...) are passed as keyword arguments.
+        """
+        # Serialize check-and-create so concurrent requests in this process
+        # cannot both start a leader; duplicates created by other processes
+        # are folded in at claim time by attach_if_duplicate().
+        with self._lock:
+            result = self._add(url, key, platform, format_type, fields)
+            db.session.commit()
+            return result
+
+    def submit_many(self, submissions):
+        """Create the rows of several submissions in a single transaction.
+
+        Each submission is a dict with url, key, platform, format_type and any
+        extra Download columns; returns a (download, outcome) pair for each.
+        """
+        with self._lock:
+            results = []
+            for submission in submissions:
+                fields = dict(submission)
+                results.append(self._add(
+                    fields.pop('url'), fields.pop('key'), fields.pop('platform'), fields.pop('format_type'), fields,
+                ))
+            db.session.commit()
+            return results
+
+    def _add(self, url, key, platform, format_type, fields):
+        download = Download(url=url, media_key=key, platform=platform, format_type=format_type, **fields)
+        priority = fields.get('priority', 1)
+        outcome = 'queued'
+
+        # Autoflush makes rows added earlier in the same transaction visible here
+        leader = self._same_media(url, key) \
+            .filter(Download.source_id.is_(None), Download.status.in_(IN_FLIGHT)) \
+            .order_by(Download.id).first()
+        if leader:
+            download.source_id = leader.id
+            download.copy_state_from(leader)
+            download.title = download.title or fields.get('title')
+            # The shared job runs at the most urgent priority of its submitters
+            if (leader.priority or 0) < priority:
+                leader.priority = priority
+            outcome = 'attached'
+        else:
+            completed = self._completed_file(url, key)
+            if completed:
+                download.copy_state_from(completed)
+                outcome = 'reused'
+
+        db.session.add(download)
+        return download, outcome
+
+    def _completed_file(self, url, key):
+        """Most recent completed download of the same media whose file is still on disk"""
+        query = self._same_media(url, key).filter_by(status='completed').order_by(Download.created_at.desc())
+        for download in query.limit(5):
+            if download.filename and os.path.exists(os.path.join(self.downloads_dir, download.filename)):
+                return download
+        return None
+
+    def attach_if_duplicate(self, download_id):
+        """Make a just-claimed job follow an older in-flight job for the same media.
+
+        Returns True when the job was attached and must not be processed.
+        """
+        with app.app_context():
+            download = db.session.get(Download, download_id)
+            if not download or not download.media_key:
+                return False
+
+            leader = Download.query.filter(
+                Download.media_key == download.media_key,
+                Download.source_id.is_(None),
+                Download.id < download.id,
+                Download.status.in_(IN_FLIGHT),
+            ).order_by(Download.id).first()
+            if not leader:
+                return False
+
+            download.source_id = leader.id
+            download.copy_state_from(leader)
+            download.worker_id = None
+            download.lease_expires_at = None
+            Download.query.filter_by(source_id=download.id).update({'source_id': leader.id})
+            db.session.commit()
+            return True
+
+    def release(self, download):
+        """Detach followers from a download that is about to be deleted or cancelled.
+
+        The oldest follower of an in-flight leader becomes a new pending leader
+        so the remaining users still get their file; it takes over the partial
+        file so the download resumes instead of restarting. A running job only
+        stops at its next hook, so the new leader is not claimable for
+        handover_seconds: two writers must never append to the same file.
+        """
+        followers = Download.query.filter_by(source_id=download.id).order_by(Download.id).all()
+        if not followers:
+            return
+
+        new_leader = followers[0]
+        new_leader.source_id = None
+        new_leader.part_path = download.part_path
+        if new_leader.status in IN_FLIGHT:
+            new_leader.status = 'pending'
+            new_leader.progress = 0
+            if download.status in ('downloading', 'processing'):
+                new_leader.next_attempt_at = datetime.utcnow() + timedelta(seconds=self.handover_seconds)
+        for follower in followers[1:]:
+            follower.source_id = new_leader.id
+
+    def file_in_use(self, download, path=None):
+        """Whether another download row still points at this row's file, or at path"""
+        if path:
+            points_at = or_(Download.filename == os.path.basename(path), Download.source_path == path)
+        elif download.filename:
+            points_at = Download.filename == download.filename
+        else:
+            return False
+        return Download.query.filter(points_at, Download.id != download.id).first() is not None
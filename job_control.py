@@ -0,0 +1,42 @@
+import threading
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job when the user cancelled it"""
+
+
+class JobPaused(Exception):
+    """Raised inside a running job when the user paused it"""
+
+
+class JobControl:
+    """Cooperative cancel/pause requests for running jobs.
+
+    Requests are only flags; the engine calls check() from its progress and
+    post-processor hooks, so a job stops at the next callback and unwinds
+    through its normal cleanup (slots, temp files, status).
+    """
+
+    def __init__(self):
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def request(self, download_id, action):
+        """Ask a running job to stop; action is 'cancel' or 'pause'"""
+        with self._lock:
+            # A cancel is never downgraded to a pause
+            if self._requests.get(download_id) != 'cancel':
+                self._requests[download_id] = action
+
+    def clear(self, download_id):
+        with self._lock:
+            self._requests.pop(download_id, None)
+
+    def check(self, download_id):
+        """Raise JobCancelled/JobPaused if a stop was requested for this job"""
+        with self._lock:
+            action = self._requests.get(download_id)
+        if action == 'cancel':
+            raise JobCancelled(f'Download {download_id} was cancelled')
+        if action == 'pause':
+            raise JobPaused(f'Download {download_id} was paused')
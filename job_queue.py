@@ -0,0 +1,242 @@
+import os
+import socket
+import uuid
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_, and_, func
+from sqlalchemy.orm import aliased
+from app import db, app
+from models import Download, DownloadBatch, FETCH_QUEUE, TRANSCODE_QUEUE
+
+
+class JobQueue:
+    """Persistent download queue backed by the Download table.
+
+    A worker owns a job while it holds an unexpired lease on the row. Leases
+    are renewed by heartbeat; rows whose lease expired (e.g. the process was
+    restarted mid-download) become claimable again by any worker process.
+    """
+
+    def __init__(self, lease_seconds=60, registry=None, scheduler=None, breaker=None, platform_limits=None):
+        self.lease_seconds = lease_seconds
+        self.registry = registry
+        self.scheduler = scheduler
+        self.breaker = breaker
+        self.platform_limits = platform_limits
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def _claimable(self, now, stage='fetch', blocked=()):
+        if stage == 'transcode':
+            # Fetched jobs wait in 'processing' until a transcode worker holds their lease
+            return and_(
+                db.text(TRANSCODE_QUEUE),
+                Download.source_id.is_(None),
+                or_(Download.worker_id.is_(None), Download.lease_expires_at < now),
+            )
+        
+        # Followers are never processed themselves; they mirror their leader.
+        # The literal queue condition keeps the claim on its partial index.
+        conditions = [
+            db.text(FETCH_QUEUE),
+            Download.source_id.is_(None),
+            or_(
+                # Jobs backing off after a transient failure wait for their next attempt
+                and_(
+                    Download.status == 'pending',
+                    or_(Download.next_attempt_at.is_(None), Download.next_attempt_at <= now),
+                ),
+                # Rows left running by versions without leases have no owner at all
+                and_(
+                    Download.status == 'downloading',
+                    or_(Download.lease_expires_at.is_(None), Download.lease_expires_at < now),
+                ),
+            ),
+            self._batch_has_room(),
+        ]
+        if self.platform_limits:
+            conditions.append(self.platform_limits.has_room())
+        if blocked:
+            # Platforms behind an open circuit breaker are not dispatched to
+            conditions.append(or_(Download.platform.is_(None), Download.platform.not_in(blocked)))
+        return and_(*conditions)
+
+    def _batch_has_room(self):
+        # Batch children only start while their batch runs fewer than max_concurrency jobs
+        sibling = aliased(Download)
+        running = db.select(func.count(sibling.id)) \
+            .where(sibling.batch_id == Download.batch_id, sibling.status == 'downloading') \
+            .scalar_subquery()
+        limit = db.select(DownloadBatch.max_concurrency) \
+            .where(DownloadBatch.id == Download.batch_id) \
+            .scalar_subquery()
+        return or_(Download.batch_id.is_(None), running < limit)
+
+    def claim(self, stage='fetch'):
+        """Atomically claim the next claimable job of a stage, returning its id or None.
+
+        Jobs are taken in scheduler order when a scheduler is set, else oldest first.
+        """
+        with app.app_context():
+            now = datetime.utcnow()
+            blocked = set()
+            if stage == 'fetch':
+                # Platforms behind an open breaker or out of request tokens wait
+                if self.breaker:
+                    blocked |= self.breaker.blocked()
+                if self.platform_limits:
+                    blocked |= self.platform_limits.blocked()
+            claimable = self._claimable(now, stage, blocked)
+            if self.scheduler:
+                query = self.scheduler.candidates(claimable, limit=5)
+            else:
+                query = db.select(Download.id).where(claimable) \
+                    .order_by(Download.created_at, Download.id).limit(5)
+            candidates = db.session.execute(query).scalars().all()
+
+            values = {
+                'worker_id': self.worker_id,
+                'lease_expires_at': now + timedelta(seconds=self.lease_seconds),
+                'heartbeat_at': now,
+            }
+            if stage == 'fetch':
+                values['status'] = 'downloading'
+                values['attempts'] = func.coalesce(Download.attempts, 0) + 1
+                values['next_attempt_at'] = None
+            
+            for download_id in candidates:
+                # Compare-and-swap: only one worker can move the row out of the claimable state
+                result = db.session.execute(
+                    update(Download)
+                    .where(Download.id == download_id, claimable)
+                    .values(**values)
+                )
+                db.session.commit()
+                if result.rowcount != 1:
+                    continue
+                
+                # Another process may have queued the same media concurrently
+                if stage == 'fetch' and self.registry and self.registry.attach_if_duplicate(download_id):
+                    continue
+                if stage == 'fetch' and self.breaker:
+                    self.breaker.on_dispatch(db.session.get(Download, download_id).platform)
+                return download_id
+        return None
+
+    def heartbeat(self, download_ids):
+        """Extend the leases held by this worker; returns the ids still owned"""
+        if not download_ids:
+            return set()
+        with app.app_context():
+            now = datetime.utcnow()
+            db.session.execute(
+                update(Download)
+                .where(Download.id.in_(download_ids), Download.worker_id == self.worker_id)
+                # Lease bookkeeping is invisible to clients: keep the change stamps
+                .values(
+                    lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                    heartbeat_at=now,
+                    version=Download.version,
+                    updated_at=Download.updated_at,
+                )
+            )
+            db.session.commit()
+            owned = db.session.execute(
+                db.select(Download.id)
+                .where(Download.id.in_(download_ids), Download.worker_id == self.worker_id)
+            ).scalars().all()
+        lost = set(download_ids) - set(owned)
+        if lost:
+            logging.warning(f"Worker {self.worker_id} lost lease on downloads {sorted(lost)}")
+        return set(owned)
+
+    def stop_requests(self, download_ids):
+        """Map running jobs that must stop to 'cancel' or 'pause'.
+
+        Lets a cancel or pause issued by any process reach the worker that runs
+        the job: a cancelled or deleted row is cancelled, a paused row paused.
+        A job whose lease moved to another worker is stopped like a pause, so
+        its partial file is left for the new owner.
+        """
+        if not download_ids:
+            return {}
+        with app.app_context():
+            rows = db.session.execute(
+                db.select(Download.id, Download.status, Download.worker_id)
+                .where(Download.id.in_(download_ids))
+            ).all()
+        found = {row.id: row for row in rows}
+        
+        requests = {}
+        for download_id in download_ids:
+            row = found.get(download_id)
+            if row is None or row.status == 'cancelled':
+                requests[download_id] = 'cancel'
+            elif row.status == 'paused' or row.worker_id != self.worker_id:
+                requests[download_id] = 'pause'
+        return requests
+
+    def recover_interrupted(self):
+        """Requeue jobs left running by dead processes on this host.
+
+        Jobs owned by a process that no longer exists do not have to wait for
+        their lease to expire. Their partial files are kept so the next
+        attempt resumes where the previous one stopped.
+        """
+        host = socket.gethostname()
+        recovered = 0
+        with app.app_context():
+            running = Download.query.filter(
+                Download.status.in_(('downloading', 'processing')),
+                Download.source_id.is_(None),
+                Download.worker_id.like(f'{host}:%'),
+            ).all()
+            for download in running:
+                if download.worker_id == self.worker_id or _process_alive(download.worker_id):
+                    continue
+                
+                if download.status == 'processing':
+                    # Fetched file still there: only the conversion has to run again
+                    download.worker_id = None
+                    download.lease_expires_at = None
+                    if download.source_path and os.path.exists(download.source_path):
+                        recovered += 1
+                        logging.info(f"Recovered interrupted transcode {download.id}")
+                        continue
+                    download.source_path = None
+                
+                if download.part_path and not os.path.exists(download.part_path):
+                    download.part_path = None
+                download.status = 'pending'
+                download.worker_id = None
+                download.lease_expires_at = None
+                recovered += 1
+                
+                partial = os.path.getsize(download.part_path) if download.part_path else 0
+                logging.info(f"Recovered interrupted download {download.id} ({partial} bytes on disk)")
+            db.session.commit()
+        return recovered
+
+    def depth(self, stage='fetch'):
+        """Number of jobs of a stage waiting to be claimed"""
+        with app.app_context():
+            return db.session.execute(
+                db.select(db.func.count(Download.id)).where(self._claimable(datetime.utcnow(), stage))
+            ).scalar()
+
+
+def _process_alive(worker_id):
+    """Whether the local process named in a worker id (host:pid:token) is running"""
+    try:
+        pid = int(worker_id.split(':')[1])
+    except (IndexError, ValueError):
+        return False
+    if pid == os.getpid():
+        # Same pid but a different token: an earlier incarnation of this process
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,170 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+import yt_dlp
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from app import db, app
+from models import MediaInfo
+from canonical import media_id
+
+
+class MetadataCache:
+    """Persistent cache of extracted video info keyed by (platform, video id).
+
+    Entries expire after `ttl_seconds` and the least recently used ones are
+    evicted once more than `max_entries` are stored. Direct format URLs
+    expire much sooner than the metadata itself, so callers that need to
+    download ask for `need_urls=True` and get a fresh extraction once the
+    cached URLs are stale.
+    """
+
+    def __init__(self, ttl_seconds=86400, max_entries=5000, url_ttl_seconds=3600):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.max_entries = max_entries
+        self.url_ttl = timedelta(seconds=url_ttl_seconds)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, platform, video_id, need_urls=False):
+        """Cached info dict, or None if missing or stale"""
+        with app.app_context():
+            entry = db.session.get(MediaInfo, (platform, video_id))
+            if not entry:
+                return None
+
+            now = datetime.utcnow()
+            if entry.fetched_at + self.ttl < now:
+                return None
+            if need_urls and (entry.urls_expire_at is None or entry.urls_expire_at < now):
+                return None
+
+            entry.last_used_at = now
+            db.session.commit()
+            return json.loads(entry.info_json)
+
+    def put(self, platform, info):
+        """Store a sanitized copy of an extracted info dict"""
+        video_id = info.get('id')
+        if not platform or not video_id:
+            return
+
+        info = yt_dlp.YoutubeDL.sanitize_info(info, remove_private_keys=True)
+        now = datetime.utcnow()
+        with app.app_context():
+            entry = db.session.get(MediaInfo, (platform, video_id)) or MediaInfo(platform=platform, video_id=video_id)
+            entry.info_json = json.dumps(info)
+            entry.fetched_at = now
+            entry.last_used_at = now
+            entry.urls_expire_at = self._urls_expire_at(info, now)
+            db.session.add(entry)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Another worker stored the same video concurrently
+                db.session.rollback()
+                return
+            self._evict()
+
+    def extract(self, ydl, url, need_urls=True, refresh=False, before_request=None):
+        """Return (info, from_cache) for url, extracting only on a cache miss.
+
+        refresh=True skips the lookup, e.g. after cached format URLs were rejected.
+        before_request is called just before a real extraction, e.g. to rate limit it.
+        """
+        info = None if refresh else self.lookup(url, need_urls)
+        if info is not None:
+            return info, True
+
+        if before_request:
+            before_request()
+        info = ydl.extract_info(url, download=False)
+        self.store(url, info)
+        return info, False
+
+    def lookup(self, url, need_urls=True):
+        """Cached info for url or None, counted as a hit or a miss"""
+        platform, video_id = media_id(url)
+        info = self.get(platform, video_id, need_urls) if platform and video_id else None
+        if info is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return info
+
+    def store(self, url, info):
+        """Cache info extracted for url; failures are logged, not raised"""
+        try:
+            self.put(media_id(url)[0], info)
+        except Exception as e:
+            logging.error(f"Caching metadata for {url} failed: {str(e)}")
+
+    def _urls_expire_at(self, info, now):
+        """Earliest expiry of the format URLs (YouTube 'expire' param), capped by url_ttl"""
+        expires_at = now + self.url_ttl
+        for fmt in info.get('formats') or [info]:
+            expire = parse_qs(urlparse(fmt.get('url') or '').query).get('expire')
+            if expire and expire[0].isdigit():
+                # Leave a margin so a download does not start on an about-to-expire URL
+                expires_at = min(expires_at, datetime.utcfromtimestamp(int(expire[0])) - timedelta(minutes=5))
+        return expires_at
+
+    def _evict(self):
+        """Drop the least recently used entries beyond max_entries"""
+        count = db.session.execute(db.select(db.func.count()).select_from(MediaInfo)).scalar()
+        if count <= self.max_entries:
+            return
+        stale = db.session.execute(
+            db.select(MediaInfo.platform, MediaInfo.video_id)
+            .order_by(MediaInfo.last_used_at)
+            .limit(count - self.max_entries)
+        ).all()
+        for platform, video_id in stale:
+            db.session.execute(
+                delete(MediaInfo).where(MediaInfo.platform == platform, MediaInfo.video_id == video_id)
+            )
+        db.session.commit()
+
+    def stats(self):
+        with app.app_context():
+            entries = db.session.execute(db.select(db.func.count()).select_from(MediaInfo)).scalar()
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+def format_size(fmt, duration=None):
+    """Reported or approximate size of one format in bytes, else estimated from its bitrate"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if not size and duration and fmt.get('tbr'):
+        size = int(duration * fmt['tbr'] * 1000 / 8)
+    return size
+
+
+def summarize(info):
+    """Title, duration, formats and estimated sizes for the preview API"""
+    duration = info.get('duration')
+    formats = []
+    for fmt in info.get('formats') or []:
+        size = format_size(fmt, duration)
+        formats.append({
+            'format_id': fmt.get('format_id'),
+            'ext': fmt.get('ext'),
+            'resolution': fmt.get('resolution') or (f"{fmt['height']}p" if fmt.get('height') else None),
+            'vcodec': fmt.get('vcodec'),
+            'acodec': fmt.get('acodec'),
+            'estimated_size': size,
+        })
+
+    return {
+        'id': info.get('id'),
+        'title': info.get('title'),
+        'duration': duration,
+        'thumbnail': info.get('thumbnail'),
+        'uploader': info.get('uploader'),
+        'formats': formats,
+    }
@@ -0,0 +1,87 @@
+import logging
+from sqlalchemy import inspect, text
+
+# Indexes older versions created that the models no longer declare
+RETIRED_INDEXES = {
+    # Replaced by the followers-only ix_download_followers
+    'download': ('ix_download_source_id',),
+}
+
+
+def upgrade_schema(db):
+    """Add columns and indexes declared on the models but missing from existing tables.
+
+    `db.create_all()` only creates missing tables, so databases created by an
+    older version of the app need their new columns and indexes added in place.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                logging.info(f"Adding column {table.name}.{column.name}")
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for name in RETIRED_INDEXES.get(table.name, ()):
+                if name in existing_indexes:
+                    logging.info(f"Dropping index {name}")
+                    conn.execute(text(f'DROP INDEX {name}'))
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    logging.info(f"Creating index {index.name}")
+                    index.create(conn)
+
+
+def backfill_versions(db):
+    """Stamp rows written before Download.version existed.
+
+    Their ids are far below any microsecond stamp, so they sort before every
+    later change and show up to clients polling from version 0.
+    """
+    from models import Download
+    
+    Download.query.filter(Download.version.is_(None)).update(
+        {'version': Download.id, 'updated_at': Download.created_at}, synchronize_session=False
+    )
+    db.session.commit()
+
+
+def backfill_media_keys(db, batch_size=500):
+    """Fill Download.media_key for rows created before it existed.
+
+    Audio keys carry the output format. Audio rows from before output formats
+    existed are MP3 jobs, so they are keyed (or re-keyed, if an earlier
+    backfill gave them the format-less key) as MP3 and their files get reused.
+    """
+    from models import Download
+    from canonical import media_key
+    from sqlalchemy import and_, or_
+    
+    unkeyed = or_(
+        Download.media_key.is_(None),
+        and_(Download.format_type == 'audio', Download.media_key.like('%:audio:best')),
+    )
+    last_id = 0
+    while True:
+        rows = Download.query.filter(unkeyed, Download.id > last_id) \
+            .order_by(Download.id).limit(batch_size).all()
+        if not rows:
+            break
+        for download in rows:
+            # Rows without a media id keep NULL and fall back to exact URL matching
+            if download.format_type == 'audio':
+                download.media_key = media_key(download.url, 'audio', quality=download.audio_format or 'mp3')
+            else:
+                download.media_key = media_key(download.url, download.format_type or 'video')
+        last_id = rows[-1].id
+        db.session.commit()
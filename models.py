@@ -1,28 +1,109 @@
+import threading
+import time
 from app import db
 from datetime import datetime
 from sqlalchemy import func
 
+# Statuses each queue stage claims from: a few rows among the whole history.
+# Partial indexes cover just those rows, and the planner only matches them to
+# a query that repeats their condition with literal values, so the claims
+# filter on these same clauses.
+FETCH_QUEUE = "status IN ('pending', 'downloading')"
+TRANSCODE_QUEUE = "status = 'processing'"
+
+_version_lock = threading.Lock()
+_last_version = 0
+
+
+def next_version():
+    """Change stamp for a written row: microseconds since the epoch, strictly increasing"""
+    global _last_version
+    with _version_lock:
+        _last_version = max(time.time_ns() // 1000, _last_version + 1)
+        return _last_version
+
+
 class Download(db.Model):
+    __table_args__ = (
+        # Queue claims and status counts filter by status, oldest first
+        db.Index('ix_download_status_created_at', 'status', 'created_at'),
+        db.Index('ix_download_fetch_queue', 'created_at', 'id',
+                 sqlite_where=db.text(FETCH_QUEUE), postgresql_where=db.text(FETCH_QUEUE)),
+        db.Index('ix_download_transcode_queue', 'created_at', 'id',
+                 sqlite_where=db.text(TRANSCODE_QUEUE), postgresql_where=db.text(TRANSCODE_QUEUE)),
+        # Follower lookups by leader. Only followers are indexed, so the planner
+        # never takes `source_id IS NULL` (nearly every row) for a selective search
+        db.Index('ix_download_followers', 'source_id',
+                 sqlite_where=db.text('source_id IS NOT NULL'),
+                 postgresql_where=db.text('source_id IS NOT NULL')),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
-    url = db.Column(db.String(512), nullable=False)
+    url = db.Column(db.String(512), nullable=False, index=True)  # exact-URL matching for media without an id
+    media_key = db.Column(db.String(160), index=True)  # platform:media id:format:quality
+    source_id = db.Column(db.Integer, db.ForeignKey('download.id'))  # job this row follows
     title = db.Column(db.String(256))
     platform = db.Column(db.String(50))  # 'youtube' or 'instagram'
     format_type = db.Column(db.String(20), default='video')  # 'video' or 'audio'
-    status = db.Column(db.String(50), default='pending')  # pending, downloading, completed, failed
+    status = db.Column(db.String(50), default='pending')  # pending, downloading, processing, paused, completed, failed, cancelled
     progress = db.Column(db.Integer, default=0)  # 0-100
     filename = db.Column(db.String(256))
     file_size = db.Column(db.String(50))
     error_message = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # history is listed newest first
     completed_at = db.Column(db.DateTime)
+    worker_id = db.Column(db.String(128))  # worker process currently holding the job
+    lease_expires_at = db.Column(db.DateTime)  # job can be reclaimed once this passes
+    heartbeat_at = db.Column(db.DateTime)
+    part_path = db.Column(db.String(512))  # partial file of an unfinished download, used to resume
+    resumed_bytes = db.Column(db.BigInteger, default=0)  # bytes not refetched thanks to resuming
+    priority = db.Column(db.Integer, default=1)  # 0 low, 1 normal, 2 high
+    owner_key = db.Column(db.String(64), index=True)  # session or client the job is fair-shared by
+    estimated_size = db.Column(db.BigInteger)  # expected bytes, from cached metadata
+    batch_id = db.Column(db.Integer, db.ForeignKey('download_batch.id'), index=True)  # batch this row was submitted in
+    source_path = db.Column(db.String(512))  # fetched file waiting for the transcode stage
+    duration = db.Column(db.Float)  # media length in seconds, for transcode progress
+    audio_format = db.Column(db.String(10), default='original')  # audio output: original, mp3, m4a, opus
+    source_codec = db.Column(db.String(32))  # audio codec of the fetched file, picks copy vs encode
+    attempts = db.Column(db.Integer, default=0)  # fetch attempts made so far
+    max_attempts = db.Column(db.Integer)  # attempt budget for transient failures
+    next_attempt_at = db.Column(db.DateTime)  # backoff: not claimable before this
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Restamped by every insert and update, ORM or bulk; clients poll for rows above their last one
+    version = db.Column(db.BigInteger, default=next_version, onupdate=next_version, index=True)
     
     def __repr__(self):
         return f'<Download {self.id}: {self.title or self.url}>'
     
+    def copy_state_from(self, other):
+        """Mirror the job state of the download this row follows or reuses"""
+        self.title = other.title
+        self.status = other.status
+        self.progress = other.progress
+        self.filename = other.filename
+        self.file_size = other.file_size
+        self.error_message = other.error_message
+        self.completed_at = other.completed_at
+    
+    def sync_followers(self):
+        """Copy this job's state to the downloads following it (caller commits)"""
+        Download.query.filter_by(source_id=self.id).update({
+            'title': self.title,
+            'status': self.status,
+            'progress': self.progress,
+            'filename': self.filename,
+            'file_size': self.file_size,
+            'resumed_bytes': self.resumed_bytes or 0,
+            'error_message': self.error_message,
+            'completed_at': self.completed_at,
+        }, synchronize_session=False)
+    
     def to_dict(self):
         return {
             'id': self.id,
             'url': self.url,
+            'media_key': self.media_key,
+            'source_id': self.source_id,
             'title': self.title,
             'platform': self.platform,
             'format_type': self.format_type,
@@ -30,7 +111,44 @@ class Download(db.Model):
             'progress': self.progress,
             'filename': self.filename,
             'file_size': self.file_size,
+            'resumed_bytes': self.resumed_bytes or 0,
+            'priority': self.priority,
+            'estimated_size': self.estimated_size,
+            'batch_id': self.batch_id,
+            'audio_format': self.audio_format,
+            'attempts': self.attempts or 0,
+            'max_attempts': self.max_attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
             'error_message': self.error_message,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'version': self.version
         }
+
+
+class DownloadBatch(db.Model):
+    """A group of downloads submitted together, e.g. the entries of a playlist"""
+    id = db.Column(db.Integer, primary_key=True)
+    source_url = db.Column(db.String(512))  # playlist/channel URL, if the batch came from one
+    title = db.Column(db.String(256))
+    format_type = db.Column(db.String(20), default='video')
+    owner_key = db.Column(db.String(64))
+    max_concurrency = db.Column(db.Integer, default=2)  # children downloading at the same time
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DownloadBatch {self.id}: {self.title or self.source_url}>'
+
+
+class MediaInfo(db.Model):
+    """Cached yt-dlp info for a video, keyed by platform and video id"""
+    platform = db.Column(db.String(50), primary_key=True)
+    video_id = db.Column(db.String(64), primary_key=True)
+    info_json = db.Column(db.Text, nullable=False)  # sanitized info dict
+    fetched_at = db.Column(db.DateTime, nullable=False)
+    last_used_at = db.Column(db.DateTime, nullable=False)  # LRU eviction order
+    urls_expire_at = db.Column(db.DateTime)  # format URLs must be re-extracted after this
+    
+    def __repr__(self):
+        return f'<MediaInfo {self.platform}:{self.video_id}>'
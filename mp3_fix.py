@@ -6,7 +6,7 @@ import streamlit as st
 import yt_dlp
 import os
 import shutil
-import sqlite3
+import sqlite_db
 import threading
 import time
 from datetime import datetime
@@ -25,80 +25,63 @@ FFMPEG_PATH = os.path.dirname(shutil.which('ffmpeg')) if shutil.which('ffmpeg')
 
 # Banco
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS downloads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            url TEXT NOT NULL,
-            title TEXT,
-            platform TEXT,
-            format_type TEXT DEFAULT 'video',
-            status TEXT DEFAULT 'pending',
-            progress INTEGER DEFAULT 0,
-            filename TEXT,
-            file_size TEXT,
-            error_message TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS downloads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                title TEXT,
+                platform TEXT,
+                format_type TEXT DEFAULT 'video',
+                status TEXT DEFAULT 'pending',
+                progress INTEGER DEFAULT 0,
+                filename TEXT,
+                file_size TEXT,
+                error_message TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    sqlite_db.index_history(DB_PATH, 'downloads')
 
 def add_download(url, platform, format_type):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO downloads (url, platform, format_type) VALUES (?, ?, ?)', (url, platform, format_type))
-    download_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute('INSERT INTO downloads (url, platform, format_type) VALUES (?, ?, ?)', (url, platform, format_type))
+        download_id = cursor.lastrowid
     return download_id
 
-def get_downloads():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM downloads ORDER BY created_at DESC')
-    downloads = cursor.fetchall()
-    conn.close()
-    return downloads
+def get_downloads(cursor=None):
+    """Página do histórico (mais recentes primeiro) e o cursor da próxima"""
+    return sqlite_db.page(DB_PATH, 'downloads', cursor=cursor)
 
 def update_download(download_id, **kwargs):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    updates = []
-    params = []
-    
-    for key, value in kwargs.items():
-        if value is not None:
-            updates.append(f"{key} = ?")
-            params.append(value)
-    
-    if updates:
-        params.append(download_id)
-        query = f"UPDATE downloads SET {', '.join(updates)} WHERE id = ?"
-        cursor.execute(query, params)
-        conn.commit()
-    
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        updates = []
+        params = []
+        
+        for key, value in kwargs.items():
+            if value is not None:
+                updates.append(f"{key} = ?")
+                params.append(value)
+        
+        if updates:
+            params.append(download_id)
+            query = f"UPDATE downloads SET {', '.join(updates)} WHERE id = ?"
+            cursor.execute(query, params)
 
 def delete_download(download_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT filename FROM downloads WHERE id = ?", (download_id,))
-    result = cursor.fetchone()
-    
-    if result and result[0]:
-        file_path = os.path.join(DOWNLOADS_DIR, result[0])
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
-    
-    cursor.execute("DELETE FROM downloads WHERE id = ?", (download_id,))
-    conn.commit()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute("SELECT filename FROM downloads WHERE id = ?", (download_id,))
+        result = cursor.fetchone()
+        
+        if result and result[0]:
+            file_path = os.path.join(DOWNLOADS_DIR, result[0])
+            if os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                except:
+                    pass
+        
+        cursor.execute("DELETE FROM downloads WHERE id = ?", (download_id,))
 
 # Validação
 def is_valid_url(url):
@@ -136,11 +119,9 @@ def download_video_fixed(download_id, format_type):
     try:
         update_download(download_id, status='downloading')
         
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT url, platform FROM downloads WHERE id = ?", (download_id,))
-        result = cursor.fetchone()
-        conn.close()
+        with sqlite_db.transaction(DB_PATH) as cursor:
+            cursor.execute("SELECT url, platform FROM downloads WHERE id = ?", (download_id,))
+            result = cursor.fetchone()
         
         if not result:
             return
@@ -194,30 +175,16 @@ def download_video_fixed(download_id, format_type):
             info = ydl.extract_info(url, download=False)
             title = info.get('title', 'Video')
             
-            # Armazenar arquivos antes do download
-            files_before = set(os.listdir(DOWNLOADS_DIR))
-            
             update_download(download_id, title=title)
             
             # Fazer download
-            ydl.download([url])
-            
-            # Encontrar novos arquivos
-            files_after = set(os.listdir(DOWNLOADS_DIR))
-            new_files = files_after - files_before
+            info = ydl.process_ie_result(info, download=True)
             
+            # Caminho final informado pelo yt-dlp (após o pós-processamento)
             filename = None
-            
-            # Para áudio, procurar especificamente MP3
-            if format_type == 'audio':
-                for file in new_files:
-                    if file.endswith('.mp3'):
-                        filename = file
-                        break
-            
-            # Se não encontrou ou não é áudio, pegar qualquer arquivo novo
-            if not filename and new_files:
-                filename = list(new_files)[0]
+            for requested in info.get('requested_downloads') or []:
+                if requested.get('filepath'):
+                    filename = os.path.basename(requested['filepath'])
             
             if filename:
                 file_path = os.path.join(DOWNLOADS_DIR, filename)
@@ -247,7 +214,7 @@ with col1:
         st.error("❌ FFmpeg não encontrado")
 
 with col2:
-    downloads_count = len(get_downloads())
+    downloads_count = sqlite_db.count(DB_PATH, 'downloads')
     st.info(f"📊 Total de downloads: {downloads_count}")
 
 # Formulário
@@ -284,7 +251,10 @@ with st.sidebar:
 # Lista de downloads
 st.header("📋 Downloads")
 
-downloads = get_downloads()
+# Paginação por cursor: a pilha guarda o início de cada página já vista
+if 'history_cursors' not in st.session_state:
+    st.session_state.history_cursors = [None]
+downloads, next_cursor = get_downloads(st.session_state.history_cursors[-1])
 
 if downloads:
     for download in downloads:
@@ -349,10 +319,28 @@ if downloads:
             
             st.divider()
     
+    # Navegação entre páginas do histórico
+    page_number = len(st.session_state.history_cursors)
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if page_number > 1 and st.button("⬅️ Mais recentes"):
+            st.session_state.history_cursors.pop()
+            st.rerun()
+    with col_page:
+        st.markdown(f"Página {page_number} · {sqlite_db.count(DB_PATH, 'downloads')} downloads no total")
+    with col_next:
+        if next_cursor and st.button("Mais antigos ➡️"):
+            st.session_state.history_cursors.append(next_cursor)
+            st.rerun()
+    
     # Auto-refresh
     if any(d[5] in ['downloading', 'pending'] for d in downloads if len(d) > 5):
         time.sleep(2)
         st.rerun()
+elif len(st.session_state.history_cursors) > 1:
+    # A página ficou vazia (ex.: itens deletados); voltar para a primeira
+    st.session_state.history_cursors = [None]
+    st.rerun()
 else:
     st.info("Nenhum download encontrado")
 
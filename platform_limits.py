@@ -0,0 +1,113 @@
+import threading
+import time
+from sqlalchemy import case, func, true
+from sqlalchemy.orm import aliased
+from app import db, app
+from models import Download
+
+UNLIMITED = 1_000_000
+
+
+class PlatformBusy(Exception):
+    """No request token became available for a platform in time"""
+
+
+def parse_limits(spec):
+    """Parse 'youtube=2/4,instagram=0.5/2' into {platform: (requests per second, max concurrent jobs)}"""
+    limits = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        platform, _, values = item.partition('=')
+        rate, _, concurrent = values.partition('/')
+        limits[platform.strip()] = (float(rate or 0), int(concurrent or 0))
+    return limits
+
+
+class PlatformLimiter:
+    """Per-platform request rate and concurrency limits applied at claim time.
+
+    Each platform has a token bucket refilled at its requests-per-second rate
+    and a cap on jobs downloading at once. Every real extraction request
+    spends a token: previews wait for one, jobs spend one when they extract
+    (cache hits spend none) and are not claimed while the bucket is empty.
+    The cap is checked in the claim query itself, so it holds across worker
+    processes; the token buckets are per process. A rate or cap of 0 means
+    unlimited.
+    """
+
+    def __init__(self, limits, burst_seconds=2.0):
+        self.limits = limits
+        self.burst_seconds = burst_seconds
+        now = time.monotonic()
+        self._buckets = {
+            platform: {'tokens': max(rate * burst_seconds, 1), 'last': now}
+            for platform, (rate, _) in limits.items() if rate
+        }
+        self._lock = threading.Lock()
+
+    def _refill(self, platform, now):
+        rate = self.limits[platform][0]
+        bucket = self._buckets[platform]
+        bucket['tokens'] = min(bucket['tokens'] + (now - bucket['last']) * rate, max(rate * self.burst_seconds, 1))
+        bucket['last'] = now
+        return bucket
+
+    def blocked(self):
+        """Platforms without a request token right now"""
+        now = time.monotonic()
+        with self._lock:
+            return {platform for platform in self._buckets if self._refill(platform, now)['tokens'] < 1}
+
+    def take(self, platform):
+        """Spend a token for a request that is about to be made"""
+        with self._lock:
+            if platform in self._buckets:
+                self._refill(platform, time.monotonic())['tokens'] -= 1
+
+    def wait(self, platform, timeout):
+        """Block until a token is available and spend it; False if that takes longer than timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if platform not in self._buckets:
+                    return True
+                bucket = self._refill(platform, time.monotonic())
+                if bucket['tokens'] >= 1:
+                    bucket['tokens'] -= 1
+                    return True
+                wait = (1 - bucket['tokens']) / self.limits[platform][0]
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def has_room(self):
+        """Claim condition: the job's platform runs fewer jobs than its cap"""
+        caps = [(Download.platform == platform, concurrent) for platform, (_, concurrent) in self.limits.items() if concurrent]
+        if not caps:
+            return true()
+        sibling = aliased(Download)
+        running = db.select(func.count(sibling.id)) \
+            .where(sibling.platform == Download.platform, sibling.status == 'downloading', sibling.source_id.is_(None)) \
+            .scalar_subquery()
+        return running < case(*caps, else_=UNLIMITED)
+
+    def stats(self):
+        """Configured limits, live token state and running jobs per platform"""
+        with app.app_context():
+            running = dict(db.session.execute(
+                db.select(Download.platform, func.count(Download.id))
+                .where(Download.status == 'downloading', Download.source_id.is_(None))
+                .group_by(Download.platform)
+            ).all())
+        now = time.monotonic()
+        stats = {}
+        with self._lock:
+            for platform, (rate, concurrent) in self.limits.items():
+                stats[platform] = {
+                    'requests_per_second': rate or None,
+                    'tokens': round(self._refill(platform, now)['tokens'], 2) if platform in self._buckets else None,
+                    'max_concurrent': concurrent or None,
+                    'running': running.get(platform, 0),
+                }
+        return stats
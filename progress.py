@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+from sqlalchemy import update, or_
+from app import db, app
+from models import Download
+
+
+class ProgressAggregator:
+    """Buffers download progress in memory and writes it in batches.
+
+    yt-dlp reports progress many times per second per job. Instead of one
+    commit per callback, the latest value of every active job is kept in
+    memory and a background thread writes all changed jobs in a single
+    transaction at most once per flush interval.
+    """
+
+    def __init__(self, flush_interval_ms=1000, min_step=1):
+        self.flush_interval = flush_interval_ms / 1000
+        self.min_step = min_step
+        self._pending = {}
+        self._written = {}
+        self._active = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.flushes = 0
+
+    def start(self):
+        """Start the background flush thread"""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name='progress-flusher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def report(self, download_id, progress):
+        """Record the latest progress of a job; written on the next flush"""
+        with self._lock:
+            self._active.add(download_id)
+            if abs(progress - self._written.get(download_id, 0)) >= self.min_step:
+                self._pending[download_id] = progress
+
+    def finish(self, download_id):
+        """Drop buffered progress for a job whose final state is written by the caller"""
+        with self._lock:
+            self._active.discard(download_id)
+            self._pending.pop(download_id, None)
+            self._written.pop(download_id, None)
+
+    def flush(self):
+        """Write all buffered progress in one transaction"""
+        with self._lock:
+            batch = self._pending
+            self._pending = {}
+        if not batch:
+            return
+
+        with app.app_context():
+            # Only touch jobs that are still running so a late flush can
+            # never overwrite a completed or failed row. Downloads following
+            # the job share its progress.
+            for download_id, progress in batch.items():
+                db.session.execute(
+                    update(Download)
+                    .where(
+                        or_(Download.id == download_id, Download.source_id == download_id),
+                        Download.status.in_(('downloading', 'processing')),
+                    )
+                    .values(progress=progress)
+                )
+            db.session.commit()
+        self.flushes += 1
+
+        with self._lock:
+            for download_id, progress in batch.items():
+                if download_id in self._active:
+                    self._written[download_id] = progress
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Progress flush failed: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active_jobs': len(self._active),
+                'pending_updates': len(self._pending),
+                'flushes': self.flushes,
+            }
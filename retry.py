@@ -0,0 +1,146 @@
+import re
+import random
+import socket
+import threading
+import time
+import yt_dlp
+from yt_dlp.networking.exceptions import HTTPError, TransportError
+
+# Message fragments of errors that will not go away by trying again
+PERMANENT_PATTERNS = re.compile(
+    r'video unavailable|private video|this video (is|has been) (not available|removed)|'
+    r'sign in to confirm your age|members-only|copyright|account .* terminated|'
+    r'unsupported url|http error 403|http error 404|http error 410|not found|requested format is not available',
+    re.IGNORECASE,
+)
+# Throttling, server errors and network trouble
+TRANSIENT_PATTERNS = re.compile(
+    r'http error (429|5\d\d)|too many requests|timed out|timeout|connection (reset|refused|aborted)|'
+    r'temporary failure|name resolution|incompleteread|remote end closed|unable to download webpage',
+    re.IGNORECASE,
+)
+
+
+def classify(error):
+    """'transient' for errors worth retrying later, 'permanent' for the rest"""
+    cause = error
+    if isinstance(error, yt_dlp.utils.DownloadError) and error.exc_info:
+        cause = error.exc_info[1]
+
+    if isinstance(cause, HTTPError):
+        # 403 is private, geo-blocked or login-walled media; expired format URLs
+        # are re-extracted by the fetch before an error gets here
+        return 'transient' if cause.status == 429 or cause.status >= 500 else 'permanent'
+    if isinstance(cause, (TransportError, socket.timeout, TimeoutError, ConnectionError)):
+        return 'transient'
+
+    message = str(error)
+    if PERMANENT_PATTERNS.search(message):
+        return 'permanent'
+    if TRANSIENT_PATTERNS.search(message):
+        return 'transient'
+    # Extractor hiccups (layout changes, bad responses) often pass; code errors do not
+    if isinstance(error, yt_dlp.utils.YoutubeDLError):
+        return 'transient'
+    return 'permanent'
+
+
+class RetryPolicy:
+    """Jittered exponential backoff within a per-job attempt budget"""
+
+    def __init__(self, max_attempts=3, base_seconds=30, max_seconds=1800):
+        self.max_attempts = max_attempts
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+
+    def delay(self, attempt):
+        """Seconds to wait before the next attempt after `attempt` failed ones"""
+        delay = min(self.max_seconds, self.base_seconds * 2 ** (attempt - 1))
+        # Equal jitter: keeps a floor while spreading retries of jobs that failed together
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def has_budget(self, attempts, max_attempts=None):
+        """Whether a job that made `attempts` attempts may try again"""
+        return attempts < (max_attempts or self.max_attempts)
+
+
+class CircuitBreaker:
+    """Per-platform breaker that stops dispatching jobs to a failing host.
+
+    After `threshold` consecutive transient failures the platform is open and
+    none of its jobs are claimed for `cooldown` seconds. Then one probe job is
+    let through (half-open): success closes the breaker, failure opens it
+    again with a doubled cooldown, up to `max_cooldown`.
+    """
+
+    def __init__(self, threshold=5, cooldown=60, max_cooldown=900):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._platforms = {}
+        self._lock = threading.Lock()
+
+    def _state(self, platform):
+        return self._platforms.setdefault(platform, {
+            'failures': 0,
+            'opened_at': None,
+            'cooldown': self.cooldown,
+            'probing': False,
+            'trips': 0,
+        })
+
+    def blocked(self):
+        """Platforms whose jobs must not be claimed right now"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                platform for platform, state in self._platforms.items()
+                if state['opened_at'] is not None
+                and (now - state['opened_at'] < state['cooldown'] or state['probing'])
+            }
+
+    def on_dispatch(self, platform):
+        """A job of this platform was claimed; in half-open state it is the probe"""
+        with self._lock:
+            state = self._state(platform)
+            if state['opened_at'] is not None:
+                state['probing'] = True
+
+    def record_success(self, platform):
+        with self._lock:
+            state = self._state(platform)
+            state.update(failures=0, opened_at=None, cooldown=self.cooldown, probing=False)
+
+    def record_failure(self, platform):
+        with self._lock:
+            state = self._state(platform)
+            state['failures'] += 1
+            if state['probing']:
+                # The probe failed: stay open for longer
+                state['cooldown'] = min(state['cooldown'] * 2, self.max_cooldown)
+                state['opened_at'] = time.monotonic()
+                state['probing'] = False
+                state['trips'] += 1
+            elif state['opened_at'] is None and state['failures'] >= self.threshold:
+                state['opened_at'] = time.monotonic()
+                state['trips'] += 1
+
+    def release_probe(self, platform):
+        """The probe ended without telling anything about the host (e.g. cancelled)"""
+        with self._lock:
+            self._state(platform)['probing'] = False
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                platform: {
+                    'state': 'closed' if state['opened_at'] is None
+                    else 'open' if now - state['opened_at'] < state['cooldown'] else 'half_open',
+                    'consecutive_failures': state['failures'],
+                    'trips': state['trips'],
+                    'retry_in': max(0, round(state['opened_at'] + state['cooldown'] - now))
+                    if state['opened_at'] is not None else 0,
+                }
+                for platform, state in self._platforms.items()
+            }
@@ -1,13 +1,85 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_from_directory
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_from_directory, session, Response
 from app import app, db
-from models import Download
-from downloader import VideoDownloader
-import threading
+from models import Download, DownloadBatch
+from downloader import VideoDownloader, ProcessDownloader
+from transcoder import Transcoder
+from worker_pool import ConcurrencyLimiter, DownloadWorkerPool
+from job_queue import JobQueue
+from progress import ProgressAggregator
+from metadata_cache import MetadataCache, summarize
+from canonical import media_key, media_id
+from inflight import InflightRegistry, IN_FLIGHT
+from bandwidth import BandwidthGovernor
+from job_control import JobControl
+from scheduler import Scheduler, PRIORITIES, DEFAULT_PRIORITY, estimate_size
+from batches import expand_playlist, is_single_video, batch_summary
+from audio_formats import is_audio_format, DEFAULT_AUDIO_FORMAT
+from streaming import wait_for_part_file, follow_file, StreamSlots
+from retry import RetryPolicy, CircuitBreaker
+from platform_limits import PlatformLimiter, PlatformBusy, parse_limits
+from history import history_page, history_count, filter_conditions, changes_since, latest_version, settled_version
+from events import EventBus, ChangeFeed, Subscription, sse_stream
+import yt_dlp
 import os
-from urllib.parse import urlparse
+import uuid
+from datetime import datetime
+import shutil
+import mimetypes
+from urllib.parse import urlparse, quote
 import re
 
-downloader = VideoDownloader()
+limiter = ConcurrencyLimiter({
+    'fetch': app.config['FETCH_CONCURRENCY'],
+    'postprocess': app.config['POSTPROCESS_CONCURRENCY'],
+})
+events = EventBus(app.config['EVENT_BUFFER_SIZE'])
+change_feed = ChangeFeed(events, app.config['EVENT_POLL_INTERVAL_MS'], app.config['CHANGES_SETTLE_MS'])
+event_streams = StreamSlots(app.config['MAX_EVENT_STREAMS'])
+file_streams = StreamSlots(app.config['MAX_FILE_STREAMS'])
+progress = ProgressAggregator(app.config['PROGRESS_FLUSH_INTERVAL_MS'], app.config['PROGRESS_MIN_STEP'])
+metadata_cache = MetadataCache(
+    app.config['METADATA_CACHE_TTL'],
+    app.config['METADATA_CACHE_MAX_ENTRIES'],
+    app.config['FORMAT_URL_TTL'],
+)
+bandwidth = BandwidthGovernor(app.config['BANDWIDTH_LIMIT'])
+control = JobControl()
+retry_policy = RetryPolicy(
+    app.config['MAX_ATTEMPTS'],
+    app.config['RETRY_BASE_SECONDS'],
+    app.config['RETRY_MAX_SECONDS'],
+)
+breaker = CircuitBreaker(app.config['BREAKER_THRESHOLD'], app.config['BREAKER_COOLDOWN'])
+platform_limits = PlatformLimiter(parse_limits(app.config['PLATFORM_LIMITS']))
+# In process mode yt-dlp runs in one worker process per download thread
+downloader_class = ProcessDownloader if app.config['WORKER_MODE'] == 'process' else VideoDownloader
+downloader = downloader_class(limiter, progress, metadata_cache, bandwidth, control, retry_policy, breaker, platform_limits)
+# Past the control poll (and a hook) a cancelled job has stopped writing its partial file
+inflight = InflightRegistry(downloader.downloads_dir, app.config['CONTROL_POLL_INTERVAL'] * 2 + 1)
+scheduler = Scheduler(app.config['SCHEDULER_POLICY'])
+job_queue = JobQueue(app.config['JOB_LEASE_SECONDS'], inflight, scheduler, breaker, platform_limits)
+worker_pool = DownloadWorkerPool(
+    downloader.download_video,
+    app.config['DOWNLOAD_WORKERS'],
+    job_queue,
+    limiter,
+    poll_interval=app.config['QUEUE_POLL_INTERVAL'],
+    control=control,
+    control_interval=app.config['CONTROL_POLL_INTERVAL'],
+)
+transcoder = Transcoder(progress, control, downloader.timings, inflight=inflight)
+transcode_pool = DownloadWorkerPool(
+    transcoder.transcode,
+    app.config['TRANSCODE_WORKERS'],
+    job_queue,
+    poll_interval=app.config['QUEUE_POLL_INTERVAL'],
+    control=control,
+    control_interval=app.config['CONTROL_POLL_INTERVAL'],
+    stage='transcode',
+)
+downloader.on_fetched = transcode_pool.notify
+if app.config['STREAM_TRANSCODE'] and downloader_class is VideoDownloader and shutil.which(transcoder.ffmpeg):
+    downloader.transcoder = transcoder
 
 @app.route('/')
 def index():
@@ -15,8 +87,13 @@ def index():
 
 @app.route('/downloads')
 def downloads():
-    downloads = Download.query.order_by(Download.created_at.desc()).all()
-    return render_template('downloads.html', downloads=downloads)
+    conditions = filter_conditions(request.args)
+    try:
+        downloads, next_cursor = history_page(conditions, page_size(), request.args.get('cursor'))
+    except ValueError:
+        # A stale or mangled cursor just shows the newest page
+        downloads, next_cursor = history_page(conditions, page_size())
+    return render_template('downloads.html', downloads=downloads, next_cursor=next_cursor)
 
 @app.route('/download', methods=['POST'])
 def start_download():
@@ -38,21 +115,31 @@ def start_download():
         flash('Plataforma não suportada. Apenas YouTube e Instagram são suportados.', 'error')
         return redirect(url_for('index'))
     
-    # Check if URL already exists and is not failed
-    existing = Download.query.filter_by(url=url).filter(Download.status != 'failed').first()
-    if existing:
-        flash('Esta URL já foi baixada ou está em processo de download.', 'warning')
-        return redirect(url_for('downloads'))
+    # Attach to an in-flight job or reuse a completed file for the same media
+    # and format, whatever URL variant (youtu.be, m.youtube.com, &t=...) was submitted
+    audio_format = request.form.get('audio_format', DEFAULT_AUDIO_FORMAT)
+    if not is_audio_format(audio_format):
+        audio_format = DEFAULT_AUDIO_FORMAT
+    key = output_media_key(url, format_type, audio_format)
+    priority = PRIORITIES.get(request.form.get('priority', 'normal'), DEFAULT_PRIORITY)
+    download, outcome = inflight.submit(
+        url, key, platform, format_type,
+        audio_format=audio_format,
+        priority=priority,
+        max_attempts=app.config['MAX_ATTEMPTS'],
+        owner_key=owner_key(),
+        estimated_size=cached_size_estimate(url, format_type),
+    )
     
-    # Create download record
-    download = Download(url=url, platform=platform, format_type=format_type)
-    db.session.add(download)
-    db.session.commit()
+    if outcome == 'reused':
+        flash('Este arquivo já estava disponível e foi adicionado aos seus downloads.', 'success')
+        return redirect(url_for('downloads'))
+    if outcome == 'attached':
+        flash('Este vídeo já está sendo baixado. Acompanhe o progresso na página de downloads.', 'success')
+        return redirect(url_for('downloads'))
     
-    # Start download in background thread
-    thread = threading.Thread(target=downloader.download_video, args=(download.id, format_type))
-    thread.daemon = True
-    thread.start()
+    # The pending row is the queue entry; wake a worker to claim it
+    worker_pool.notify()
     
     format_msg = "áudio" if format_type == "audio" else "vídeo"
     flash(f'Download de {format_msg} iniciado! Acompanhe o progresso na página de downloads.', 'success')
@@ -65,8 +152,227 @@ def get_download_status(download_id):
 
 @app.route('/api/downloads')
 def get_all_downloads():
-    downloads = Download.query.order_by(Download.created_at.desc()).all()
-    return jsonify([download.to_dict() for download in downloads])
+    """Newest-first page of the history; the cursor of the next page is in X-Next-Cursor"""
+    try:
+        downloads, next_cursor = history_page(filter_conditions(request.args), page_size(), request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Cursor inválido.'}), 400
+    
+    response = jsonify([download.to_dict() for download in downloads])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+@app.route('/api/downloads/count')
+def count_downloads():
+    return jsonify({'count': history_count(filter_conditions(request.args))})
+
+@app.route('/api/downloads/changes')
+def download_changes():
+    """Downloads changed since ?since=<cursor>, with the cursor to send next time.
+
+    Without since, returns no rows and the current cursor: take it before
+    loading the history, then poll from it.
+    """
+    since = request.args.get('since')
+    settled = settled_version(app.config['CHANGES_SETTLE_MS'])
+    if since is None:
+        return jsonify({'downloads': [], 'cursor': latest_version(settled), 'more': False})
+    try:
+        since = int(since)
+    except ValueError:
+        return jsonify({'error': 'Cursor inválido.'}), 400
+    
+    downloads, cursor, more = changes_since(since, page_size(), settled)
+    return jsonify({'downloads': [download.to_dict() for download in downloads], 'cursor': cursor, 'more': more})
+
+@app.route('/api/events')
+def job_events():
+    """Server-Sent Events with the progress and status changes of some downloads.
+
+    ?ids=1,2,3 follows those downloads; without ids, the in-flight and future
+    downloads of this session. Reconnects resume after Last-Event-ID.
+    """
+    ids = request.args.get('ids')
+    owner = None
+    if ids:
+        try:
+            ids = [int(value) for value in ids.split(',') if value]
+        except ValueError:
+            return jsonify({'error': 'IDs inválidos.'}), 400
+    else:
+        owner = owner_key()
+    
+    def subscribe():
+        if ids:
+            return Subscription(Download.query.filter(Download.id.in_(ids)).all())
+        return Subscription(
+            Download.query.filter(Download.owner_key == owner, Download.status.in_(IN_FLIGHT)).all(),
+            owner,
+        )
+    
+    if not event_streams.acquire():
+        return streams_busy('Muitas conexões ao vivo abertas. Acompanhe pelo /api/downloads/changes.')
+    try:
+        response = Response(
+            sse_stream(
+                events,
+                subscribe,
+                request.headers.get('Last-Event-ID') or request.args.get('last_event_id'),
+                heartbeat=app.config['EVENT_HEARTBEAT_SECONDS'],
+                max_seconds=app.config['EVENT_STREAM_SECONDS'],
+            ),
+            mimetype='text/event-stream',
+        )
+    except Exception:
+        event_streams.release()
+        raise
+    # The slot is freed once the server is done with the response, even if it never started
+    response.call_on_close(event_streams.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/preview')
+def preview():
+    url = request.args.get('url', '').strip()
+    if not url or not is_valid_url(url) or not detect_platform(url):
+        return jsonify({'error': 'URL inválida ou plataforma não suportada.'}), 400
+    
+    try:
+        with yt_dlp.YoutubeDL({'quiet': True, 'noplaylist': True}) as ydl:
+            info, from_cache = metadata_cache.extract(
+                ydl, url, need_urls=False,
+                before_request=lambda: wait_for_platform(detect_platform(url)),
+            )
+    except PlatformBusy:
+        return jsonify({'error': 'Muitas requisições para esta plataforma. Tente novamente em instantes.'}), 429
+    except yt_dlp.utils.DownloadError as e:
+        return jsonify({'error': str(e)}), 502
+    
+    summary = summarize(info)
+    summary['cached'] = from_cache
+    return jsonify(summary)
+
+@app.route('/api/batch', methods=['POST'])
+def create_batch():
+    """Submit a list of URLs, or a playlist/channel URL, as one batch of downloads"""
+    data = request.get_json(silent=True) or {}
+    format_type = data.get('format', 'video')
+    if format_type not in ('video', 'audio'):
+        return jsonify({'error': 'Formato inválido. Use "video" ou "audio".'}), 400
+    audio_format = data.get('audio_format', DEFAULT_AUDIO_FORMAT)
+    if not is_audio_format(audio_format):
+        return jsonify({'error': 'Formato de áudio inválido. Use "original", "mp3", "m4a" ou "opus".'}), 400
+    priority = PRIORITIES.get(data.get('priority', 'normal'), DEFAULT_PRIORITY)
+    max_size = app.config['MAX_BATCH_SIZE']
+    try:
+        concurrency = max(1, int(data.get('concurrency') or app.config['BATCH_CONCURRENCY']))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Concorrência inválida.'}), 400
+    
+    urls = data.get('urls')
+    source_url = (data.get('url') or '').strip()
+    title = None
+    if isinstance(urls, list) and urls:
+        entries = [(None, str(url).strip()) for url in urls[:max_size]]
+    elif source_url:
+        if not is_valid_url(source_url) or not detect_platform(source_url):
+            return jsonify({'error': 'URL inválida ou plataforma não suportada.'}), 400
+        try:
+            wait_for_platform(detect_platform(source_url))
+            entries, title = expand_playlist(source_url, max_size)
+        except PlatformBusy:
+            return jsonify({'error': 'Muitas requisições para esta plataforma. Tente novamente em instantes.'}), 429
+        except yt_dlp.utils.DownloadError as e:
+            return jsonify({'error': str(e)}), 502
+    else:
+        return jsonify({'error': 'Envie uma lista "urls" ou uma "url" de playlist/canal.'}), 400
+    
+    submissions = []
+    rejected = []
+    owner = owner_key()
+    for entry_title, url in entries:
+        platform = detect_platform(url) if is_valid_url(url) else None
+        if not platform or not is_single_video(url):
+            rejected.append(url)
+            continue
+        submissions.append({
+            'url': url,
+            'key': output_media_key(url, format_type, audio_format),
+            'platform': platform,
+            'format_type': format_type,
+            'audio_format': audio_format,
+            'max_attempts': app.config['MAX_ATTEMPTS'],
+            'title': entry_title,
+            'priority': priority,
+            'owner_key': owner,
+            'estimated_size': cached_size_estimate(url, format_type),
+        })
+    if not submissions:
+        return jsonify({'error': 'Nenhuma URL de vídeo válida.', 'rejected': rejected}), 400
+    
+    # The batch and all its children are created in one transaction
+    batch = DownloadBatch(
+        source_url=source_url or None,
+        title=title,
+        format_type=format_type,
+        owner_key=owner,
+        max_concurrency=concurrency,
+    )
+    db.session.add(batch)
+    db.session.flush()
+    for submission in submissions:
+        submission['batch_id'] = batch.id
+    results = inflight.submit_many(submissions)
+    worker_pool.notify()
+    
+    summary = batch_summary(batch)
+    summary['outcomes'] = {}
+    for _, outcome in results:
+        summary['outcomes'][outcome] = summary['outcomes'].get(outcome, 0) + 1
+    summary['rejected'] = rejected
+    return jsonify(summary), 201
+
+@app.route('/api/batch/<int:batch_id>')
+def get_batch(batch_id):
+    """Aggregate status of a batch; ?items=0 leaves out the child downloads"""
+    batch = db.get_or_404(DownloadBatch, batch_id)
+    summary = batch_summary(batch)
+    if request.args.get('items') != '0':
+        downloads = Download.query.filter_by(batch_id=batch.id).order_by(Download.id).all()
+        summary['downloads'] = [download.to_dict() for download in downloads]
+    return jsonify(summary)
+
+@app.route('/api/queue')
+def get_queue_stats():
+    stats = worker_pool.stats()
+    stats['transcode'] = transcode_pool.stats()
+    stats['progress'] = progress.stats()
+    stats['events'] = {**events.stats(), **change_feed.stats()}
+    stats['streams'] = {
+        'events': {'open': event_streams.open, 'limit': event_streams.limit},
+        'files': {'open': file_streams.open, 'limit': file_streams.limit},
+    }
+    stats['timings'] = downloader.timings.stats()
+    if isinstance(downloader, ProcessDownloader):
+        stats['worker_processes'] = downloader.stats()
+    stats['metadata_cache'] = metadata_cache.stats()
+    stats['latency'] = scheduler.latency_stats()
+    stats['breakers'] = breaker.stats()
+    stats['platforms'] = platform_limits.stats()
+    stats['retrying'] = Download.query.filter(
+        Download.status == 'pending', Download.next_attempt_at > datetime.utcnow()
+    ).count()
+    stats['resume'] = {
+        'bytes_saved': db.session.query(db.func.coalesce(db.func.sum(Download.resumed_bytes), 0)).scalar(),
+        'bytes_saved_this_process': downloader.resumed_bytes,
+    }
+    return jsonify(stats)
+
+@app.route('/api/bandwidth')
+def get_bandwidth_stats():
+    return jsonify(bandwidth.stats())
 
 @app.route('/download_file/<int:download_id>')
 def download_file(download_id):
@@ -82,12 +388,53 @@ def download_file(download_id):
     flash('Arquivo não encontrado.', 'error')
     return redirect(url_for('downloads'))
 
+@app.route('/stream/<int:download_id>')
+def stream_download(download_id):
+    """Send the file while it is still being downloaded, following it until the job ends"""
+    download = Download.query.get_or_404(download_id)
+    if download.status == 'completed':
+        return redirect(url_for('download_file', download_id=download.id))
+    
+    # Only pass-through outputs: the bytes on disk are the bytes the user gets
+    if download.format_type == 'audio' and (download.audio_format or 'mp3') != DEFAULT_AUDIO_FORMAT:
+        return jsonify({'error': 'Este formato é convertido e só pode ser baixado ao final.'}), 409
+    if download.status not in ('pending', 'downloading'):
+        return jsonify({'error': 'Este download não está em andamento.'}), 409
+    
+    # Waiting for the first bytes already holds a thread
+    if not file_streams.acquire():
+        return streams_busy('Muitas transmissões em andamento. Baixe o arquivo quando o download terminar.')
+    try:
+        part_path = wait_for_part_file(download.id, app.config['STREAM_START_TIMEOUT'])
+    except Exception:
+        file_streams.release()
+        raise
+    if not part_path:
+        file_streams.release()
+        return jsonify({'error': 'O download ainda não começou. Tente novamente em instantes.'}), 409
+    
+    filename = os.path.basename(part_path[:-len('.part')] if part_path.endswith('.part') else part_path)
+    response = Response(
+        follow_file(download.id, part_path, idle_timeout=app.config['STREAM_IDLE_TIMEOUT']),
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+    )
+    response.call_on_close(file_streams.release)
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    response.headers['X-Accel-Buffering'] = 'no'  # let proxies pass bytes through as they arrive
+    return response
+
 @app.route('/delete/<int:download_id>')
 def delete_download(download_id):
     download = Download.query.get_or_404(download_id)
     
-    # Delete file if exists
-    if download.filename:
+    # Followers of this job keep going under a new leader
+    inflight.release(download)
+    
+    if not download.source_id:
+        stop_job(download)
+    
+    # Delete file if exists and no other download shares it
+    if download.filename and not inflight.file_in_use(download):
         file_path = os.path.join('downloads', download.filename)
         if os.path.exists(file_path):
             try:
@@ -97,10 +444,116 @@ def delete_download(download_id):
     
     db.session.delete(download)
     db.session.commit()
+    worker_pool.notify()
     
     flash('Download removido com sucesso.', 'success')
     return redirect(url_for('downloads'))
 
+@app.route('/api/download/<int:download_id>/cancel', methods=['POST'])
+def cancel_download(download_id):
+    """Stop a queued, running or paused download and discard its partial file"""
+    download = Download.query.get_or_404(download_id)
+    if download.status not in ('pending', 'downloading', 'processing', 'paused'):
+        return jsonify({'error': 'Este download não está em andamento.'}), 409
+    
+    if download.source_id:
+        # A follower only stops following; the shared job goes on for the others
+        download.source_id = None
+    else:
+        inflight.release(download)
+        stop_job(download)
+    
+    download.status = 'cancelled'
+    db.session.commit()
+    worker_pool.notify()
+    return jsonify(download.to_dict())
+
+@app.route('/api/download/<int:download_id>/pause', methods=['POST'])
+def pause_download(download_id):
+    """Stop a download but keep its partial file so it can be resumed"""
+    download = Download.query.get_or_404(download_id)
+    if download.source_id:
+        return jsonify({'error': 'Este download acompanha outro e não pode ser pausado.'}), 409
+    if download.status not in ('pending', 'downloading'):
+        return jsonify({'error': 'Este download não está em andamento.'}), 409
+    
+    running = download.status == 'downloading'
+    download.status = 'paused'
+    download.sync_followers()
+    db.session.commit()
+    if running:
+        control.request(download.id, 'pause')
+    return jsonify(download.to_dict())
+
+@app.route('/api/download/<int:download_id>/resume', methods=['POST'])
+def resume_download(download_id):
+    """Queue a paused download again; it continues from its partial file"""
+    download = Download.query.get_or_404(download_id)
+    if download.status != 'paused' or download.source_id:
+        return jsonify({'error': 'Este download não está pausado.'}), 409
+    
+    download.status = 'pending'
+    download.worker_id = None
+    download.lease_expires_at = None
+    download.sync_followers()
+    db.session.commit()
+    worker_pool.notify()
+    return jsonify(download.to_dict())
+
+def output_media_key(url, format_type, audio_format):
+    """Media key that also tells apart the audio outputs of the same video"""
+    if format_type == 'audio':
+        return media_key(url, format_type, quality=audio_format)
+    return media_key(url, format_type)
+
+def stop_job(download):
+    """Cancel a job: a running one stops at its next progress callback and cleans
+    up after itself, otherwise files left by earlier stages are removed here"""
+    if download.status in ('downloading', 'processing') and download.worker_id:
+        control.request(download.id, 'cancel')
+    else:
+        # The source of a finished conversion may be another download's file
+        sources = [download.source_path] if download.source_path and not inflight.file_in_use(download, download.source_path) else []
+        downloader.discard_partial_files(download.id, download.part_path, sources)
+        download.part_path = None
+        download.source_path = None
+
+def owner_key():
+    """Key jobs are fair-shared by: the browser session (created on first use) or client IP"""
+    if app.config['FAIR_SHARE_KEY'] == 'ip':
+        return f'ip:{request.remote_addr}'
+    if 'owner' not in session:
+        session['owner'] = uuid.uuid4().hex
+    return session['owner']
+
+def cached_size_estimate(url, format_type):
+    """Expected download size from already cached metadata (never extracts)"""
+    platform, video_id = media_id(url)
+    if not platform or not video_id:
+        return None
+    info = metadata_cache.get(platform, video_id)
+    return estimate_size(info, format_type) if info else None
+
+def page_size():
+    """Requested page size, within 1..MAX_PAGE_SIZE"""
+    try:
+        limit = int(request.args.get('limit', app.config['PAGE_SIZE']))
+    except ValueError:
+        limit = app.config['PAGE_SIZE']
+    return max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+
+def streams_busy(message):
+    """503 for a long-lived response refused because every stream slot is taken"""
+    response = jsonify({'error': message})
+    response.status_code = 503
+    response.headers['Retry-After'] = '30'
+    return response
+
+def wait_for_platform(platform):
+    """Take a request token for an extraction made in the request itself"""
+    if not platform_limits.wait(platform, app.config['PLATFORM_WAIT_SECONDS']):
+        raise PlatformBusy(platform)
+
 def is_valid_url(url):
     """Check if URL is valid"""
     try:
@@ -0,0 +1,150 @@
+import math
+from sqlalchemy import func
+from app import db, app
+from models import Download, FETCH_QUEUE
+from metadata_cache import format_size
+
+PRIORITIES = {'low': 0, 'normal': 1, 'high': 2}
+DEFAULT_PRIORITY = PRIORITIES['normal']
+POLICIES = ('fair', 'sjf')
+
+
+def bandwidth_weight(priority):
+    """Bandwidth share weight of a priority class: low 0.5, normal 1, high 2"""
+    return 2.0 ** ((priority if priority is not None else DEFAULT_PRIORITY) - DEFAULT_PRIORITY)
+
+
+def estimate_size(info, format_type):
+    """Approximate bytes a job will fetch, from cached info; None if unknown"""
+    duration = info.get('duration')
+    sizes = []
+    for fmt in info.get('formats') or []:
+        has_video = fmt.get('vcodec') not in (None, 'none')
+        has_audio = fmt.get('acodec') not in (None, 'none')
+        if format_type == 'audio' and (has_video or not has_audio):
+            continue
+        if format_type != 'audio' and (not has_video or (fmt.get('height') or 0) > 720):
+            continue
+        size = format_size(fmt, duration)
+        if size:
+            sizes.append(size)
+    if sizes:
+        # The engine picks the best matching format, which is also the largest
+        return max(sizes)
+    return format_size(info, duration)
+
+
+class Scheduler:
+    """Decides which pending job a worker claims next.
+
+    Jobs are served by priority class first. Within a class, owners (browser
+    sessions or client IPs) take turns: an owner's n-th waiting job is only
+    reached after every other owner had n jobs running or served, so one user
+    queueing 50 videos cannot hold back everyone else. With the 'sjf' policy,
+    jobs of the same turn are ordered by estimated size, so short audio clips
+    finish before long high-resolution videos; starvation is bounded because
+    size only breaks ties between turns.
+    """
+
+    def __init__(self, policy='fair'):
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown scheduling policy: {policy}')
+        self.policy = policy
+
+    def candidates(self, claimable, limit=5):
+        """Select the ids of the next claimable jobs in scheduling order"""
+        # The few claimable rows are picked out first. Planning the window over
+        # the whole table instead, the planner may walk all of it in owner order
+        # to save a sort.
+        queued = (
+            db.select(
+                Download.id,
+                Download.owner_key,
+                func.coalesce(Download.priority, DEFAULT_PRIORITY).label('priority'),
+                Download.estimated_size,
+                Download.created_at,
+            )
+            .where(claimable)
+            .cte('queued')
+            .prefix_with('MATERIALIZED')
+        )
+        size_order = [queued.c.estimated_size.is_(None), queued.c.estimated_size] if self.policy == 'sjf' else []
+
+        # Jobs an owner already has running count as turns taken. Running jobs
+        # are fetch queue rows: the literal condition keeps this on its index.
+        # They are picked out before grouping, or the planner may walk the
+        # owner index instead to save the sort.
+        running_jobs = (
+            db.select(Download.owner_key)
+            .where(db.text(FETCH_QUEUE), Download.status == 'downloading', Download.source_id.is_(None))
+            .cte('running_jobs')
+            .prefix_with('MATERIALIZED')
+        )
+        running = (
+            db.select(running_jobs.c.owner_key, func.count().label('running'))
+            .group_by(running_jobs.c.owner_key)
+            .subquery()
+        )
+        turn = func.row_number().over(
+            partition_by=queued.c.owner_key,
+            order_by=[queued.c.priority.desc(), *size_order, queued.c.created_at, queued.c.id],
+        ) + func.coalesce(running.c.running, 0)
+
+        ranked = (
+            db.select(
+                queued.c.id,
+                queued.c.priority,
+                turn.label('turn'),
+                queued.c.estimated_size,
+                queued.c.created_at,
+            )
+            .select_from(queued)
+            .outerjoin(running, running.c.owner_key == queued.c.owner_key)
+            .subquery()
+        )
+        size_order = [ranked.c.estimated_size.is_(None), ranked.c.estimated_size] if self.policy == 'sjf' else []
+        return (
+            db.select(ranked.c.id)
+            .order_by(ranked.c.priority.desc(), ranked.c.turn, *size_order, ranked.c.created_at, ranked.c.id)
+            .limit(limit)
+        )
+
+    def latency_stats(self, sample=500):
+        """Mean and p95 submit-to-completion latency of recent jobs, overall and per priority"""
+        with app.app_context():
+            rows = db.session.execute(
+                db.select(Download.priority, Download.created_at, Download.completed_at)
+                .where(
+                    Download.status == 'completed',
+                    Download.completed_at.is_not(None),
+                    Download.completed_at >= Download.created_at,  # reused files completed before submission
+                )
+                .order_by(Download.completed_at.desc())
+                .limit(sample)
+            ).all()
+
+        by_priority = {}
+        for row in rows:
+            seconds = (row.completed_at - row.created_at).total_seconds()
+            priority = row.priority if row.priority is not None else DEFAULT_PRIORITY
+            by_priority.setdefault(priority, []).append(seconds)
+
+        names = {value: name for name, value in PRIORITIES.items()}
+        stats = {'policy': self.policy, **_latency_summary([s for values in by_priority.values() for s in values])}
+        stats['by_priority'] = {
+            names.get(priority, str(priority)): _latency_summary(values)
+            for priority, values in sorted(by_priority.items(), reverse=True)
+        }
+        return stats
+
+
+def _latency_summary(values):
+    if not values:
+        return {'completed': 0, 'mean_seconds': None, 'p95_seconds': None}
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, math.ceil(len(values) * 0.95) - 1)]
+    return {
+        'completed': len(values),
+        'mean_seconds': round(sum(values) / len(values), 2),
+        'p95_seconds': round(p95, 2),
+    }
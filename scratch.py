@@ -0,0 +1,15 @@
+import os
+import tempfile
+
+
+def use_scratch_database(name='scratch'):
+    """Point the app at a throwaway SQLite database, with no queue workers.
+
+    The app reads these settings when it is first imported, so call this
+    before importing it. Returns the database path.
+    """
+    path = os.path.join(tempfile.mkdtemp(), f'{name}.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ['DOWNLOAD_WORKERS'] = '0'
+    os.environ['TRANSCODE_WORKERS'] = '0'
+    return path
@@ -0,0 +1,80 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Wait this long for a lock instead of failing with "database is locked"
+BUSY_TIMEOUT_MS = 5000
+# Prepared statements kept per connection (keyed by SQL text)
+STATEMENT_CACHE_SIZE = 256
+# Rows per history page
+PAGE_SIZE = 50
+
+_local = threading.local()
+
+
+def connect(db_path):
+    """This thread's connection to db_path, opened and tuned on first use.
+
+    WAL lets readers (the page listing downloads) run while a download thread
+    writes progress, and synchronous=NORMAL skips the fsync on every commit,
+    which WAL makes safe against corruption. Connections are per thread, as
+    sqlite3 requires, and live as long as their thread.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        connections[db_path] = conn
+    return conn
+
+
+@contextmanager
+def transaction(db_path):
+    """Cursor on this thread's connection; commits on success, rolls back on error"""
+    conn = connect(db_path)
+    cursor = conn.cursor()
+    try:
+        with conn:
+            yield cursor
+    finally:
+        cursor.close()
+
+
+def page(db_path, table, limit=PAGE_SIZE, cursor=None, columns='*'):
+    """Newest-first page of a table: (rows, cursor of the next page or None).
+
+    Keyset pagination on (created_at, id), so a page costs the same however
+    many rows the table holds. Cursors are (created_at, id) tuples.
+    """
+    where, params = '', []
+    if cursor:
+        where = 'WHERE created_at <= ? AND (created_at < ? OR id < ?)'
+        params = [cursor[0], cursor[0], cursor[1]]
+    with transaction(db_path) as cur:
+        cur.execute(
+            f'SELECT {columns}, created_at, id FROM {table} {where} ORDER BY created_at DESC, id DESC LIMIT ?',
+            params + [limit + 1],
+        )
+        rows = cur.fetchall()
+    if len(rows) > limit:
+        return [row[:-2] for row in rows[:limit]], rows[limit - 1][-2:]
+    return [row[:-2] for row in rows], None
+
+
+def count(db_path, table):
+    """Number of rows in a table"""
+    with transaction(db_path) as cur:
+        cur.execute(f'SELECT COUNT(*) FROM {table}')
+        return cur.fetchone()[0]
+
+
+def index_history(db_path, table):
+    """Index the (created_at, id) order pages are read in"""
+    with transaction(db_path) as cur:
+        cur.execute(f'CREATE INDEX IF NOT EXISTS ix_{table}_created_at ON {table} (created_at, id)')
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+from app import db, app
+from models import Download
+
+CHUNK_SIZE = 64 * 1024
+FOLLOWING = ('pending', 'downloading')
+
+
+class StreamSlots:
+    """Caps the long-lived responses open at once.
+
+    Each open SSE or file stream holds one of the server's threads for
+    minutes. Past the cap new ones are refused, so plain requests still find
+    a free thread; clients fall back to polling.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.open = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a slot; False when all of them are in use"""
+        with self._lock:
+            if self.open >= self.limit:
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+
+def job_row(download):
+    """The row that actually runs the job: the leader for followers"""
+    if download.source_id:
+        return db.session.get(Download, download.source_id) or download
+    return download
+
+
+def wait_for_part_file(download_id, timeout, poll_interval=0.5):
+    """Wait until the job has started writing; returns the partial file path or None"""
+    deadline = time.monotonic() + timeout
+    while True:
+        with app.app_context():
+            download = db.session.get(Download, download_id)
+            if not download:
+                return None
+            job = job_row(download)
+            if job.part_path and os.path.exists(job.part_path):
+                return job.part_path
+            if job.status not in FOLLOWING or time.monotonic() >= deadline:
+                return None
+        time.sleep(poll_interval)
+
+
+def follow_file(download_id, path, poll_interval=0.5, idle_timeout=60):
+    """Yield a file's bytes while a job is still writing it, until the job ends.
+
+    The file is opened once: yt-dlp renames the .part file when it finishes,
+    and the open handle keeps reading the same file under its new name. At
+    EOF the job's status decides whether to wait for more bytes or stop.
+    """
+    with open(path, 'rb') as f:
+        idle_since = time.monotonic()
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if chunk:
+                idle_since = time.monotonic()
+                yield chunk
+                continue
+
+            with app.app_context():
+                download = db.session.get(Download, download_id)
+                status = job_row(download).status if download else None
+            if status not in FOLLOWING:
+                # Whatever was written before the job ended is still readable
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        return
+                    yield chunk
+            if time.monotonic() - idle_since > idle_timeout:
+                return
+            time.sleep(poll_interval)
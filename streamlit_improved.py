@@ -5,7 +5,7 @@ import re
 import threading
 import time
 from datetime import datetime
-import sqlite3
+import sqlite_db
 import shutil
 import subprocess
 from pathlib import Path
@@ -116,92 +116,74 @@ FFMPEG_PATH = get_ffmpeg_path()
 
 # Banco de dados
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS downloads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            url TEXT,
-            title TEXT,
-            platform TEXT,
-            format_type TEXT DEFAULT 'video',
-            status TEXT DEFAULT 'pending',
-            progress INTEGER DEFAULT 0,
-            filename TEXT,
-            file_size TEXT,
-            error_message TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_local_file BOOLEAN DEFAULT 0
-        )
-    ''')
-    
-    # Verificar se a coluna is_local_file existe
-    cursor.execute("PRAGMA table_info(downloads)")
-    columns = [col[1] for col in cursor.fetchall()]
-    
-    if 'is_local_file' not in columns:
-        cursor.execute('ALTER TABLE downloads ADD COLUMN is_local_file BOOLEAN DEFAULT 0')
-    
-    conn.commit()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS downloads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT,
+                title TEXT,
+                platform TEXT,
+                format_type TEXT DEFAULT 'video',
+                status TEXT DEFAULT 'pending',
+                progress INTEGER DEFAULT 0,
+                filename TEXT,
+                file_size TEXT,
+                error_message TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                is_local_file BOOLEAN DEFAULT 0
+            )
+        ''')
+        
+        # Verificar se a coluna is_local_file existe
+        cursor.execute("PRAGMA table_info(downloads)")
+        columns = [col[1] for col in cursor.fetchall()]
+        
+        if 'is_local_file' not in columns:
+            cursor.execute('ALTER TABLE downloads ADD COLUMN is_local_file BOOLEAN DEFAULT 0')
+    sqlite_db.index_history(DB_PATH, 'downloads')
 
 def add_download(url, platform, format_type, is_local_file=False):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO downloads (url, platform, format_type, is_local_file)
-        VALUES (?, ?, ?, ?)
-    ''', (url, platform, format_type, is_local_file))
-    download_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute('''
+            INSERT INTO downloads (url, platform, format_type, is_local_file)
+            VALUES (?, ?, ?, ?)
+        ''', (url, platform, format_type, is_local_file))
+        download_id = cursor.lastrowid
     return download_id
 
-def get_downloads():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM downloads ORDER BY created_at DESC')
-    downloads = cursor.fetchall()
-    conn.close()
-    return downloads
+def get_downloads(cursor=None):
+    """Página do histórico (mais recentes primeiro) e o cursor da próxima"""
+    return sqlite_db.page(DB_PATH, 'downloads', cursor=cursor)
 
 def update_download(download_id, **kwargs):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    updates = []
-    params = []
-    
-    for key, value in kwargs.items():
-        if value is not None:
-            updates.append(f"{key} = ?")
-            params.append(value)
-    
-    if updates:
-        params.append(download_id)
-        query = f"UPDATE downloads SET {', '.join(updates)} WHERE id = ?"
-        cursor.execute(query, params)
-        conn.commit()
-    
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        updates = []
+        params = []
+        
+        for key, value in kwargs.items():
+            if value is not None:
+                updates.append(f"{key} = ?")
+                params.append(value)
+        
+        if updates:
+            params.append(download_id)
+            query = f"UPDATE downloads SET {', '.join(updates)} WHERE id = ?"
+            cursor.execute(query, params)
 
 def delete_download(download_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT filename FROM downloads WHERE id = ?", (download_id,))
-    result = cursor.fetchone()
-    
-    if result and result[0]:
-        file_path = os.path.join(DOWNLOADS_DIR, result[0])
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
-    
-    cursor.execute("DELETE FROM downloads WHERE id = ?", (download_id,))
-    conn.commit()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute("SELECT filename FROM downloads WHERE id = ?", (download_id,))
+        result = cursor.fetchone()
+        
+        if result and result[0]:
+            file_path = os.path.join(DOWNLOADS_DIR, result[0])
+            if os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                except:
+                    pass
+        
+        cursor.execute("DELETE FROM downloads WHERE id = ?", (download_id,))
 
 # Validação
 def is_valid_url(url):
@@ -283,7 +265,7 @@ def convert_local_to_mp3(file_path, download_id):
                        error_message=str(e))
 
 # Função de download do YouTube
-def download_youtube_video(download_id, url, format_type):
+def download_youtube_video(download_id, url, format_type, audio_format='original'):
     """Download de vídeo do YouTube"""
     try:
         update_download(download_id, status='downloading', progress=5)
@@ -294,9 +276,13 @@ def download_youtube_video(download_id, url, format_type):
             'ffmpeg_location': FFMPEG_PATH,
         }
         
-        if format_type == 'audio':
+        if format_type == 'audio' and audio_format == 'original':
+            # Mantém o áudio publicado (M4A/Opus) sem recodificar
+            ydl_opts['format'] = 'bestaudio[ext=m4a]/bestaudio'
+        elif format_type == 'audio':
+            # MP3 sob demanda; o yt-dlp só recodifica se a fonte não for MP3
             ydl_opts.update({
-                'format': 'bestaudio[ext=m4a]/bestaudio[ext=mp3]/bestaudio',
+                'format': 'bestaudio[ext=mp3]/bestaudio[ext=m4a]/bestaudio',
                 'postprocessors': [{
                     'key': 'FFmpegExtractAudio',
                     'preferredcodec': 'mp3',
@@ -338,7 +324,7 @@ def download_youtube_video(download_id, url, format_type):
             update_download(download_id, title=title, progress=10)
             
             # Fazer download
-            ydl.download([url])
+            info = ydl.process_ie_result(info, download=True)
             
             update_download(download_id, status='completed', progress=100)
     
@@ -383,22 +369,29 @@ def main():
                         padding: 1rem; border-radius: 10px; color: white; margin: 1rem 0;">
                 <h4>📹 Baixe áudio do YouTube em MP3</h4>
                 <p>• Suporta: youtube.com, youtu.be, m.youtube.com</p>
-                <p>• Qualidade: 320kbps de alta fidelidade</p>
-                <p>• Conversão automática para MP3</p>
+                <p>• Áudio original (sem recodificar) ou MP3 320kbps</p>
             </div>
             """, unsafe_allow_html=True)
             
             url = st.text_input("Cole o link do YouTube:", 
                               placeholder="https://www.youtube.com/watch?v=...")
             
-            if st.button("🎵 Converter para MP3", type="primary"):
+            output_format = st.radio(
+                "Formato de saída:",
+                ["Original (M4A/Opus, sem recodificar)", "MP3 320kbps"],
+                help="O formato original é muito mais rápido: o áudio é salvo sem conversão."
+            )
+            audio_format = 'mp3' if output_format == "MP3 320kbps" else 'original'
+            button_label = "🎵 Converter para MP3" if audio_format == 'mp3' else "🎵 Baixar áudio original"
+            
+            if st.button(button_label, type="primary"):
                 if url and is_valid_url(url):
                     platform = detect_platform(url)
                     if platform == 'youtube':
                         download_id = add_download(url, platform, 'audio')
                         threading.Thread(
                             target=download_youtube_video,
-                            args=(download_id, url, 'audio')
+                            args=(download_id, url, 'audio', audio_format)
                         ).start()
                         st.success("🎉 Conversão iniciada! Acompanhe o progresso abaixo.")
                         time.sleep(1)
@@ -461,7 +454,10 @@ def main():
     # Área principal - Lista de downloads
     st.markdown("## 📋 Histórico de Conversões")
     
-    downloads = get_downloads()
+    # Paginação por cursor: a pilha guarda o início de cada página já vista
+    if 'history_cursors' not in st.session_state:
+        st.session_state.history_cursors = [None]
+    downloads, next_cursor = get_downloads(st.session_state.history_cursors[-1])
     
     if downloads:
         for download in downloads:
@@ -526,10 +522,28 @@ def main():
                 st.markdown('</div>', unsafe_allow_html=True)
                 st.markdown("---")
         
+        # Navegação entre páginas do histórico
+        page_number = len(st.session_state.history_cursors)
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if page_number > 1 and st.button("⬅️ Mais recentes"):
+                st.session_state.history_cursors.pop()
+                st.rerun()
+        with col_page:
+            st.markdown(f"Página {page_number} · {sqlite_db.count(DB_PATH, 'downloads')} conversões no total")
+        with col_next:
+            if next_cursor and st.button("Mais antigos ➡️"):
+                st.session_state.history_cursors.append(next_cursor)
+                st.rerun()
+        
         # Auto-refresh para downloads em andamento
         if any(download[5] == 'downloading' for download in downloads):
             time.sleep(2)
             st.rerun()
+    elif len(st.session_state.history_cursors) > 1:
+        # A página ficou vazia (ex.: itens deletados); voltar para a primeira
+        st.session_state.history_cursors = [None]
+        st.rerun()
     else:
         st.info("🎵 Nenhuma conversão encontrada. Use o painel lateral para iniciar uma nova conversão.")
 
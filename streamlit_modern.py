@@ -5,7 +5,7 @@ import re
 import threading
 import time
 from datetime import datetime
-import sqlite3
+import sqlite_db
 import shutil
 import subprocess
 from pathlib import Path
@@ -84,85 +84,68 @@ FFMPEG_AVAILABLE = os.path.exists(FFMPEG_PATH) and os.path.exists(FFPROBE_PATH)
 
 # Banco de dados
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS downloads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            url TEXT,
-            title TEXT,
-            platform TEXT,
-            format_type TEXT DEFAULT 'audio',
-            quality TEXT DEFAULT 'best',
-            status TEXT DEFAULT 'pending',
-            progress INTEGER DEFAULT 0,
-            filename TEXT,
-            file_size TEXT,
-            error_message TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_local_file BOOLEAN DEFAULT 0
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS downloads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT,
+                title TEXT,
+                platform TEXT,
+                format_type TEXT DEFAULT 'audio',
+                quality TEXT DEFAULT 'best',
+                status TEXT DEFAULT 'pending',
+                progress INTEGER DEFAULT 0,
+                filename TEXT,
+                file_size TEXT,
+                error_message TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                is_local_file BOOLEAN DEFAULT 0
+            )
+        ''')
+    sqlite_db.index_history(DB_PATH, 'downloads')
 
 def add_download(url, platform, format_type, quality='best', is_local_file=False):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO downloads (url, platform, format_type, quality, is_local_file)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (url, platform, format_type, quality, is_local_file))
-    download_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute('''
+            INSERT INTO downloads (url, platform, format_type, quality, is_local_file)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (url, platform, format_type, quality, is_local_file))
+        download_id = cursor.lastrowid
     return download_id
 
-def get_downloads():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM downloads ORDER BY created_at DESC')
-    downloads = cursor.fetchall()
-    conn.close()
-    return downloads
+def get_downloads(cursor=None):
+    """Página do histórico (mais recentes primeiro) e o cursor da próxima"""
+    return sqlite_db.page(DB_PATH, 'downloads', cursor=cursor)
 
 def update_download(download_id, **kwargs):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    updates = []
-    params = []
-    
-    for key, value in kwargs.items():
-        if value is not None:
-            updates.append(f"{key} = ?")
-            params.append(value)
-    
-    if updates:
-        params.append(download_id)
-        query = f"UPDATE downloads SET {', '.join(updates)} WHERE id = ?"
-        cursor.execute(query, params)
-        conn.commit()
-    
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        updates = []
+        params = []
+        
+        for key, value in kwargs.items():
+            if value is not None:
+                updates.append(f"{key} = ?")
+                params.append(value)
+        
+        if updates:
+            params.append(download_id)
+            query = f"UPDATE downloads SET {', '.join(updates)} WHERE id = ?"
+            cursor.execute(query, params)
 
 def delete_download(download_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT filename FROM downloads WHERE id = ?", (download_id,))
-    result = cursor.fetchone()
-    
-    if result and result[0]:
-        file_path = os.path.join(DOWNLOADS_DIR, result[0])
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
-    
-    cursor.execute("DELETE FROM downloads WHERE id = ?", (download_id,))
-    conn.commit()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute("SELECT filename FROM downloads WHERE id = ?", (download_id,))
+        result = cursor.fetchone()
+        
+        if result and result[0]:
+            file_path = os.path.join(DOWNLOADS_DIR, result[0])
+            if os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                except:
+                    pass
+        
+        cursor.execute("DELETE FROM downloads WHERE id = ?", (download_id,))
 
 def is_valid_url(url):
     return url.startswith('http')
@@ -274,7 +257,7 @@ def download_youtube_video(download_id, url, format_type, quality):
             
             update_download(download_id, title=title, progress=10)
             
-            ydl.download([url])
+            info = ydl.process_ie_result(info, download=True)
             
             update_download(download_id, status='completed', progress=100)
     
@@ -378,7 +361,10 @@ def main():
     # Downloads
     st.markdown("## 📋 Downloads")
     
-    downloads = get_downloads()
+    # Paginação por cursor: a pilha guarda o início de cada página já vista
+    if 'history_cursors' not in st.session_state:
+        st.session_state.history_cursors = [None]
+    downloads, next_cursor = get_downloads(st.session_state.history_cursors[-1])
     
     if downloads:
         for download in downloads:
@@ -439,9 +425,27 @@ def main():
                 
                 st.markdown('</div>', unsafe_allow_html=True)
         
+        # Navegação entre páginas do histórico
+        page_number = len(st.session_state.history_cursors)
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if page_number > 1 and st.button("⬅️ Mais recentes"):
+                st.session_state.history_cursors.pop()
+                st.rerun()
+        with col_page:
+            st.markdown(f"Página {page_number} · {sqlite_db.count(DB_PATH, 'downloads')} downloads no total")
+        with col_next:
+            if next_cursor and st.button("Mais antigos ➡️"):
+                st.session_state.history_cursors.append(next_cursor)
+                st.rerun()
+        
         if any(download[6] == 'downloading' for download in downloads):
             time.sleep(2)
             st.rerun()
+    elif len(st.session_state.history_cursors) > 1:
+        # A página ficou vazia (ex.: itens deletados); voltar para a primeira
+        st.session_state.history_cursors = [None]
+        st.rerun()
     else:
         st.info("🎵 Nenhum download. Use o painel lateral.")
 
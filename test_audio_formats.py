@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Check that audio jobs take the cheapest correct path to their output.
+
+    python -m pytest test_audio_formats.py
+"""
+import yt_dlp
+from audio_formats import audio_plan, is_audio_format
+from fetch_worker import ydl_options
+
+# (target, source acodec, source ext, source has video) -> (action, output ext)
+PLANS = {
+    # The published stream as it is
+    ('original', 'opus', 'webm', False): ('keep', 'webm'),
+    ('original', 'mp4a.40.2', 'm4a', False): ('keep', 'm4a'),
+    ('original', 'mp4a.40.2', 'mp4', True): ('copy', 'm4a'),
+    ('original', 'opus', 'webm', True): ('copy', 'opus'),
+    ('original', 'vorbis', 'webm', True): ('copy', 'ogg'),
+    ('original', 'flac', 'mkv', True): ('keep', 'mkv'),
+    # Already in the requested codec and container
+    ('mp3', 'mp3', 'mp3', False): ('keep', 'mp3'),
+    ('m4a', 'mp4a.40.2', 'm4a', False): ('keep', 'm4a'),
+    ('opus', 'opus', 'opus', False): ('keep', 'opus'),
+    # Right codec, wrong container: remux without re-encoding
+    ('m4a', 'mp4a.40.2', 'mp4', True): ('copy', 'm4a'),
+    ('opus', 'opus', 'webm', False): ('copy', 'opus'),
+    ('mp3', 'mp3', 'mp4', True): ('copy', 'mp3'),
+    # Another codec: encode
+    ('mp3', 'opus', 'webm', False): ('encode', 'mp3'),
+    ('mp3', 'mp4a.40.2', 'm4a', False): ('encode', 'mp3'),
+    ('m4a', 'opus', 'webm', False): ('encode', 'm4a'),
+    ('opus', 'mp4a.40.2', 'mp4', True): ('encode', 'opus'),
+    ('mp3', None, 'mp4', True): ('encode', 'mp3'),
+}
+
+
+def test_plans():
+    for (target, acodec, ext, has_video), expected in PLANS.items():
+        plan = audio_plan(target, acodec, ext, has_video)
+        assert (plan['action'], plan['ext']) == expected, (target, acodec, ext, has_video)
+
+
+def test_ffmpeg_arguments_follow_the_action():
+    assert audio_plan('mp3', 'mp3', 'mp3', False)['args'] == []
+    assert audio_plan('opus', 'opus', 'webm', False)['args'] == ['-c:a', 'copy', '-f', 'opus']
+    assert audio_plan('mp3', 'opus', 'webm', False)['args'] == ['-c:a', 'libmp3lame', '-b:a', '192k', '-f', 'mp3']
+
+
+def test_audio_format_names():
+    for name in ('original', 'mp3', 'm4a', 'opus'):
+        assert is_audio_format(name)
+    assert not is_audio_format('flac')
+    assert not is_audio_format('best')
+
+
+def test_outputs_of_the_same_video_get_their_own_files():
+    info = {'id': 'abc', 'title': 'Clip', 'ext': 'webm'}
+    names = set()
+    for format_type, audio_format in (('video', 'original'), ('audio', 'original'), ('audio', 'mp3'), ('audio', 'opus')):
+        with yt_dlp.YoutubeDL(ydl_options(format_type, audio_format, 'downloads')) as ydl:
+            names.add(ydl.prepare_filename(info))
+    assert len(names) == 4
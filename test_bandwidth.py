@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Check what the bandwidth governor charges a job for.
+
+    python -m pytest test_bandwidth.py
+"""
+from bandwidth import BandwidthGovernor
+
+
+def test_resumed_partial_file_is_not_charged():
+    governor = BandwidthGovernor(limit=1000)
+    governor.register(1, resumed_bytes=10_000_000)
+    # yt-dlp counts the bytes that were already on disk
+    governor.consume(1, 10_000_500)
+    assert governor.stats()['jobs'][1]['bytes'] == 500
+
+
+def test_next_file_of_a_job_starts_from_zero():
+    governor = BandwidthGovernor()
+    governor.register(1)
+    governor.consume(1, 800)
+    governor.consume(1, 300)
+    assert governor.stats()['jobs'][1]['bytes'] == 1100
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Check that the URL variants of one video share a deduplication key.
+
+    python -m pytest test_canonical.py
+"""
+from canonical import media_id, media_key, canonical_url
+
+# Every way of linking the same video must map to the same media id
+VARIANTS = {
+    ('youtube', 'dQw4w9WgXcQ'): [
+        'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+        'https://youtube.com/watch?v=dQw4w9WgXcQ',
+        'https://youtu.be/dQw4w9WgXcQ',
+        'https://youtu.be/dQw4w9WgXcQ?si=tracking',
+        'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=10',
+        'https://www.youtube.com/watch?t=10s&v=dQw4w9WgXcQ&list=PL123',
+        'https://m.youtube.com/watch?v=dQw4w9WgXcQ',
+        'https://music.youtube.com/watch?v=dQw4w9WgXcQ',
+        'https://www.youtube.com/shorts/dQw4w9WgXcQ',
+        'https://www.youtube.com/embed/dQw4w9WgXcQ',
+        'https://www.youtube-nocookie.com/embed/dQw4w9WgXcQ',
+        '  https://WWW.YOUTUBE.COM/watch?v=dQw4w9WgXcQ  ',
+    ],
+    ('instagram', 'C1a2B3c4D5e'): [
+        'https://www.instagram.com/p/C1a2B3c4D5e/',
+        'https://instagram.com/p/C1a2B3c4D5e',
+        'https://www.instagram.com/reel/C1a2B3c4D5e/?igsh=tracking',
+        'https://www.instagram.com/someuser/p/C1a2B3c4D5e/',
+        'https://instagr.am/p/C1a2B3c4D5e/',
+    ],
+}
+
+# Pages that are not one video: no id, so no deduplication
+NOT_A_VIDEO = [
+    'https://www.youtube.com/@somechannel',
+    'https://www.youtube.com/playlist?list=PL123',
+    'https://www.youtube.com/watch?v=tooshort',
+    'https://www.instagram.com/someuser/',
+]
+
+
+def test_variants_share_a_media_id():
+    for expected, urls in VARIANTS.items():
+        for url in urls:
+            assert media_id(url) == expected, url
+
+
+def test_variants_share_a_key_and_canonical_url():
+    for urls in VARIANTS.values():
+        assert len({media_key(url, 'video') for url in urls}) == 1
+        assert len({canonical_url(url) for url in urls}) == 1
+
+
+def test_key_tells_formats_and_qualities_apart():
+    url = 'https://youtu.be/dQw4w9WgXcQ'
+    assert media_key(url, 'video') == 'youtube:dQw4w9WgXcQ:video:best'
+    assert media_key(url, 'audio', quality='mp3') == 'youtube:dQw4w9WgXcQ:audio:mp3'
+    assert media_key(url, 'audio', quality='mp3') != media_key(url, 'audio', quality='opus')
+
+
+def test_pages_without_a_video_have_no_key():
+    for url in NOT_A_VIDEO:
+        assert media_key(url, 'video') is None, url
+    assert media_id('https://example.com/video.mp4') == (None, None)
+    assert canonical_url(' https://example.com/video.mp4 ') == 'https://example.com/video.mp4'
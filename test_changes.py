@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Check that polling /api/downloads/changes never skips a write.
+
+Versions are stamped before the write commits, so a write can commit with a
+version below one a client has already been given as its cursor.
+
+    python -m pytest test_changes.py
+"""
+import time
+from app import app, db
+from models import Download, next_version
+from history import changes_since, latest_version, settled_version
+
+SETTLE_MS = 200
+
+
+def poll(cursor):
+    rows, cursor, _ = changes_since(cursor, 50, settled_version(SETTLE_MS))
+    return [row.id for row in rows], cursor
+
+
+def test_late_commit_below_the_cursor_is_not_skipped():
+    with app.app_context():
+        rows = [Download(url=f'https://example.com/{i}.mp4', status='pending') for i in range(3)]
+        db.session.add_all(rows)
+        db.session.commit()
+        first, second, third = (row.id for row in rows)
+        time.sleep(SETTLE_MS / 1000)
+        cursor = latest_version(settled_version(SETTLE_MS))
+
+        # A updates the first row; B stamps the third one, then stalls before writing
+        Download.query.filter_by(id=first).update({'progress': 10})
+        stalled = next_version()
+        # A updates the second row and commits, with a version above B's
+        Download.query.filter_by(id=second).update({'progress': 20})
+        db.session.commit()
+
+        ids, cursor = poll(cursor)
+        assert ids == []
+
+        # B commits with its earlier stamp
+        Download.query.filter_by(id=third).update({'progress': 30, 'version': stalled})
+        db.session.commit()
+
+        time.sleep(SETTLE_MS / 1000)
+        ids, cursor = poll(cursor)
+        assert sorted(ids) == sorted([first, second, third])
+        assert poll(cursor)[0] == []
+
+
+def test_unsettled_writes_wait_for_the_next_poll():
+    with app.app_context():
+        time.sleep(SETTLE_MS / 1000)
+        cursor = latest_version(settled_version(SETTLE_MS))
+        download = Download(url='https://example.com/new.mp4', status='pending')
+        db.session.add(download)
+        db.session.commit()
+
+        ids, cursor = poll(cursor)
+        assert download.id not in ids
+        assert latest_version(settled_version(SETTLE_MS)) < download.version
+
+        time.sleep(SETTLE_MS / 1000)
+        assert poll(cursor)[0] == [download.id]
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Check the ranged reads that feed audio into FFmpeg while it downloads, and
+the retry of a download whose cached format URLs were rejected.
+
+    python -m pytest test_downloader.py
+"""
+import io
+import pytest
+import yt_dlp
+from yt_dlp.networking import Response
+from yt_dlp.networking.exceptions import HTTPError, TransportError
+# The app first: its routes import the downloader
+import app
+import downloader
+from downloader import VideoDownloader
+
+BODY = bytes(range(10))
+
+
+class Server:
+    """Stands in for ydl.urlopen: answers each request with the next scripted reply.
+
+    A reply is an exception to raise, or (status, body, headers); with
+    ranged=True a 206 reply is cut to the requested range.
+    """
+
+    def __init__(self, *replies, ranged=True):
+        self.replies = list(replies)
+        self.ranged = ranged
+        self.ranges = []
+
+    def urlopen(self, request):
+        self.ranges.append(request.headers.get('Range'))
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        status, body, headers = reply
+        if status == 206 and self.ranged:
+            start, _, end = self.ranges[-1][len('bytes='):].partition('-')
+            end = min(int(end) if end else len(body) - 1, len(body) - 1)
+            headers = dict(headers, **{'Content-Range': f'bytes {start}-{end}/{len(body)}'})
+            body = body[int(start):end + 1]
+        return Response(io.BytesIO(body), 'https://example.com/audio', headers, status=status)
+
+
+class FakeYDL:
+    def __init__(self, server, retries=3):
+        self.params = {'retries': retries}
+        self.urlopen = server.urlopen
+
+
+def http_error(status):
+    return HTTPError(Response(io.BytesIO(b''), 'https://example.com/audio', {}, status=status))
+
+
+def read(server, chunk_size=None, total=None):
+    selected = {'url': 'https://example.com/audio'}
+    if chunk_size:
+        selected['downloader_options'] = {'http_chunk_size': chunk_size}
+    fetch = {'total': total}
+    data = b''.join(VideoDownloader()._ranged_chunks(FakeYDL(server), selected, fetch))
+    return data, fetch
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(downloader.time, 'sleep', lambda seconds: None)
+
+
+def test_chunked_reads_walk_the_file_in_ranges():
+    server = Server(*[(206, BODY, {})] * 3)
+    data, fetch = read(server, chunk_size=4)
+    assert data == BODY
+    assert server.ranges == ['bytes=0-3', 'bytes=4-7', 'bytes=8-11']
+    # The size comes from Content-Range when the info did not have it
+    assert fetch['total'] == len(BODY)
+
+
+def test_short_read_resumes_from_the_last_byte():
+    server = Server((200, BODY[:6], {'Content-Length': '10'}), (206, BODY, {}))
+    data, _ = read(server)
+    assert data == BODY
+    assert server.ranges == [None, 'bytes=6-']
+
+
+def test_network_error_resumes_from_the_offset():
+    server = Server((206, BODY, {}), TransportError('connection reset'), (206, BODY, {}), (206, BODY, {}))
+    data, _ = read(server, chunk_size=4)
+    assert data == BODY
+    assert server.ranges == ['bytes=0-3', 'bytes=4-7', 'bytes=4-7', 'bytes=8-11']
+
+
+def test_throttling_and_server_errors_are_retried():
+    server = Server(http_error(429), http_error(503), (200, BODY, {'Content-Length': '10'}))
+    data, _ = read(server)
+    assert data == BODY
+    assert len(server.ranges) == 3
+
+
+def test_retries_run_out():
+    server = Server(*[http_error(500)] * 4)
+    with pytest.raises(yt_dlp.utils.DownloadError):
+        read(server)
+    assert len(server.ranges) == 4
+
+
+def test_client_errors_are_raised_at_once():
+    server = Server(http_error(403), (200, BODY, {}))
+    with pytest.raises(HTTPError):
+        read(server)
+    assert len(server.ranges) == 1
+
+
+def test_server_ignoring_the_resume_range_fails_the_read():
+    server = Server((200, BODY[:6], {'Content-Length': '10'}), (200, BODY, {'Content-Length': '10'}), ranged=False)
+    with pytest.raises(yt_dlp.utils.DownloadError):
+        read(server)
+
+
+def test_stream_rejected_with_cached_formats_is_retried_after_a_refresh(monkeypatch):
+    fetcher = VideoDownloader()
+    extracted = []
+    attempts = []
+
+    def extract_info(ydl, url, refresh=False, platform=None):
+        extracted.append(refresh)
+        return {'id': 'abc', 'title': 'Clip', 'fresh': refresh}, not refresh
+
+    def download(ydl, info, download_id, format_type, audio_format, job):
+        attempts.append(info['fresh'])
+        if not info['fresh']:
+            # Stale signed URLs are refused while streaming into FFmpeg
+            raise http_error(403)
+        return 'downloads/Clip.mp3', None
+
+    monkeypatch.setattr(fetcher, '_extract_info', extract_info)
+    monkeypatch.setattr(fetcher, '_record_info', lambda *args: None)
+    monkeypatch.setattr(fetcher, '_download', download)
+    job = {'timings': {'postprocess': 0}, 'filepath': None, 'platform': 'youtube'}
+
+    assert fetcher._fetch(1, 'https://example.com/clip', 'audio', 'mp3', None, job) == ('downloads/Clip.mp3', None)
+    assert extracted == [False, True]
+    assert attempts == [False, True]
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Check that live event clients get every change written to the database.
+
+    python -m pytest test_events.py
+"""
+from sqlalchemy import update
+from app import app, db
+from models import Download, next_version
+from events import EventBus, ChangeFeed, Subscription, sse_stream
+from inflight import InflightRegistry
+
+
+def drain(bus, subscription, seq):
+    """(kind, payload) pairs delivered to a subscription after seq, and the latest seq"""
+    payloads = []
+    for event_seq, kind, data in bus.wait(seq, 0) or []:
+        payloads += [(kind, payload) for payload in subscription.deliver(kind, data)]
+        seq = event_seq
+    return payloads, seq
+
+
+def stream(bus, last_event_id):
+    """(id, event) of each SSE event sent for download 1 after last_event_id"""
+    lines = ''.join(sse_stream(
+        bus, lambda: Subscription([Download(id=1)]), last_event_id, heartbeat=0.01, max_seconds=0.05,
+    )).split('\n')
+    return [(line[len('id: '):], following[len('event: '):]) for line, following in zip(lines, lines[1:]) if line.startswith('id: ')]
+
+
+def publish_progress(bus, count):
+    for progress in range(count):
+        bus.publish('progress', {'id': 1, 'source_id': None, 'status': 'downloading', 'progress': progress})
+
+
+def add(**fields):
+    with app.app_context():
+        download = Download(url='https://example.com/a.mp4', media_key='a', **fields)
+        db.session.add(download)
+        db.session.commit()
+        return download.id
+
+
+def test_changes_written_by_another_process_are_published():
+    bus = EventBus()
+    feed = ChangeFeed(bus)
+    feed.poll()
+    job = add(status='downloading')
+    feed.poll()
+    subscription = Subscription([Download(id=job)])
+    seq = bus.latest()
+
+    with app.app_context():
+        # Another process stamps a write, then stalls while a newer write is
+        # published; its commit still reaches the feed
+        stalled = next_version()
+        add(status='pending')
+        feed.poll()
+        with db.engine.begin() as conn:
+            conn.execute(update(Download).where(Download.id == job).values(progress=40, version=stalled))
+    feed.poll()
+    payloads, seq = drain(bus, subscription, seq)
+    assert [(kind, payload['id'], payload['progress']) for kind, payload in payloads] == [('progress', job, 40)]
+
+    # Read again on the next poll, but published once
+    feed.poll()
+    assert drain(bus, subscription, seq)[0] == []
+
+
+def test_follower_moves_to_its_new_leader_when_the_leader_is_cancelled():
+    bus = EventBus()
+    feed = ChangeFeed(bus)
+    feed.poll()
+    leader = add(status='downloading')
+    first = add(status='downloading', source_id=leader)
+    second = add(status='downloading', source_id=leader)
+    feed.poll()
+    subscription = Subscription([Download(id=second, source_id=leader)])
+    seq = bus.latest()
+
+    with app.app_context():
+        download = db.session.get(Download, leader)
+        InflightRegistry('.').release(download)
+        download.status = 'cancelled'
+        db.session.commit()
+    feed.poll()
+    payloads, seq = drain(bus, subscription, seq)
+    # The follower is re-pointed before the old leader's cancellation arrives
+    assert [(kind, payload['id'], payload['source_id']) for kind, payload in payloads] == [
+        ('status', second, first),
+    ]
+
+    # From now on the new leader's events reach the follower, once
+    with app.app_context():
+        download = db.session.get(Download, first)
+        download.status = 'completed'
+        download.sync_followers()
+        db.session.commit()
+    feed.poll()
+    payloads, seq = drain(bus, subscription, seq)
+    assert [(kind, payload['id'], payload['status']) for kind, payload in payloads] == [
+        ('completed', second, 'completed'),
+    ]
+
+
+def test_reconnect_replays_the_missed_events():
+    bus = EventBus()
+    publish_progress(bus, 5)
+    assert stream(bus, f'{bus.epoch}-3') == [(f'{bus.epoch}-4', 'progress'), (f'{bus.epoch}-5', 'progress')]
+
+
+def test_reconnect_past_the_buffer_resets():
+    bus = EventBus(buffer_size=3)
+    publish_progress(bus, 5)
+    # Events 2 and 3 fell out of the buffer
+    assert stream(bus, f'{bus.epoch}-1') == [(f'{bus.epoch}-5', 'reset')]
+    assert stream(bus, f'{bus.epoch}-2') == [(f'{bus.epoch}-3', 'progress'), (f'{bus.epoch}-4', 'progress'), (f'{bus.epoch}-5', 'progress')]
+
+
+def test_ids_from_another_process_reset():
+    bus = EventBus()
+    publish_progress(bus, 2)
+    assert stream(bus, 'f00dcafe-1') == [(f'{bus.epoch}-2', 'reset')]
+    # A first connection starts from now
+    assert stream(bus, None) == []
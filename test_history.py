@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Check that the history pages through every download exactly once.
+
+    python -m pytest test_history.py
+"""
+import base64
+from datetime import datetime, timedelta
+from app import app, db
+from models import Download
+from history import history_page, encode_cursor, decode_cursor
+
+
+def add_history(created_at):
+    """Replace the history with one download per created_at value, in order"""
+    with app.app_context():
+        Download.query.delete()
+        rows = [Download(url=f'https://example.com/{i}.mp4', status='completed', created_at=at) for i, at in enumerate(created_at)]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [row.id for row in rows]
+
+
+def walk(limit):
+    """Ids of every page of the history, newest first"""
+    pages = []
+    cursor = None
+    with app.app_context():
+        while True:
+            rows, cursor = history_page([], limit, cursor)
+            pages.append([row.id for row in rows])
+            if not cursor:
+                return pages
+
+
+def test_cursor_round_trip():
+    with app.app_context():
+        download = Download(id=42, created_at=datetime(2026, 3, 1, 12, 30, 15, 250))
+        assert decode_cursor(encode_cursor(download)) == (download.created_at, 42)
+
+
+def test_pages_split_rows_sharing_a_created_at():
+    start = datetime(2026, 1, 1)
+    # Imports and batch submissions stamp several rows with the same time
+    ids = add_history([start] * 5 + [start + timedelta(seconds=1)] * 2)
+    pages = walk(3)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [download_id for page in pages for download_id in page] == list(reversed(ids))
+
+
+def test_last_full_page_has_no_cursor():
+    add_history([datetime(2026, 1, 1) + timedelta(seconds=i) for i in range(4)])
+    assert [len(page) for page in walk(2)] == [2, 2]
+
+
+def test_api_rejects_malformed_cursors():
+    add_history([datetime(2026, 1, 1)] * 3)
+    client = app.test_client()
+    response = client.get('/api/downloads?limit=2')
+    assert response.status_code == 200
+    cursor = response.headers['X-Next-Cursor']
+    assert len(client.get(f'/api/downloads?limit=2&cursor={cursor}').get_json()) == 1
+
+    garbled = [
+        'abc',
+        base64.urlsafe_b64encode(b'not a cursor').decode(),
+        base64.urlsafe_b64encode(b'2026-01-01T00:00:00|x').decode(),
+        base64.urlsafe_b64encode(b'yesterday|1').decode(),
+    ]
+    for cursor in garbled:
+        response = client.get(f'/api/downloads?cursor={cursor}')
+        assert response.status_code == 400, cursor
+        assert response.get_json() == {'error': 'Cursor inválido.'}
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Check that submissions for the same media share one job, and that the job
+carries on under a follower when its leader goes away.
+
+    python -m pytest test_inflight.py
+"""
+from datetime import datetime, timedelta
+from app import app, db
+from models import Download
+from inflight import InflightRegistry
+
+KEY = 'youtube:dQw4w9WgXcQ:video:best'
+URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+
+
+def submit(registry, **fields):
+    download, outcome = registry.submit(URL, KEY, 'youtube', 'video', **fields)
+    return download.id, outcome
+
+
+def test_duplicate_submission_follows_the_in_flight_job():
+    with app.app_context():
+        Download.query.delete()
+        registry = InflightRegistry('downloads')
+        leader, outcome = submit(registry)
+        assert outcome == 'queued'
+        follower, outcome = submit(registry, priority=2)
+        assert outcome == 'attached'
+
+        assert db.session.get(Download, follower).source_id == leader
+        # The shared job runs at its most urgent submitter's priority
+        assert db.session.get(Download, leader).priority == 2
+
+
+def test_job_claimed_after_a_concurrent_duplicate_is_attached():
+    with app.app_context():
+        Download.query.delete()
+        # Two processes created a leader each for the same media
+        older, newer = (Download(url=URL, media_key=KEY, status='pending') for _ in range(2))
+        db.session.add(older)
+        db.session.commit()
+        db.session.add(newer)
+        db.session.commit()
+        follower = Download(url=URL, media_key=KEY, status='pending', source_id=newer.id)
+        db.session.add(follower)
+        db.session.commit()
+        older, newer, follower = older.id, newer.id, follower.id
+    registry = InflightRegistry('downloads')
+
+    assert not registry.attach_if_duplicate(older)
+    assert registry.attach_if_duplicate(newer)
+    with app.app_context():
+        assert db.session.get(Download, newer).source_id == older
+        # Its own followers move along with it
+        assert db.session.get(Download, follower).source_id == older
+
+
+def test_oldest_follower_takes_over_a_released_job():
+    with app.app_context():
+        Download.query.delete()
+        registry = InflightRegistry('downloads', handover_seconds=30)
+        leader, _ = submit(registry)
+        first, _ = submit(registry)
+        second, _ = submit(registry)
+        download = db.session.get(Download, leader)
+        download.status = 'downloading'
+        download.part_path = 'downloads/video.mp4.part'
+        db.session.commit()
+
+        registry.release(download)
+        download.status = 'cancelled'
+        db.session.commit()
+
+        new_leader = db.session.get(Download, first)
+        assert new_leader.source_id is None
+        assert new_leader.status == 'pending'
+        # It resumes the partial file, once the old writer had time to stop
+        assert new_leader.part_path == 'downloads/video.mp4.part'
+        assert new_leader.next_attempt_at > datetime.utcnow() + timedelta(seconds=20)
+        assert db.session.get(Download, second).source_id == first
+
+
+def test_queued_job_hands_over_at_once():
+    with app.app_context():
+        Download.query.delete()
+        registry = InflightRegistry('downloads', handover_seconds=30)
+        leader, _ = submit(registry)
+        follower, _ = submit(registry)
+
+        # Nothing is writing the file of a job that never started
+        registry.release(db.session.get(Download, leader))
+        db.session.commit()
+        new_leader = db.session.get(Download, follower)
+        assert new_leader.source_id is None
+        assert new_leader.next_attempt_at is None
+
+
+def test_shared_files_are_in_use():
+    with app.app_context():
+        Download.query.delete()
+        done = Download(url=URL, status='completed', filename='video.mp4')
+        reused = Download(url=URL, status='completed', filename='video.mp4')
+        fetching = Download(url=URL, status='processing', source_path='downloads/audio.webm')
+        db.session.add_all([done, reused, fetching])
+        db.session.commit()
+        registry = InflightRegistry('downloads')
+
+        assert registry.file_in_use(done)
+        db.session.delete(reused)
+        db.session.commit()
+        assert not registry.file_in_use(done)
+        assert registry.file_in_use(done, 'downloads/audio.webm')
+        assert not registry.file_in_use(fetching, 'downloads/audio.webm')
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Check that leased claims hand each job to exactly one worker.
+
+Runs with no queue workers, so every claim is made by the test itself.
+
+    python -m pytest test_job_queue.py
+"""
+from datetime import datetime, timedelta
+from app import app, db
+from models import Download
+from job_queue import JobQueue
+from scheduler import Scheduler
+
+
+def queue_jobs(count):
+    """Empty the queue, then add pending jobs in submission order"""
+    with app.app_context():
+        Download.query.delete()
+        start = datetime.utcnow() - timedelta(minutes=10)
+        rows = [
+            Download(url=f'https://example.com/{i}.mp4', status='pending', created_at=start + timedelta(seconds=i))
+            for i in range(count)
+        ]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [row.id for row in rows]
+
+
+class RivalFirst(Scheduler):
+    """Lets a rival worker claim between reading the candidates and the compare-and-swap"""
+
+    def __init__(self, rival):
+        super().__init__()
+        self.rival = rival
+        self.rival_claimed = None
+
+    def candidates(self, claimable, limit=5):
+        ids = db.session.execute(super().candidates(claimable, limit)).scalars().all()
+        self.rival_claimed = self.rival.claim()
+        return db.select(Download.id).where(Download.id.in_(ids)).order_by(Download.id)
+
+
+def test_claim_lost_to_another_worker_moves_on():
+    first, second = queue_jobs(2)
+    scheduler = RivalFirst(JobQueue())
+    worker = JobQueue(scheduler=scheduler)
+
+    assert worker.claim() == second
+    assert scheduler.rival_claimed == first
+    with app.app_context():
+        assert db.session.get(Download, first).worker_id == scheduler.rival.worker_id
+        assert db.session.get(Download, second).worker_id == worker.worker_id
+
+
+def test_claim_lost_on_the_only_job_returns_nothing():
+    only, = queue_jobs(1)
+    scheduler = RivalFirst(JobQueue())
+    worker = JobQueue(scheduler=scheduler)
+
+    assert worker.claim() is None
+    assert scheduler.rival_claimed == only
+    with app.app_context():
+        download = db.session.get(Download, only)
+        assert download.worker_id == scheduler.rival.worker_id
+        assert download.attempts == 1
+
+
+def test_expired_lease_is_reclaimed():
+    job, = queue_jobs(1)
+    dead, alive = JobQueue(), JobQueue()
+
+    assert dead.claim() == job
+    # A live lease keeps the job with its worker
+    assert alive.claim() is None
+
+    with app.app_context():
+        # The worker died: its lease ran out without a heartbeat
+        db.session.get(Download, job).lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+
+    assert alive.claim() == job
+    with app.app_context():
+        download = db.session.get(Download, job)
+        assert download.worker_id == alive.worker_id
+        assert download.status == 'downloading'
+        assert download.attempts == 2
+    # The dead worker's heartbeat no longer owns it
+    assert dead.heartbeat([job]) == set()
+    assert alive.heartbeat([job]) == {job}
+
+
+def test_row_left_running_without_a_lease_is_reclaimed():
+    job, = queue_jobs(1)
+    with app.app_context():
+        # Versions before the queue set 'downloading' with no worker or lease
+        db.session.get(Download, job).status = 'downloading'
+        db.session.commit()
+    worker = JobQueue()
+
+    assert worker.depth() == 1
+    assert worker.claim() == job
+    with app.app_context():
+        assert db.session.get(Download, job).worker_id == worker.worker_id
@@ -3,7 +3,7 @@ import streamlit as st
 import yt_dlp
 import os
 import shutil
-import sqlite3
+import sqlite_db
 import threading
 import time
 from datetime import datetime
@@ -22,63 +22,50 @@ FFMPEG_PATH = os.path.dirname(shutil.which('ffmpeg')) if shutil.which('ffmpeg')
 
 # Banco
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS debug_downloads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            url TEXT NOT NULL,
-            title TEXT,
-            format_type TEXT,
-            status TEXT DEFAULT 'pending',
-            progress INTEGER DEFAULT 0,
-            filename TEXT,
-            error_message TEXT,
-            logs TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS debug_downloads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                title TEXT,
+                format_type TEXT,
+                status TEXT DEFAULT 'pending',
+                progress INTEGER DEFAULT 0,
+                filename TEXT,
+                error_message TEXT,
+                logs TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
 
 def add_debug_download(url, format_type):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO debug_downloads (url, format_type)
-        VALUES (?, ?)
-    ''', (url, format_type))
-    download_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute('''
+            INSERT INTO debug_downloads (url, format_type)
+            VALUES (?, ?)
+        ''', (url, format_type))
+        download_id = cursor.lastrowid
     return download_id
 
 def update_debug_download(download_id, **kwargs):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    updates = []
-    params = []
-    
-    for key, value in kwargs.items():
-        if value is not None:
-            updates.append(f"{key} = ?")
-            params.append(value)
-    
-    if updates:
-        params.append(download_id)
-        query = f"UPDATE debug_downloads SET {', '.join(updates)} WHERE id = ?"
-        cursor.execute(query, params)
-        conn.commit()
-    
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        updates = []
+        params = []
+        
+        for key, value in kwargs.items():
+            if value is not None:
+                updates.append(f"{key} = ?")
+                params.append(value)
+        
+        if updates:
+            params.append(download_id)
+            query = f"UPDATE debug_downloads SET {', '.join(updates)} WHERE id = ?"
+            cursor.execute(query, params)
 
 def get_debug_downloads():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM debug_downloads ORDER BY created_at DESC')
-    downloads = cursor.fetchall()
-    conn.close()
+    with sqlite_db.transaction(DB_PATH) as cursor:
+        cursor.execute('SELECT * FROM debug_downloads ORDER BY created_at DESC')
+        downloads = cursor.fetchall()
     return downloads
 
 # Download com logs detalhados
@@ -134,38 +121,18 @@ def download_with_debug(download_id, url, format_type):
             logs.append(f"[{datetime.now()}] Título: {title}")
             update_debug_download(download_id, title=title, logs='\n'.join(logs))
             
-            # Listar arquivos antes do download
-            files_before = set(os.listdir(DOWNLOADS_DIR))
-            logs.append(f"[{datetime.now()}] Arquivos antes do download: {len(files_before)}")
-            
             # Download
             logs.append(f"[{datetime.now()}] Iniciando download...")
             update_debug_download(download_id, logs='\n'.join(logs))
             
-            ydl.download([url])
-            
-            # Listar arquivos após o download
-            files_after = set(os.listdir(DOWNLOADS_DIR))
-            new_files = files_after - files_before
-            
-            logs.append(f"[{datetime.now()}] Arquivos após download: {len(files_after)}")
-            logs.append(f"[{datetime.now()}] Novos arquivos: {list(new_files)}")
+            info = ydl.process_ie_result(info, download=True)
             
-            # Encontrar arquivo
+            # Caminho final informado pelo yt-dlp (após o pós-processamento)
             filename = None
-            
-            if format_type == 'audio':
-                # Procurar MP3
-                mp3_files = [f for f in new_files if f.endswith('.mp3')]
-                logs.append(f"[{datetime.now()}] Arquivos MP3 encontrados: {mp3_files}")
-                
-                if mp3_files:
-                    filename = mp3_files[0]
-                    logs.append(f"[{datetime.now()}] Arquivo MP3 selecionado: {filename}")
-            
-            if not filename and new_files:
-                filename = list(new_files)[0]
-                logs.append(f"[{datetime.now()}] Primeiro arquivo novo selecionado: {filename}")
+            for requested in info.get('requested_downloads') or []:
+                if requested.get('filepath'):
+                    filename = os.path.basename(requested['filepath'])
+                    logs.append(f"[{datetime.now()}] Arquivo final: {requested['filepath']}")
             
             if filename:
                 file_path = os.path.join(DOWNLOADS_DIR, filename)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Check that the hot Download queries are answered from selective indexes.
+
+Runs EXPLAIN on each query against a scratch SQLite database and, when
+QUERY_PLAN_POSTGRES_URL points to an empty PostgreSQL database, against
+PostgreSQL too. On SQLite the plans are checked again on a long history
+with ANALYZE statistics. On PostgreSQL sequential scans are disabled first: with a
+handful of rows the planner would rightly prefer them, and the question here
+is whether an index can serve the query at all.
+
+The queue queries are built by the job queue and scheduler themselves, so
+the plans checked are the plans the workers get. Searching them by
+`source_id IS NULL` counts as a failure too: nearly every row matches it.
+
+    python -m pytest -s test_query_plans.py
+    QUERY_PLAN_POSTGRES_URL=postgresql://localhost/plans python -m pytest -s test_query_plans.py
+"""
+import os
+import re
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine, func, or_, select, update
+from app import db
+from models import Download
+from inflight import IN_FLIGHT
+import routes
+
+KEY = 'youtube:dQw4w9WgXcQ:video:best'
+URL = 'https://example.com/video.mp4'
+CURSOR = (datetime(2026, 1, 1), 1000)
+NOW = datetime(2026, 1, 1)
+
+
+def hot_queries():
+    """The queries run on every submission, page load and queue poll"""
+    job_queue = routes.job_queue
+    return {
+        # inflight: join an in-flight job for the same media
+        'in-flight by media key': select(Download)
+            .where(Download.media_key == KEY, Download.source_id.is_(None), Download.status.in_(IN_FLIGHT))
+            .order_by(Download.id).limit(1),
+        # inflight: reuse a completed file for the same media
+        'completed by media key': select(Download)
+            .where(Download.media_key == KEY, Download.status == 'completed')
+            .order_by(Download.created_at.desc()).limit(1),
+        # inflight: URLs without a media id are matched exactly
+        'in-flight by url': select(Download)
+            .where(Download.url == URL, Download.source_id.is_(None), Download.status.in_(IN_FLIGHT))
+            .order_by(Download.id).limit(1),
+        # downloads page and /api/downloads
+        'history newest first': select(Download).order_by(Download.created_at.desc(), Download.id.desc()).limit(50),
+        'history page after cursor': select(Download)
+            .where(Download.created_at <= CURSOR[0], or_(Download.created_at < CURSOR[0], Download.id < CURSOR[1]))
+            .order_by(Download.created_at.desc(), Download.id.desc()).limit(51),
+        'history filtered by status': select(Download)
+            .where(Download.status.in_(('failed',)))
+            .order_by(Download.created_at.desc(), Download.id.desc()).limit(51),
+        # /api/downloads/changes polls
+        'changes since version': select(Download)
+            .where(Download.version > 1000).order_by(Download.version, Download.id).limit(51),
+        # job queue: claims with their batch and platform caps, and queue depths
+        'fetch claim candidates': routes.scheduler.candidates(job_queue._claimable(NOW, 'fetch', {'instagram'})),
+        'transcode claim candidates': routes.scheduler.candidates(job_queue._claimable(NOW, 'transcode')),
+        'fetch queue depth': select(func.count(Download.id)).where(job_queue._claimable(NOW, 'fetch')),
+        'transcode queue depth': select(func.count(Download.id)).where(job_queue._claimable(NOW, 'transcode')),
+        # worker stats
+        'running count': select(func.count(Download.id)).where(Download.status.in_(('downloading', 'processing'))),
+        'running per platform': select(Download.platform, func.count(Download.id))
+            .where(Download.status == 'downloading', Download.source_id.is_(None))
+            .group_by(Download.platform),
+    }
+
+
+def follower_queries():
+    """Lookups of the followers of one job, the only selective source_id searches"""
+    return {
+        'followers of a job': select(Download).where(Download.source_id == 1).order_by(Download.id),
+        'progress flush': update(Download)
+            .where(or_(Download.id == 1, Download.source_id == 1), Download.status.in_(('downloading', 'processing')))
+            .values(progress=50),
+    }
+
+
+def explain(conn, statement):
+    """Query plan lines for a statement on this connection's dialect"""
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = conn.exec_driver_sql(prefix + sql).all()
+    # SQLite: (id, parent, notused, detail); PostgreSQL: one text column per line
+    return [row[-1] for row in rows]
+
+
+# Queries that walk a whole index in order and stop at their LIMIT
+ORDERED_WALKS = ('history newest first',)
+
+
+def full_scans(conn, plan, name):
+    """Plan lines that read the whole download table or one of its full indexes"""
+    table = Download.__tablename__
+    if conn.dialect.name == 'sqlite':
+        scans = [line for line in plan if re.match(rf'SCAN {table}( |$)', line)]
+        if name in ORDERED_WALKS:
+            return [line for line in scans if 'INDEX' not in line]
+        # Partial queue indexes only hold the queued rows
+        return [line for line in scans if not re.search(r'INDEX ix_\w+_queue$', line)]
+    return [line for line in plan if f'Seq Scan on {table}' in line]
+
+
+def source_id_searches(conn, plan):
+    """Plan lines that search an index by source_id"""
+    if conn.dialect.name == 'sqlite':
+        return [line for line in plan if re.search(r'INDEX \w+ \(source_id=\?\)', line)]
+    return [line for line in plan if 'Index Cond' in line and 'source_id IS NULL' in line]
+
+
+def check_plans(engine):
+    db.metadata.create_all(engine)
+    queries = [(name, statement, False) for name, statement in hot_queries().items()]
+    queries += [(name, statement, True) for name, statement in follower_queries().items()]
+    failures = []
+    with engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            conn.exec_driver_sql('SET enable_seqscan = off')
+        for name, statement, by_leader in queries:
+            plan = explain(conn, statement)
+            problem = None
+            if full_scans(conn, plan, name):
+                problem = 'FULL SCAN'
+            elif not by_leader and source_id_searches(conn, plan):
+                problem = 'SOURCE_ID SEARCH'
+            print(f"[{conn.dialect.name}] {name}: {problem or 'ok'}")
+            for line in plan:
+                print(f"    {line}")
+            if problem:
+                failures.append(f"{conn.dialect.name}: {name} ({problem})")
+    return failures
+
+
+def test_sqlite_query_plans(module_database):
+    assert not check_plans(module_database)
+
+
+def test_sqlite_query_plans_with_statistics(module_database):
+    """ANALYZE averages rows per status over the history: the queue must not look big"""
+    db.metadata.create_all(module_database)
+    with module_database.begin() as conn:
+        conn.execute(Download.__table__.insert(), [
+            {'url': f'https://example.com/{i}.mp4', 'status': 'failed' if i % 7 == 0 else 'completed',
+             'created_at': datetime(2025, 1, 1), 'owner_key': f'owner{i % 50}'}
+            for i in range(5000)
+        ])
+        conn.execute(Download.__table__.insert(), [
+            {'url': f'https://example.com/queued{i}.mp4', 'status': status, 'created_at': datetime(2026, 1, 1)}
+            for i, status in enumerate(('pending', 'pending', 'downloading', 'processing'))
+        ])
+        conn.exec_driver_sql('ANALYZE')
+    assert not check_plans(module_database)
+
+
+def test_postgres_query_plans():
+    url = os.environ.get('QUERY_PLAN_POSTGRES_URL')
+    if not url:
+        pytest.skip('QUERY_PLAN_POSTGRES_URL not set')
+    engine = create_engine(url)
+    try:
+        assert not check_plans(engine)
+    finally:
+        db.metadata.drop_all(engine)
+
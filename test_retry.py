@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Check which download errors are retried and which fail the job at once.
+
+    python -m pytest test_retry.py
+"""
+import io
+import socket
+import yt_dlp
+from yt_dlp.networking import Response
+from yt_dlp.networking.exceptions import HTTPError, TransportError
+from retry import classify, RetryPolicy, CircuitBreaker
+
+
+def http_error(status):
+    """A yt-dlp HTTPError as the fetch raises it, wrapped in a DownloadError"""
+    response = Response(io.BytesIO(b''), 'https://example.com/video', {}, status=status)
+    error = HTTPError(response)
+    return yt_dlp.utils.DownloadError(f'ERROR: {error}', exc_info=(HTTPError, error, None))
+
+
+def test_throttling_and_server_errors_are_transient():
+    for status in (429, 500, 502, 503, 504):
+        assert classify(http_error(status)) == 'transient', status
+
+
+def test_missing_and_forbidden_media_is_permanent():
+    for status in (400, 403, 404, 410):
+        assert classify(http_error(status)) == 'permanent', status
+
+
+def test_network_errors_are_transient():
+    for error in (TransportError('connection reset'), socket.timeout(), ConnectionResetError()):
+        assert classify(error) == 'transient', error
+
+
+def test_messages_without_a_cause_are_classified_by_text():
+    assert classify(yt_dlp.utils.DownloadError('ERROR: HTTP Error 429: Too Many Requests')) == 'transient'
+    assert classify(yt_dlp.utils.DownloadError('ERROR: HTTP Error 404: Not Found')) == 'permanent'
+    assert classify(yt_dlp.utils.DownloadError('ERROR: [youtube] abc: Private video')) == 'permanent'
+    assert classify(yt_dlp.utils.DownloadError('ERROR: Unable to download webpage: timed out')) == 'transient'
+    # Bugs in our own code are not worth retrying
+    assert classify(KeyError('title')) == 'permanent'
+
+
+def test_backoff_grows_within_its_bounds():
+    policy = RetryPolicy(max_attempts=3, base_seconds=30, max_seconds=100)
+    for attempt, ceiling in ((1, 30), (2, 60), (3, 100), (10, 100)):
+        delay = policy.delay(attempt)
+        assert ceiling / 2 <= delay <= ceiling, (attempt, delay)
+    assert policy.has_budget(2) and not policy.has_budget(3)
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    breaker.record_failure('youtube')
+    assert breaker.blocked() == set()
+    breaker.record_failure('youtube')
+    assert breaker.blocked() == {'youtube'}
+    breaker.record_success('youtube')
+    assert breaker.blocked() == set()
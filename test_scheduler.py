@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Check the order the scheduler hands pending jobs out in.
+
+    python -m pytest test_scheduler.py
+"""
+from datetime import datetime, timedelta
+from app import app, db
+from models import Download
+from job_queue import JobQueue
+from scheduler import Scheduler
+
+
+def queue_jobs(*jobs):
+    """Empty the queue, then add (owner, estimated size) jobs in submission order"""
+    with app.app_context():
+        Download.query.delete()
+        start = datetime.utcnow() - timedelta(minutes=10)
+        rows = [
+            Download(url=f'https://example.com/{i}.mp4', status='pending', owner_key=owner,
+                     estimated_size=size, created_at=start + timedelta(seconds=i))
+            for i, (owner, size) in enumerate(jobs)
+        ]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [row.id for row in rows]
+
+
+def candidates(policy):
+    with app.app_context():
+        claimable = JobQueue()._claimable(datetime.utcnow())
+        return db.session.execute(Scheduler(policy).candidates(claimable, limit=10)).scalars().all()
+
+
+def test_fair_share_takes_turns_between_owners():
+    a1, a2, a3, b1, c1 = queue_jobs(('a', None), ('a', None), ('a', None), ('b', None), ('c', None))
+    assert candidates('fair') == [a1, b1, c1, a2, a3]
+
+
+def test_running_jobs_count_as_turns_taken():
+    a1, a2, b1 = queue_jobs(('a', None), ('a', None), ('b', None))
+    with app.app_context():
+        db.session.get(Download, a1).status = 'downloading'
+        db.session.get(Download, a1).lease_expires_at = datetime.utcnow() + timedelta(minutes=1)
+        db.session.commit()
+    assert candidates('fair') == [b1, a2]
+
+
+def test_priority_class_comes_before_turns():
+    a1, a2, b1 = queue_jobs(('a', None), ('a', None), ('b', None))
+    with app.app_context():
+        db.session.get(Download, a2).priority = 2
+        db.session.commit()
+    assert candidates('fair') == [a2, b1, a1]
+
+
+def test_sjf_serves_small_jobs_first_within_a_turn():
+    a_big, b_unknown, c_small, a_tiny = queue_jobs(('a', 900), ('b', None), ('c', 100), ('a', 10))
+    # Each owner's smallest job is its first turn; jobs of unknown size go last in theirs
+    assert candidates('sjf') == [a_tiny, c_small, b_unknown, a_big]
+    assert candidates('fair') == [a_big, b_unknown, c_small, a_tiny]
@@ -0,0 +1,203 @@
+import os
+import time
+import logging
+import subprocess
+import tempfile
+from datetime import datetime
+from app import db, app
+from models import Download
+from job_control import JobCancelled, JobPaused
+from downloader import format_file_size
+from audio_formats import audio_plan
+
+
+class Transcoder:
+    """CPU-bound stage of audio jobs: converts a fetched file to the requested output.
+
+    The fetch stage only downloads the source stream and leaves the row in
+    'processing' with its source_path; transcode workers pick it up from there.
+    Sources whose codec already fits the output are remuxed with a stream
+    copy; only the rest is re-encoded. FFmpeg runs as a child process, so
+    encodes use their own cores while the worker thread just reads FFmpeg's
+    -progress output and reports it.
+    """
+
+    def __init__(self, progress=None, control=None, timings=None, ffmpeg='ffmpeg', inflight=None):
+        self.progress = progress
+        self.control = control
+        self.timings = timings
+        self.ffmpeg = ffmpeg
+        self.inflight = inflight
+
+    def transcode(self, download_id):
+        """Convert the fetched file of a claimed 'processing' job and complete it"""
+        if self.control:
+            self.control.clear(download_id)
+        with app.app_context():
+            download = db.session.get(Download, download_id)
+            if not download:
+                return
+            source_path = download.source_path
+            duration = download.duration
+            audio_format = download.audio_format or 'mp3'
+            source_codec = download.source_codec
+
+        if not source_path or not os.path.exists(source_path):
+            self._fail(download_id, 'Arquivo baixado não encontrado para conversão.')
+            return
+
+        base, ext = os.path.splitext(source_path)
+        # The fetch stage already completed jobs whose file needed no conversion,
+        # so assume the source still carries a video stream to drop
+        plan = audio_plan(audio_format, source_codec, ext.lstrip('.'), True)
+        if plan['action'] == 'keep':
+            self._complete(download_id, source_path)
+            return
+
+        output_path = f"{base}.{plan['ext']}"
+        if output_path == source_path:
+            output_path = f"{base}.converted.{plan['ext']}"
+        temp_path = output_path + '.part'
+
+        started = time.monotonic()
+        try:
+            self._run_ffmpeg(download_id, source_path, temp_path, duration, plan['args'])
+            os.replace(temp_path, output_path)
+        except JobPaused:
+            # The job moved to another worker; it will convert the same source file
+            logging.info(f"Transcode stopped for ID: {download_id}")
+            self._remove(temp_path)
+            return
+        except JobCancelled:
+            logging.info(f"Transcode cancelled for ID: {download_id}")
+            self._remove(temp_path)
+            self._remove_source(download_id, source_path)
+            return
+        except Exception as e:
+            logging.error(f"Transcode failed for ID {download_id}: {str(e)}")
+            self._remove(temp_path)
+            self._remove_source(download_id, source_path)
+            self._fail(download_id, str(e))
+            return
+        finally:
+            if self.progress:
+                self.progress.finish(download_id)
+            if self.control:
+                self.control.clear(download_id)
+
+        # Remuxes and encodes are timed apart so the saving shows up in /api/queue
+        elapsed = time.monotonic() - started
+        stage = 'remux' if plan['action'] == 'copy' else 'transcode'
+        if self.timings:
+            self.timings.record(stage, elapsed)
+        logging.info(f"Download {download_id} {stage} took {elapsed:.2f}s")
+
+        self._remove_source(download_id, source_path)
+        self._complete(download_id, output_path)
+
+    def stream(self, download_id, chunks, output_path, plan, on_chunk=None):
+        """Convert a byte stream as it arrives; FFmpeg reads stdin, so no source file is written"""
+        temp_path = output_path + '.part'
+        command = [
+            self.ffmpeg, '-y', '-loglevel', 'error',
+            '-i', 'pipe:0',
+            '-vn', '-map', '0:a:0', *plan['args'],
+            temp_path,
+        ]
+        started = time.monotonic()
+        with tempfile.TemporaryFile() as errors:
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=errors)
+            try:
+                received = 0
+                for chunk in chunks:
+                    process.stdin.write(chunk)
+                    received += len(chunk)
+                    if on_chunk:
+                        on_chunk(received)
+                process.stdin.close()
+            except BrokenPipeError:
+                # FFmpeg gave up on the input; its exit code and stderr say why
+                pass
+            except BaseException:
+                process.kill()
+                process.wait()
+                self._remove(temp_path)
+                raise
+
+            if process.wait() != 0:
+                self._remove(temp_path)
+                errors.seek(0)
+                message = errors.read().decode(errors='replace').strip()[-500:]
+                raise RuntimeError(f'FFmpeg exited with code {process.returncode}: {message}')
+
+        os.replace(temp_path, output_path)
+        if self.timings:
+            self.timings.record('stream', time.monotonic() - started)
+
+    def _complete(self, download_id, output_path):
+        with app.app_context():
+            download = db.session.get(Download, download_id)
+            if download:
+                download.status = 'completed'
+                download.progress = 100
+                download.completed_at = datetime.utcnow()
+                download.filename = os.path.basename(output_path)
+                download.file_size = format_file_size(os.path.getsize(output_path))
+                download.source_path = None
+                download.sync_followers()
+                db.session.commit()
+
+    def _run_ffmpeg(self, download_id, source_path, output_path, duration, codec_args):
+        """Run FFmpeg, reporting progress and stopping it on cancel/pause requests"""
+        command = [
+            self.ffmpeg, '-y', '-nostdin', '-loglevel', 'error',
+            '-i', source_path,
+            '-vn', '-map', '0:a:0', *codec_args,
+            '-progress', 'pipe:1', '-nostats',
+            output_path,
+        ]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        try:
+            # -progress writes key=value lines, a block per update
+            for line in process.stdout:
+                if self.control:
+                    self.control.check(download_id)
+                key, _, value = line.strip().partition('=')
+                if key == 'out_time_us' and duration and value.isdigit() and self.progress:
+                    self.progress.report(download_id, min(int(int(value) / 1e6 / duration * 100), 99))
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+
+        errors = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f'FFmpeg exited with code {process.returncode}: {errors.strip()[-500:]}')
+
+    def _fail(self, download_id, message):
+        with app.app_context():
+            download = db.session.get(Download, download_id)
+            if download:
+                download.status = 'failed'
+                download.error_message = message
+                download.source_path = None
+                download.sync_followers()
+                db.session.commit()
+
+    def _remove_source(self, download_id, path):
+        """Remove a fetched source file unless another download still points at it"""
+        if self.inflight:
+            with app.app_context():
+                download = db.session.get(Download, download_id)
+                if download and self.inflight.file_in_use(download, path):
+                    logging.info(f"Keeping {path}: another download uses it")
+                    return
+        self._remove(path)
+
+    def _remove(self, path):
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+
+
+class ConcurrencyLimiter:
+    """Caps how many jobs may be in each stage (e.g. 'fetch', 'postprocess') at once"""
+
+    def __init__(self, limits):
+        self.limits = dict(limits)
+        self._semaphores = {name: threading.BoundedSemaphore(n) for name, n in self.limits.items()}
+        self._active = {name: 0 for name in self.limits}
+        self._waiting = {name: 0 for name in self.limits}
+        self._lock = threading.Lock()
+
+    def acquire(self, job_type):
+        with self._lock:
+            self._waiting[job_type] += 1
+        self._semaphores[job_type].acquire()
+        with self._lock:
+            self._waiting[job_type] -= 1
+            self._active[job_type] += 1
+
+    def release(self, job_type):
+        with self._lock:
+            self._active[job_type] -= 1
+        self._semaphores[job_type].release()
+
+    def job_slots(self):
+        return JobSlots(self)
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    'limit': limit,
+                    'active': self._active[name],
+                    'waiting': self._waiting[name],
+                }
+                for name, limit in self.limits.items()
+            }
+
+
+class JobSlots:
+    """Tracks the stage slot held by a single job so it can move between stages"""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.stage = None
+
+    def enter(self, job_type):
+        """Release the current stage slot (if any) and wait for a slot in job_type"""
+        if self.stage == job_type:
+            return
+        self.release()
+        self.limiter.acquire(job_type)
+        self.stage = job_type
+
+    def release(self):
+        if self.stage is not None:
+            self.limiter.release(self.stage)
+            self.stage = None
+
+
+class DownloadWorkerPool:
+    """Fixed number of worker threads draining the persistent job queue"""
+
+    def __init__(self, handler, workers, job_queue, limiter=None, poll_interval=2, control=None, control_interval=2,
+                 stage='fetch'):
+        self.handler = handler
+        self.stage = stage
+        self.workers = workers
+        self.job_queue = job_queue
+        self.limiter = limiter
+        self.poll_interval = poll_interval
+        self.control = control
+        self.control_interval = control_interval
+        self._wakeup = threading.Event()
+        self._active_jobs = set()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads and the lease heartbeat"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'{self.stage}-worker-{i}')
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+        thread = threading.Thread(target=self._heartbeat, name=f'{self.stage}-heartbeat')
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def notify(self):
+        """Wake idle workers after a job was queued"""
+        self._wakeup.set()
+
+    def _worker(self):
+        while True:
+            try:
+                download_id = self.job_queue.claim(self.stage)
+            except Exception as e:
+                logging.error(f"Claiming a job failed: {str(e)}")
+                download_id = None
+
+            if download_id is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            with self._lock:
+                self._active_jobs.add(download_id)
+            try:
+                self.handler(download_id)
+            except Exception as e:
+                logging.error(f"Worker job {download_id} crashed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._active_jobs.discard(download_id)
+
+    def _heartbeat(self):
+        """Renew leases and forward cancel/pause requests made through the database"""
+        lease_interval = self.job_queue.lease_seconds / 3
+        interval = min(lease_interval, self.control_interval) if self.control else lease_interval
+        last_renewal = time.monotonic()
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                download_ids = list(self._active_jobs)
+            
+            if time.monotonic() - last_renewal >= lease_interval:
+                last_renewal = time.monotonic()
+                try:
+                    self.job_queue.heartbeat(download_ids)
+                except Exception as e:
+                    logging.error(f"Lease heartbeat failed: {str(e)}")
+            
+            if self.control:
+                try:
+                    for download_id, action in self.job_queue.stop_requests(download_ids).items():
+                        self.control.request(download_id, action)
+                except Exception as e:
+                    logging.error(f"Polling job controls failed: {str(e)}")
+
+    def stats(self):
+        """Queue depth and worker utilization"""
+        with self._lock:
+            busy = len(self._active_jobs)
+        stats = {
+            'worker_id': self.job_queue.worker_id,
+            'workers': self.workers,
+            'busy': busy,
+            'utilization': busy / self.workers if self.workers else 0,
+            'queue_depth': self.job_queue.depth(self.stage),
+        }
+        if self.limiter:
+            stats['stages'] = self.limiter.stats()
+        return stats